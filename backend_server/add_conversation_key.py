@@ -0,0 +1,42 @@
+"""
+Add messages.conversation_key and its index to an existing database.
+
+create_all() only creates missing tables, so databases created before the
+paginated chat history need this once:
+
+    python add_conversation_key.py
+
+It is safe to run again. The index is built CONCURRENTLY so that chat keeps
+working while it runs on a large table.
+"""
+
+from sqlalchemy import text
+
+from database import engine
+
+STATEMENTS = [
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS conversation_key VARCHAR(64)",
+    # Same format as chat_history.conversation_key
+    """
+    UPDATE messages
+    SET conversation_key = LEAST(sender_id, receiver_id) || ':' || GREATEST(sender_id, receiver_id)
+    WHERE conversation_key IS NULL
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_conversation_timestamp_id
+    ON messages (conversation_key, timestamp, id)
+    """,
+]
+
+
+def main():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for statement in STATEMENTS:
+            print(f"Running: {' '.join(statement.split())}")
+            connection.execute(text(statement))
+    print("messages.conversation_key is ready")
+
+
+if __name__ == "__main__":
+    main()
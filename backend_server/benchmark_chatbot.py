@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Benchmark and regression suite for AdvancedFinancialChatbot.
+
+Measures cold start, per-handler latency percentiles, throughput at several
+concurrency levels and peak RSS over a fixed corpus that covers every
+handler. For each query it also records which handler answered and a hash
+of the answer, so comparing two runs shows behaviour changes next to
+latency changes.
+
+Runs offline: market data comes from a synthetic provider and conversation
+context stays in memory. Run setup_nltk.py once beforehand.
+
+    python benchmark_chatbot.py --output before.json
+    python benchmark_chatbot.py --output after.json --compare before.json
+
+--retrieval embedding runs it with embedding retrieval; comparing that run
+with a TF-IDF one shows the KB search latency and paraphrase recall of both.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from context_store import InMemoryContextStore
+from market_data import PERIOD_DAYS, MarketDataCache, MarketDataProvider
+from response_cache import ResponseCache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_VERSION = 1
+BENCHMARK_CLIENT_ID = 1
+
+# Financial profile used for the personalized queries ({"data", "summary"} as built by profile_cache.py)
+BENCHMARK_PROFILE = {
+    "data": {
+        "age": 34,
+        "monthly_salary": 6000,
+        "risk_tolerance": "moderate",
+        "assets": [{"type": "stock", "value": 40000}, {"type": "bond", "value": 10000},
+                   {"type": "fund", "value": 5000, "purpose": "education"}],
+        "insurance": [{"type": "health"}],
+        "accounts": [{"type": "ira"}],
+        "deductions": [{"type": "student loan interest"}],
+        "dependents": 1,
+        "oldest_child_age": 6,
+        "goals": [{"name": "House", "target_amount": 60000, "saved_amount": 15000, "years_remaining": 4}],
+        "down_payment_saved": 15000,
+    },
+    "summary": {
+        "total_income": 80000,
+        "total_expenses": 50000,
+        "total_assets": 60000,
+        "total_liabilities": 8000,
+        "net_worth": 52000,
+        "monthly_surplus": 2000,
+        "debt_to_income_ratio": 10,
+        "savings_rate": 18,
+    },
+}
+
+# (name, message, personalized); names are stable ids for comparing runs
+CORPUS = [
+    ("greeting", "hello there", False),
+    ("gratitude", "thanks a lot", False),
+    ("farewell", "bye for now", False),
+    ("term_list", "what financial terms do you know", False),
+    ("term", "explain compound interest", False),
+    ("market_price", "what is the price of AAPL?", False),
+    ("market_performance", "how is the performance of MSFT?", False),
+    ("future_value", "calculate the future value of $10,000 at 7% for 20 years", False),
+    ("present_value", "calculate the present value of 5000 at 4% for 10 years", False),
+    ("emi", "what is the emi on a loan of 250,000 at 6% for 30 years", False),
+    ("sip", "calculate sip of 500 per month at 12% for 10 years", False),
+    ("definition", "define diversification", False),
+    ("definition_sip", "what is sip", False),
+    ("comparison", "what's the difference between stocks and bonds?", False),
+    ("strategy", "recommend the best strategy for retirement", False),
+    ("knowledge_base", "benefits of mutual funds", False),
+    ("knowledge_base_short", "mutual fund", False),
+    ("general", "how to approach diversification strategy", False),
+    ("fuzzy", "insurance needs", False),
+    ("fallback", "zzzz qqqq", False),
+    ("personalized_net_worth", "what is my net worth", True),
+    ("personalized_savings", "how much should i save for an emergency fund", True),
+    ("personalized_income", "income tax slabs", True),
+    ("personalized_investment", "my investment portfolio", True),
+    ("personalized_insurance", "insurance needs", True),
+    ("personalized_tax", "tax planning", True),
+    ("personalized_goal", "my goal", True),
+    ("personalized_college", "college fund", True),
+    ("personalized_home", "buying a house", True),
+    ("personalized_summary", "give me an overview", True),
+]
+
+# (paraphrase, KB question it should retrieve), for comparing retrieval engines
+PARAPHRASES = [
+    ("can you explain how mutual funds work", "what is a mutual fund"),
+    ("tell me about systematic investment plans", "what is sip"),
+    ("is investing through a sip risky", "what are sip risks"),
+    ("what does net asset value mean", "what is nav"),
+    ("how much do fund expense ratios cost me", "what is expense ratio"),
+    ("how can i start putting money into mutual funds", "how to invest in mutual funds"),
+    ("which kinds of mutual funds exist", "types of mutual funds"),
+    ("should i buy mutual funds or individual stocks", "mutual fund vs stocks"),
+    ("why would i choose a mutual fund", "benefits of mutual funds"),
+    ("explain an individual retirement account", "what is ira"),
+    ("how does loan amortization work", "what is amortization"),
+    ("i need some help with my finances", "financial help"),
+    ("how do i make a monthly budget", "how to budget"),
+    ("any advice for budgeting my money", "budgeting tips"),
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class SyntheticMarketDataProvider(MarketDataProvider):
+    """Deterministic daily prices for any ticker, so market questions run offline."""
+
+    name = "synthetic"
+
+    def __init__(self, days: int = 400, end: str = "2024-12-31"):
+        self.days = days
+        self.end = end
+
+    def get_history(self, ticker: str, period: str) -> Optional[pd.DataFrame]:
+        rng = np.random.default_rng(zlib.crc32(ticker.upper().encode()))
+        index = pd.bdate_range(end=self.end, periods=self.days, name="Date")
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.015, self.days)))
+        history = pd.DataFrame({"Close": close, "Volume": rng.integers(1_000_000, 5_000_000, self.days)}, index=index)
+        if period == "1d":
+            return history.tail(1)
+        if period in PERIOD_DAYS:
+            return history[history.index > history.index[-1] - pd.Timedelta(days=PERIOD_DAYS[period])]
+        return history
+
+
+def peak_rss_kb() -> Optional[int]:
+    """Peak resident set size of this process so far."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def latency_stats(seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    stats = {"count": len(ms), "mean_ms": round(float(ms.mean()), 4), "max_ms": round(float(ms.max()), 4)}
+    for p in PERCENTILES:
+        stats[f"p{p}_ms"] = round(float(np.percentile(ms, p)), 4)
+    return stats
+
+
+def query_args(message: str, personalized: bool) -> tuple:
+    if personalized:
+        return message, BENCHMARK_CLIENT_ID, BENCHMARK_PROFILE
+    return message, None, None
+
+
+def cold_start(use_artifact: bool):
+    """Import the chatbot module and build a chatbot, timing both."""
+    started = time.perf_counter()
+    from simple_chatbot import AdvancedFinancialChatbot
+    imported = time.perf_counter()
+    chatbot = AdvancedFinancialChatbot(
+        use_artifact=use_artifact,
+        context_store=InMemoryContextStore(),
+        market_data=MarketDataCache(SyntheticMarketDataProvider()),
+        # Disabled so that repeated queries measure their handlers, not the cache
+        response_cache=ResponseCache(max_entries=0),
+    )
+    built = time.perf_counter()
+    return chatbot, {
+        "import_s": round(imported - started, 4),
+        "build_s": round(built - imported, 4),
+        "total_s": round(built - started, 4),
+        "artifact": getattr(chatbot, "artifact_path", None) is not None,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def check_answers(chatbot) -> List[Dict[str, Any]]:
+    """Handler and answer hash of every corpus query."""
+    queries = []
+    for name, message, personalized in CORPUS:
+        message, client_id, profile = query_args(message, personalized)
+        # Greetings and fallbacks pick a random template
+        random.seed(0)
+        response, source = chatbot._dispatch(chatbot._analyze(message), client_id, None, profile)
+        queries.append({
+            "name": name,
+            "message": message,
+            "personalized": personalized,
+            "handler": source,
+            "response_sha1": hashlib.sha1(str(response).encode()).hexdigest()[:12],
+        })
+    return queries
+
+
+def measure_latency(chatbot, queries: List[Dict[str, Any]], iterations: int, warmup: int) -> Dict[str, Any]:
+    """Per-query and per-handler latency of generate_response."""
+    by_handler: Dict[str, List[float]] = {}
+    for query in queries:
+        args = query_args(query["message"], query["personalized"])
+        for _ in range(warmup):
+            chatbot.generate_response(*args)
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            chatbot.generate_response(*args)
+            samples.append(time.perf_counter() - started)
+        query["latency"] = latency_stats(samples)
+        by_handler.setdefault(query["handler"], []).extend(samples)
+
+    # Answers served from the response cache, for the cacheable queries
+    from simple_chatbot import CACHEABLE_SOURCES
+    chatbot.response_cache = ResponseCache()
+    cached = []
+    for query in queries:
+        if query["personalized"] or query["handler"] not in CACHEABLE_SOURCES:
+            continue
+        args = query_args(query["message"], query["personalized"])
+        chatbot.generate_response(*args)
+        for _ in range(iterations):
+            started = time.perf_counter()
+            chatbot.generate_response(*args)
+            cached.append(time.perf_counter() - started)
+    hit_ratio = chatbot.response_cache.stats()["hit_ratio"]
+    chatbot.response_cache = ResponseCache(max_entries=0)
+    by_handler["response_cache"] = cached
+
+    handlers = {handler: latency_stats(samples) for handler, samples in sorted(by_handler.items())}
+    handlers["response_cache"]["hit_ratio"] = hit_ratio
+    return handlers
+
+
+def measure_retrieval(chatbot, iterations: int) -> Dict[str, Any]:
+    """Latency and paraphrase recall of the KB search alone (TF-IDF or embeddings)."""
+    kb_index = chatbot.kb_index
+    queries = [chatbot._kb_query(chatbot._analyze(paraphrase)) for paraphrase, _ in PARAPHRASES]
+    samples = []
+    for _ in range(iterations):
+        for query in queries:
+            started = time.perf_counter()
+            kb_index.search(query, k=1)
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        matches = kb_index.search_batch(queries, k=1)
+    batch_s = (time.perf_counter() - started) / (iterations * len(queries))
+
+    hits = sum(
+        1 for (_, expected), match in zip(PARAPHRASES, matches)
+        if match and match[0][0] == expected and match[0][2] > kb_index.match_threshold
+    )
+    return {
+        "engine": chatbot.retrieval,
+        "kb_size": len(kb_index),
+        "search": latency_stats(samples),
+        "batch_per_query_ms": round(batch_s * 1000, 4),
+        "paraphrase_hits": hits,
+        "paraphrases": len(PARAPHRASES),
+    }
+
+
+def measure_throughput(chatbot, levels: List[int], rounds: int) -> List[Dict[str, Any]]:
+    """Messages per second with several threads calling the chatbot at once."""
+    workload = [query_args(message, personalized) for _, message, personalized in CORPUS] * rounds
+    results = []
+    for concurrency in levels:
+        def timed(args):
+            started = time.perf_counter()
+            chatbot.generate_response(*args)
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            started = time.perf_counter()
+            samples = list(pool.map(timed, workload))
+            elapsed = time.perf_counter() - started
+        stats = latency_stats(samples)
+        results.append({
+            "concurrency": concurrency,
+            "messages": len(workload),
+            "seconds": round(elapsed, 4),
+            "messages_per_s": round(len(workload) / elapsed, 2),
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+        })
+    return results
+
+
+def run(args) -> Dict[str, Any]:
+    os.environ["CHATBOT_RETRIEVAL"] = args.retrieval
+    print("⏱️  Cold start...")
+    chatbot, startup = cold_start(not args.no_artifact)
+    print(f"✅ Imported in {startup['import_s']:.2f}s, built in {startup['build_s']:.2f}s "
+          f"({'artifact' if startup['artifact'] else 'from source'})")
+
+    queries = check_answers(chatbot)
+    print(f"⏱️  Latency: {len(queries)} queries x {args.iterations} iterations...")
+    handlers = measure_latency(chatbot, queries, args.iterations, args.warmup)
+
+    print(f"⏱️  KB retrieval ({chatbot.retrieval})...")
+    retrieval = measure_retrieval(chatbot, args.iterations)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    print(f"⏱️  Throughput at concurrency {levels}...")
+    throughput = measure_throughput(chatbot, levels, args.rounds)
+
+    return {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"iterations": args.iterations, "warmup": args.warmup, "rounds": args.rounds,
+                   "artifact": not args.no_artifact, "retrieval": chatbot.retrieval},
+        "cold_start": startup,
+        "handlers": handlers,
+        "queries": queries,
+        "retrieval": retrieval,
+        "throughput": throughput,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print("\nHandler latency (ms)")
+    print(f"{'handler':<20}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for handler, stats in results["handlers"].items():
+        print(f"{handler:<20}{stats['count']:>6}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+              f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+    retrieval = results["retrieval"]
+    print(f"\nKB retrieval ({retrieval['engine']}, {retrieval['kb_size']} questions)")
+    print(f"  search p50 {retrieval['search']['p50_ms']:.3f}ms, p95 {retrieval['search']['p95_ms']:.3f}ms, "
+          f"batched {retrieval['batch_per_query_ms']:.3f}ms/query")
+    print(f"  paraphrases answered from the KB: {retrieval['paraphrase_hits']}/{retrieval['paraphrases']}")
+    print("\nThroughput")
+    for level in results["throughput"]:
+        print(f"  {level['concurrency']:>3} threads: {level['messages_per_s']:>9.1f} msg/s "
+              f"(p50 {level['p50_ms']:.3f}ms, p95 {level['p95_ms']:.3f}ms)")
+    if results["peak_rss_kb"] is not None:
+        print(f"\nPeak RSS: {results['peak_rss_kb'] / 1024:.1f} MB")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], max_regression: float,
+            min_slowdown_ms: float = 0.5) -> List[str]:
+    """Differences that should fail a regression check: changed answers and slower handlers."""
+    problems = []
+    previous = {query["name"]: query for query in baseline.get("queries", [])}
+    for query in current["queries"]:
+        old = previous.get(query["name"])
+        if old is None:
+            continue
+        if old["handler"] != query["handler"]:
+            problems.append(f"{query['name']}: answered by {query['handler']}, was {old['handler']}")
+        elif old["response_sha1"] != query["response_sha1"]:
+            problems.append(f"{query['name']}: answer changed")
+
+    print(f"\nLatency vs baseline ({baseline.get('created_at')})")
+    for handler, stats in current["handlers"].items():
+        old = baseline.get("handlers", {}).get(handler)
+        if not old or not old["p95_ms"]:
+            continue
+        change = stats["p95_ms"] / old["p95_ms"] - 1
+        print(f"  {handler:<20} p95 {old['p95_ms']:>9.3f} -> {stats['p95_ms']:>9.3f} ms ({change:+.0%})")
+        # Sub-millisecond handlers jitter by more than max_regression between runs
+        if change > max_regression and stats["p95_ms"] - old["p95_ms"] > min_slowdown_ms:
+            problems.append(f"{handler}: p95 {change:+.0%} slower")
+
+    old, new = baseline.get("retrieval"), current.get("retrieval")
+    if old and new:
+        # Informational: comparing engines is expected to change answers and latency
+        print(f"  KB search ({old['engine']} -> {new['engine']}) p95 {old['search']['p95_ms']:>9.3f} -> "
+              f"{new['search']['p95_ms']:>9.3f} ms, paraphrase hits {old['paraphrase_hits']} -> {new['paraphrase_hits']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the financial chatbot offline")
+    parser.add_argument("--iterations", type=int, default=30, help="Timed runs per corpus query (default: 30)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed runs per query before timing (default: 3)")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Thread counts for the throughput test (default: 1,2,4,8)")
+    parser.add_argument("--rounds", type=int, default=5, help="Corpus repetitions per throughput level (default: 5)")
+    parser.add_argument("--no-artifact", action="store_true", help="Build the chatbot from source, not the prebuilt artifact")
+    parser.add_argument("--retrieval", choices=["tfidf", "embedding"], default=os.getenv("CHATBOT_RETRIEVAL", "tfidf"),
+                        help="KB retrieval engine to benchmark (default: CHATBOT_RETRIEVAL or tfidf)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to check against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed p95 slowdown per handler when comparing (default: 0.25)")
+    parser.add_argument("--min-slowdown-ms", type=float, default=0.5,
+                        help="Ignore p95 slowdowns smaller than this when comparing (default: 0.5)")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(json.load(f), results, args.max_regression, args.min_slowdown_ms)
+        if problems:
+            print("\n❌ Regressions:")
+            for problem in problems:
+                print(f"  - {problem}")
+            return False
+        print("\n✅ No regressions")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
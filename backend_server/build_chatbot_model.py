@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Build the prebuilt chatbot model artifact.
+Run this after setup_nltk.py, and again whenever the knowledge base,
+the financial terms or the spaCy model change.
+"""
+
+import argparse
+import sys
+import time
+
+from chatbot_artifact import DEFAULT_ARTIFACT_DIR, load_artifact, write_artifact
+
+
+def build(output_dir: str) -> bool:
+    """Fit the chatbot from source and write its artifact"""
+    from simple_chatbot import AdvancedFinancialChatbot
+
+    print("📦 Building chatbot from source...")
+    started = time.perf_counter()
+    try:
+        chatbot = AdvancedFinancialChatbot(use_artifact=False)
+    except Exception as e:
+        print(f"❌ Error building chatbot: {e}")
+        return False
+    print(f"✅ Built in {time.perf_counter() - started:.2f}s")
+
+    try:
+        path = write_artifact(output_dir, chatbot, chatbot.model_fingerprint())
+    except Exception as e:
+        print(f"❌ Error writing artifact: {e}")
+        return False
+    print(f"✅ Artifact written to {path}")
+    return True
+
+
+def verify(output_dir: str) -> bool:
+    """Load the artifact back the way a worker would"""
+    from simple_chatbot import AdvancedFinancialChatbot
+
+    print("🔍 Verifying artifact...")
+    started = time.perf_counter()
+    artifact = load_artifact(output_dir)
+    if artifact is None:
+        print("❌ Artifact could not be loaded")
+        return False
+    print(f"✅ Artifact opened in {(time.perf_counter() - started) * 1000:.1f}ms "
+          f"({artifact.manifest['kb_size']} KB entries, {artifact.manifest['vocabulary_size']} terms)")
+
+    chatbot = AdvancedFinancialChatbot(model_path=output_dir)
+    if chatbot.artifact_path != artifact.path:
+        print("❌ Chatbot did not use the artifact (fingerprint mismatch)")
+        return False
+    print("✅ Chatbot loads from the artifact")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prebuilt chatbot model artifact")
+    parser.add_argument("--output", default=DEFAULT_ARTIFACT_DIR,
+                        help=f"Artifact directory (default: {DEFAULT_ARTIFACT_DIR})")
+    parser.add_argument("--skip-verify", action="store_true", help="Do not load the artifact back after writing")
+    args = parser.parse_args()
+
+    print("🚀 Building chatbot model artifact...")
+    print("=" * 50)
+    if not build(args.output):
+        return False
+    if not args.skip_verify and not verify(args.output):
+        return False
+    print("🎉 Chatbot model artifact ready! Workers will load it on start-up.")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,46 @@
+"""
+Fill the conversations (inbox) table from the messages already stored.
+
+New messages keep the table up to date as they are saved; databases with
+chat history from before the inbox need this once:
+
+    python build_conversations.py
+
+Existing conversation rows are left alone, so it is safe to run again.
+Backfilled conversations start with no unread messages.
+"""
+
+from sqlalchemy import text
+
+from chat_history import PREVIEW_CHARS
+from database import engine
+from models import Conversation
+
+BACKFILL = f"""
+INSERT INTO conversations (user_id, counterpart_id, last_message_id, last_sender_id,
+                           last_message, last_timestamp, unread_count)
+SELECT DISTINCT ON (user_id, counterpart_id)
+       user_id, counterpart_id, id, sender_id, LEFT(message, {PREVIEW_CHARS}), timestamp, 0
+FROM (
+    SELECT sender_id AS user_id, receiver_id AS counterpart_id, id, sender_id, message, timestamp
+    FROM messages
+    UNION ALL
+    SELECT receiver_id, sender_id, id, sender_id, message, timestamp
+    FROM messages
+    WHERE receiver_id <> sender_id
+) AS participants
+WHERE user_id IS NOT NULL AND counterpart_id IS NOT NULL
+ORDER BY user_id, counterpart_id, timestamp DESC, id DESC
+ON CONFLICT (user_id, counterpart_id) DO NOTHING
+"""
+
+
+def main():
+    Conversation.__table__.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        inserted = connection.execute(text(BACKFILL)).rowcount
+    print(f"Added {inserted} conversations")
+
+
+if __name__ == "__main__":
+    main()
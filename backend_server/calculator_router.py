@@ -0,0 +1,117 @@
+"""
+FastAPI Router for the financial calculators (see financial_calculator.py)
+
+Every rate in a request is combined with every tenor, and all the scenarios
+are computed in one vectorized call. Rates are percentages (8.5 for 8.5%).
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+
+from financial_calculator import amortization_schedule, future_value, present_value, sip_schedule
+from financial_schemas import FutureValueRequest, LoanEMIRequest, PresentValueRequest, SIPRequest
+
+# Create router
+calculator_router = APIRouter()
+
+MAX_CALCULATOR_SCENARIOS = 100
+
+
+def _scenarios(rates: List[float], tenors: List[float]) -> Tuple[List[Tuple[float, float]], np.ndarray, np.ndarray]:
+    """Every (rate, tenor) pair, plus the rates as fractions and the tenors as arrays."""
+    if len(rates) * len(tenors) > MAX_CALCULATOR_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CALCULATOR_SCENARIOS} rate and tenor combinations per request")
+    pairs = [(rate, tenor) for rate in rates for tenor in tenors]
+    return pairs, np.array([rate for rate, _ in pairs]) / 100, np.array([tenor for _, tenor in pairs])
+
+
+def _money(values) -> Any:
+    return np.round(values, 2).tolist()
+
+
+@calculator_router.post("/calculator/future-value")
+def calculate_future_value(request: FutureValueRequest):
+    """
+    Future value of an amount for each rate and number of years
+    """
+    pairs, rates, years = _scenarios(request.annual_rates, request.years)
+    values = future_value(request.amount, rates, years, request.compounding_per_year)
+    return {
+        "amount": request.amount,
+        "scenarios": [
+            {"annual_rate": rate, "years": tenor, "future_value": value}
+            for (rate, tenor), value in zip(pairs, _money(values))
+        ],
+    }
+
+
+@calculator_router.post("/calculator/present-value")
+def calculate_present_value(request: PresentValueRequest):
+    """
+    Present value of a future amount for each discount rate and number of years
+    """
+    pairs, rates, years = _scenarios(request.annual_rates, request.years)
+    values = present_value(request.amount, rates, years, request.compounding_per_year)
+    return {
+        "amount": request.amount,
+        "scenarios": [
+            {"annual_rate": rate, "years": tenor, "present_value": value}
+            for (rate, tenor), value in zip(pairs, _money(values))
+        ],
+    }
+
+
+@calculator_router.post("/calculator/emi")
+def calculate_loan_emi(request: LoanEMIRequest):
+    """
+    Loan EMI, total interest and (optionally) the monthly amortization schedule
+    for each interest rate and tenure
+    """
+    pairs, rates, months = _scenarios(request.annual_rates, request.tenure_months)
+    schedule = amortization_schedule(request.principal, rates, months)
+    scenarios: List[Dict[str, Any]] = []
+    for i, (rate, tenure) in enumerate(pairs):
+        scenario = {
+            "annual_rate": rate,
+            "tenure_months": tenure,
+            "emi": _money(schedule["emi"][i]),
+            "total_interest": _money(schedule["total_interest"][i]),
+            "total_payment": _money(schedule["total_payment"][i]),
+        }
+        if request.include_schedule:
+            scenario["schedule"] = {
+                "month": list(range(1, tenure + 1)),
+                **{column: _money(schedule[column][i, :tenure]) for column in ("payment", "interest", "principal", "balance")},
+            }
+        scenarios.append(scenario)
+    return {"principal": request.principal, "scenarios": scenarios}
+
+
+@calculator_router.post("/calculator/sip")
+def calculate_sip(request: SIPRequest):
+    """
+    Maturity value of a monthly SIP and (optionally) its month-by-month growth
+    for each expected return and duration
+    """
+    pairs, rates, years = _scenarios(request.annual_rates, request.years)
+    schedule = sip_schedule(request.monthly_investment, rates, years)
+    scenarios: List[Dict[str, Any]] = []
+    for i, (rate, tenor) in enumerate(pairs):
+        scenario = {
+            "annual_rate": rate,
+            "years": tenor,
+            "final_value": _money(schedule["final_value"][i]),
+            "total_invested": _money(schedule["total_invested"][i]),
+            "returns": _money(schedule["returns"][i]),
+        }
+        if request.include_schedule:
+            months = int(schedule["months"][i])
+            scenario["schedule"] = {
+                "month": list(range(1, months + 1)),
+                "invested": _money(schedule["invested"][i, :months]),
+                "value": _money(schedule["value"][i, :months]),
+            }
+        scenarios.append(scenario)
+    return {"monthly_investment": request.monthly_investment, "scenarios": scenarios}
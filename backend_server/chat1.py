@@ -1,80 +1,247 @@
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+import asyncio
+
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database import SessionLocal, get_db
-from models import Message, User
+from models import Conversation, Message, User
 from fcm_utils import send_fcm_v1_notification
-from datetime import datetime, timezone
+from chat_persistence import MessageWriter
+from chat_broker import create_chat_broker
+from notification_outbox import NotificationOutbox
+from chat_history import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, conversation_key, keyset_page, sync_cursor
 
 chat_router = APIRouter()
-connected_users = {}
+# Users' sockets, and routing of messages to the worker a receiver is connected to (see chat_broker.py)
+chat_broker = create_chat_broker()
+
+# Messages are saved by a background writer, off the event loop (see chat_persistence.py)
+message_writer = MessageWriter()
+# Strong references to fire-and-forget tasks, which asyncio would otherwise let be garbage collected
+background_tasks = set()
+
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def acknowledge_message(websocket: WebSocket, client_msg_id, stored: asyncio.Future, delivered: bool,
+                              receiver_id: int, message: str):
+    """Tell the sender that their message was saved (or failed to be).
+
+    Senders without a client_msg_id only hear about failures, with the
+    receiver and text so that they can tell which message was lost.
+    """
+    ack = {"type": "ack", "client_msg_id": client_msg_id, "delivered": delivered}
+    try:
+        ack.update(status="stored", message_id=await stored)
+        if client_msg_id is None:
+            return
+    except Exception:
+        ack.update(status="failed", message_id=None)
+        if client_msg_id is None:
+            ack.update(receiver_id=receiver_id, message=message)
+    try:
+        await websocket.send_json(ack)
+    except Exception:
+        # The sender has disconnected
+        pass
+
+
+def notify_offline_receiver(receiver_id: int, sender_id: int, message: str, count: int = 1):
+    """Send an FCM notification for count messages to an offline receiver (blocking; see notification_outbox.py)."""
+    db = SessionLocal()
+    try:
+        receiver = db.query(User).filter(User.id == receiver_id).first()
+        sender = db.query(User).filter(User.id == sender_id).first()
+        if receiver and receiver.fcm_token:
+            sender_name = sender.full_name if sender else str(sender_id)
+            send_fcm_v1_notification(
+                receiver.fcm_token,
+                title=sender_name,  # sender's name as title
+                body=message if count == 1 else f"{count} new messages from {sender_name}",
+                data={
+                    "sender_id": sender_id,
+                    "sender_name": sender_name,
+                    "message": message,
+                    "message_count": count
+                }
+            )
+    finally:
+        db.close()
+
+
+# Pushes to offline receivers are sent in the background, off the sender's socket
+notification_outbox = NotificationOutbox(notify_offline_receiver)
+
+
+def notify_undelivered(receiver_id: int, payload: dict):
+    """Push a message that reached the receiver's worker but not their socket (see chat_broker.py)."""
+    notification_outbox.notify(receiver_id, payload["sender_id"], payload["message"])
+
+
+# With Redis the sender is told "delivered" once another worker takes the message; that worker pushes it if its send fails
+chat_broker.on_undelivered = notify_undelivered
+
 
 # WebSocket for live chat
 @chat_router.websocket("/ws/chat/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
     await websocket.accept()
-    connected_users[user_id] = websocket
+    await chat_broker.connect(user_id, websocket)
 
     try:
         while True:
             data = await websocket.receive_json()
             receiver_id = data["receiver_id"]
             message = data["message"]
+            # Optional id chosen by the client, echoed back in the acknowledgement
+            client_msg_id = data.get("client_msg_id")
 
-            # Save to database
-            db = SessionLocal()
-            new_message = Message(
-                sender_id=user_id,
-                receiver_id=receiver_id,
-                message=message,
-                timestamp=datetime.now(timezone.utc)
-            )
-            db.add(new_message)
-            db.commit()
-
-            # Forward message if receiver is online
-            if receiver_id in connected_users:
-                try:
-                    await connected_users[receiver_id].send_json({
-                        "sender_id": user_id,
-                        "message": message
-                    })
-                except Exception:
-                    # Remove user if their websocket is closed or errored
-                    connected_users.pop(receiver_id, None)
-            else:
+            # Queue for saving; waits only when the writer is backed up
+            stored = await message_writer.submit({
+                "sender_id": user_id,
+                "receiver_id": receiver_id,
+                "message": message,
+                "conversation_key": conversation_key(user_id, receiver_id)
+            })
+
+            # Forward message if receiver is online, on this worker or another one
+            delivered = await chat_broker.publish(receiver_id, {
+                "sender_id": user_id,
+                "message": message
+            }) > 0
+            if not delivered:
                 # Send FCM notification if receiver is offline
-                receiver = db.query(User).filter(User.id == receiver_id).first()
-                sender = db.query(User).filter(User.id == user_id).first()
-                if receiver and receiver.fcm_token:
-                    send_fcm_v1_notification(
-                        receiver.fcm_token,
-                        title=sender.full_name if sender else str(user_id),  # sender's name as title
-                        body=message,
-                        data={
-                            "sender_id": user_id,
-                            "sender_name": sender.full_name if sender else str(user_id),
-                            "message": message
-                        }
-                    )
-            db.close()
+                notification_outbox.notify(receiver_id, user_id, message)
+
+            # Already forwarded, so a message that then fails to be stored must at least be reported
+            run_in_background(acknowledge_message(websocket, client_msg_id, stored, delivered, receiver_id, message))
 
     except WebSocketDisconnect:
-        connected_users.pop(user_id, None)
+        pass
+    finally:
+        # Also on errors, so that a dead socket does not stay subscribed
+        await chat_broker.disconnect(user_id, websocket)
+
+
+@chat_router.get("/chat/presence/{user_id}")
+async def get_presence(user_id: int):
+    """
+    Whether the user has a live chat connection on any worker
+    """
+    return {"user_id": user_id, "online": await chat_broker.is_online(user_id)}
+
 
 # HTTP GET for chat history
 @chat_router.get("/chat-history/{user1_id}/{user2_id}")
-def get_chat_history(user1_id: int, user2_id: int, db: Session = Depends(get_db)):
-    messages = db.query(Message).filter(
-        ((Message.sender_id == user1_id) & (Message.receiver_id == user2_id)) |
-        ((Message.sender_id == user2_id) & (Message.receiver_id == user1_id))
-    ).order_by(Message.timestamp).all()
+def get_chat_history(
+    user1_id: int,
+    user2_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    A conversation, oldest message first.
+
+    Without limit or a cursor, returns the whole conversation, as clients that
+    do not page yet expect. With `limit`, returns the latest `limit` messages.
+    `before` pages back through older messages (pass the X-Next-Cursor header
+    of the previous page); `after` returns messages newer than a cursor, for
+    incremental sync (pass the X-Sync-Cursor header of the last response).
+    A sync may repeat the last few seconds of messages (see chat_history.py);
+    drop the ids already received.
+    """
+    query = db.query(Message).filter(Message.conversation_key == conversation_key(user1_id, user2_id))
+    try:
+        if limit is None and not before and not after:
+            messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).all()
+            next_cursor = None
+        else:
+            messages, next_cursor = keyset_page(query, Message.timestamp, Message.id, limit or DEFAULT_PAGE_SIZE,
+                                                before, after)
+        # Older pages do not move the sync position
+        if not before:
+            newest = messages[-1 if after else 0] if messages else None
+            # Messages are stamped with the database's clock, so the grace window is measured with it too
+            response.headers["X-Sync-Cursor"] = sync_cursor(
+                (newest.timestamp, newest.id) if newest else None, db.query(func.now()).scalar(), after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not after:
+        messages.reverse()
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
     return [
         {
+            "id": msg.id,
             "sender_id": msg.sender_id,
             "receiver_id": msg.receiver_id,
             "message": msg.message,
             "timestamp": msg.timestamp.isoformat()
         } for msg in messages
     ]
+
+
+# HTTP GET for a user's conversations
+@chat_router.get("/chat/inbox/{user_id}")
+def get_inbox(
+    user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    The user's conversations, most recent first, with each counterpart's name,
+    the last message and the number of unread messages.
+
+    Pass the X-Next-Cursor header as `before` for the next page.
+    """
+    query = db.query(Conversation, User.full_name).outerjoin(
+        User, User.id == Conversation.counterpart_id
+    ).filter(Conversation.user_id == user_id)
+    try:
+        # (user_id, last_timestamp, id) is indexed, so this is one index range scan
+        rows, next_cursor = keyset_page(query, Conversation.last_timestamp, Conversation.id, limit, before=before,
+                                        position=lambda row: (row[0].last_timestamp, row[0].id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return [
+        {
+            "counterpart_id": conversation.counterpart_id,
+            "counterpart_name": counterpart_name,
+            "last_message_id": conversation.last_message_id,
+            "last_sender_id": conversation.last_sender_id,
+            "last_message": conversation.last_message,
+            "last_timestamp": conversation.last_timestamp.isoformat() if conversation.last_timestamp else None,
+            "unread_count": conversation.unread_count
+        } for conversation, counterpart_name in rows
+    ]
+
+
+# Mark a conversation as read
+@chat_router.post("/chat/inbox/{user_id}/{counterpart_id}/read")
+def mark_conversation_read(user_id: int, counterpart_id: int, db: Session = Depends(get_db)):
+    """
+    Reset the unread count of the user's conversation with counterpart_id
+    """
+    db.query(Conversation).filter(
+        Conversation.user_id == user_id,
+        Conversation.counterpart_id == counterpart_id
+    ).update({Conversation.unread_count: 0}, synchronize_session=False)
+    db.commit()
+    return {"user_id": user_id, "counterpart_id": counterpart_id, "unread_count": 0}
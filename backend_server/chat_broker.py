@@ -0,0 +1,174 @@
+"""
+Presence and message routing for the /ws/chat WebSocket across workers.
+
+Each worker only holds the sockets of the users connected to it. With several
+uvicorn workers or hosts, a message to a user connected elsewhere used to be
+treated as "offline" and sent through FCM instead. A ChatBroker routes it to
+whichever worker holds the receiver's socket.
+
+Backends (CHAT_BROKER):
+- memory: one process, the default; the same interface, so a single worker
+  (and the tests) need no Redis
+- redis: every worker subscribes to the channel of each user connected to it
+  ("chat:user:<id>") and a message is published on the receiver's channel.
+  PUBLISH returns the number of workers subscribed, so a result of 0 means
+  the receiver is offline everywhere and needs a push notification
+
+publish() returns the number of workers the message was handed to (0 or 1
+in memory). With Redis, that worker sends it to the socket afterwards: if
+that send fails (the socket died in the meantime), the sender has already
+been told the message was delivered, so the receiving worker passes the
+message to on_undelivered instead, which chat1.py points at the push
+notification outbox.
+
+Sends to local sockets are bounded by SEND_TIMEOUT_SECONDS, and messages
+arriving from Redis are delivered concurrently, so one slow socket does not
+hold up the other users on the worker.
+"""
+
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Set
+
+SEND_TIMEOUT_SECONDS = 5
+
+
+class ChatBroker(ABC):
+    def __init__(self, on_undelivered: Optional[Callable[[int, Dict[str, Any]], None]] = None):
+        # This worker's sockets, by user id; a reconnect replaces the previous socket
+        self.local: Dict[int, Any] = {}
+        # Called with (user_id, payload) when a message routed here could not be sent to its socket
+        self.on_undelivered = on_undelivered
+
+    async def connect(self, user_id: int, websocket) -> None:
+        self.local[user_id] = websocket
+
+    async def disconnect(self, user_id: int, websocket) -> None:
+        # A newer socket of the same user may have replaced this one
+        if self.local.get(user_id) is websocket:
+            del self.local[user_id]
+
+    @abstractmethod
+    async def publish(self, user_id: int, payload: Dict[str, Any]) -> int:
+        """Route payload to the user's socket; returns the number of workers it was handed to."""
+
+    @abstractmethod
+    async def is_online(self, user_id: int) -> bool:
+        """Whether the user has a socket on any worker."""
+
+    async def close(self) -> None:
+        pass
+
+    async def deliver_local(self, user_id: int, payload: Dict[str, Any]) -> bool:
+        """Send payload to the user's socket on this worker, if any."""
+        websocket = self.local.get(user_id)
+        if websocket is None:
+            return False
+        try:
+            await asyncio.wait_for(websocket.send_json(payload), SEND_TIMEOUT_SECONDS)
+            return True
+        except Exception:
+            # Remove user if their websocket is closed or errored
+            await self.disconnect(user_id, websocket)
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"local_users": len(self.local)}
+
+
+class InMemoryChatBroker(ChatBroker):
+    async def publish(self, user_id: int, payload: Dict[str, Any]) -> int:
+        return int(await self.deliver_local(user_id, payload))
+
+    async def is_online(self, user_id: int) -> bool:
+        return user_id in self.local
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **super().stats()}
+
+
+class RedisChatBroker(ChatBroker):
+    """Routes messages through Redis pub/sub, shared by every worker and host."""
+
+    def __init__(self, url: str, prefix: str = "chat", client=None,
+                 on_undelivered: Optional[Callable[[int, Dict[str, Any]], None]] = None):
+        super().__init__(on_undelivered)
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._listener: Optional[asyncio.Task] = None
+        # Strong references to deliveries in progress
+        self._deliveries: Set[asyncio.Task] = set()
+
+    def _channel(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    async def connect(self, user_id: int, websocket) -> None:
+        subscribed = user_id in self.local
+        await super().connect(user_id, websocket)
+        if not subscribed:
+            await self.pubsub.subscribe(self._channel(user_id))
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def disconnect(self, user_id: int, websocket) -> None:
+        if self.local.get(user_id) is websocket:
+            del self.local[user_id]
+            await self.pubsub.unsubscribe(self._channel(user_id))
+
+    async def publish(self, user_id: int, payload: Dict[str, Any]) -> int:
+        return await self.client.publish(self._channel(user_id), json.dumps(payload, default=str))
+
+    async def is_online(self, user_id: int) -> bool:
+        channel = self._channel(user_id)
+        counts = dict(await self.client.pubsub_numsub(channel))
+        return counts.get(channel.encode(), counts.get(channel, 0)) > 0
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Chat broker lost its Redis subscription: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            channel = channel.decode() if isinstance(channel, bytes) else channel
+            user_id = int(channel.rsplit(":", 1)[1])
+            delivery = asyncio.create_task(self._deliver_routed(user_id, json.loads(message["data"])))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver_routed(self, user_id: int, payload: Dict[str, Any]) -> None:
+        # The publisher already counted this message as delivered, so a failure here is ours to handle
+        if not await self.deliver_local(user_id, payload) and self.on_undelivered is not None:
+            try:
+                self.on_undelivered(user_id, payload)
+            except Exception as e:
+                print(f"Could not hand undelivered chat message for user {user_id} on: {e}")
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", **super().stats()}
+
+
+def create_chat_broker(on_undelivered: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> ChatBroker:
+    """Build the broker selected by the CHAT_BROKER environment variable."""
+    if os.getenv("CHAT_BROKER", "memory").lower() == "redis":
+        return RedisChatBroker(os.getenv("CHAT_REDIS_URL", "redis://localhost:6379/0"), on_undelivered=on_undelivered)
+    return InMemoryChatBroker(on_undelivered)
@@ -0,0 +1,128 @@
+"""
+Keyset pagination of chat history.
+
+Messages of a conversation share a conversation key ("<smaller id>:<larger
+id>"), indexed together with (timestamp, id), so a page of history is one
+index range scan instead of an OR of sender/receiver pairs over the whole
+table (see add_conversation_key.py for existing databases).
+
+Pages are addressed by opaque cursors encoding a message's (timestamp, id):
+"before" walks back through older messages, "after" fetches messages newer
+than the client's last one for incremental sync.
+
+Messages are written behind (chat_persistence.py), by several workers, so a
+message can become visible after a newer one has already been synced. The
+sync cursor therefore trails the database clock by SYNC_GRACE_SECONDS:
+messages are stamped by the database inside their insert transaction, and
+anything newer than the grace window is sent again on the next sync (clients
+drop duplicates by id) instead of being skipped for good.
+
+The inbox reads a "conversations" table instead of the messages: one row per
+user and counterpart with the last message and the unread count, updated in
+the same transaction that stores each batch of messages (see
+chat_persistence.py), so listing a user's conversations costs one row per
+thread however long the threads are.
+"""
+
+import base64
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Upper bound on the time between a message's timestamp and its commit
+SYNC_GRACE_SECONDS = 5
+# Length of the last message kept in the inbox
+PREVIEW_CHARS = 200
+
+
+def conversation_key(user1_id: int, user2_id: int) -> str:
+    """The same key whichever user is the sender."""
+    low, high = sorted((int(user1_id), int(user2_id)))
+    return f"{low}:{high}"
+
+
+def encode_cursor(timestamp: datetime, message_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{message_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(timestamp, id) of a cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_page(query, timestamp_column, id_column, limit: int, before: Optional[str] = None,
+                after: Optional[str] = None, position: Callable[[Any], Tuple[datetime, int]] = None
+                ) -> Tuple[List[Any], Optional[str]]:
+    """One page of query by (timestamp, id), and the cursor of the next page if there is one.
+
+    Without after, rows come newest first and the next page is older; with
+    after, oldest first and the next page is newer. position gives a row's
+    (timestamp, id) (default: its timestamp and id attributes). Raises
+    ValueError for a malformed cursor or for both cursors at once.
+    """
+    if before and after:
+        raise ValueError("Use either before or after, not both")
+    key = tuple_(timestamp_column, id_column)
+    if after:
+        query = query.filter(key > decode_cursor(after)).order_by(timestamp_column, id_column)
+    else:
+        if before:
+            query = query.filter(key < decode_cursor(before))
+        query = query.order_by(timestamp_column.desc(), id_column.desc())
+    # One extra row tells whether there is another page
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    position = position or (lambda row: (row.timestamp, row.id))
+    return rows, encode_cursor(*position(rows[-1]))
+
+
+def sync_cursor(newest: Optional[Tuple[datetime, int]], database_now: datetime,
+                after: Optional[str] = None) -> str:
+    """Cursor for the next incremental sync, never past the grace window.
+
+    newest is the (timestamp, id) of the newest message returned, if any;
+    without one the sync resumes from after (or from the grace window).
+    """
+    settled = (database_now - timedelta(seconds=SYNC_GRACE_SECONDS), 0)
+    resume = newest or (decode_cursor(after) if after else settled)
+    return encode_cursor(*min(resume, settled))
+
+
+def conversation_updates(records: List[Dict[str, Any]], message_ids: List[int]) -> List[Dict[str, Any]]:
+    """Inbox rows ("conversations") to upsert for a batch of stored messages.
+
+    Each message updates the last message of both participants' rows and the
+    receiver's unread count; a batch yields one row per (user, counterpart),
+    sorted so that concurrent batches lock rows in the same order.
+    """
+    rows: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for record, message_id in zip(records, message_ids):
+        sender_id, receiver_id = record["sender_id"], record["receiver_id"]
+        for user_id, counterpart_id in {(sender_id, receiver_id), (receiver_id, sender_id)}:
+            row = rows.setdefault((user_id, counterpart_id), {
+                "user_id": user_id,
+                "counterpart_id": counterpart_id,
+                "unread_count": 0,
+                "last_timestamp": None,
+            })
+            if user_id != sender_id:
+                row["unread_count"] += 1
+            if row["last_timestamp"] is None or (record["timestamp"], message_id) > (row["last_timestamp"], row["last_message_id"]):
+                row.update(
+                    last_message_id=message_id,
+                    last_sender_id=sender_id,
+                    last_message=(record["message"] or "")[:PREVIEW_CHARS],
+                    last_timestamp=record["timestamp"],
+                )
+    return [rows[key] for key in sorted(rows)]
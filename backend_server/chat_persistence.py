@@ -0,0 +1,152 @@
+"""
+Write-behind persistence of chat messages for the /ws/chat WebSocket.
+
+Saving a message used to open a session and commit inside the WebSocket's
+async loop, which blocked the event loop, and with it every other socket and
+request on the worker, for a database round trip per message. MessageWriter
+queues the message and returns at once; a background task drains the queue
+and inserts whatever has accumulated in one transaction, in a worker thread.
+
+- The queue is bounded: when the database falls behind, senders wait for
+  room (backpressure on their own socket) instead of memory growing
+- submit() returns a future resolved with the stored message's id, which the
+  WebSocket turns into an acknowledgement for the sender
+- A batch that fails is retried one message at a time, so one bad message
+  does not lose the others
+- Each batch also updates the senders' and receivers' inbox rows (see
+  chat_history.py) in the same transaction
+- close() flushes the queue on shutdown
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def insert_messages(records: List[Dict[str, Any]]) -> List[int]:
+    """Insert Message rows and update the inbox in one transaction; return the messages' ids."""
+    from sqlalchemy import case, func
+    from sqlalchemy.dialects.postgresql import insert
+
+    from chat_history import conversation_updates
+    from database import SessionLocal
+    from models import Conversation, Message
+
+    db = SessionLocal()
+    try:
+        # Stamped by the database inside this transaction, so that a message committed late
+        # is at most a transaction's length older than what is already visible (see chat_history.py)
+        now = db.query(func.now()).scalar()
+        records = [{**record, "timestamp": now} for record in records]
+        messages = [Message(**record) for record in records]
+        db.add_all(messages)
+        # Ids are read after the flush: after the commit they would be reloaded row by row
+        db.flush()
+        ids = [message.id for message in messages]
+
+        # One upsert for the batch; the last message only moves forward, the unread count adds up
+        statement = insert(Conversation).values(conversation_updates(records, ids))
+        newer = statement.excluded.last_timestamp >= Conversation.last_timestamp
+        latest = {
+            column: case((Conversation.last_timestamp.is_(None) | newer, getattr(statement.excluded, column)),
+                         else_=getattr(Conversation, column))
+            for column in ("last_message_id", "last_sender_id", "last_message", "last_timestamp")
+        }
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["user_id", "counterpart_id"],
+            set_={"unread_count": Conversation.unread_count + statement.excluded.unread_count, **latest},
+        ))
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+class MessageWriter:
+    def __init__(self, insert: Callable[[List[Dict[str, Any]]], List[int]] = insert_messages,
+                 max_queue: int = 10000, max_batch: int = 200):
+        self.insert = insert
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. a test client); the old queue belongs to the old loop
+            self._loop = loop
+            self._queue = asyncio.Queue(self.max_queue)
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._drain())
+
+    async def submit(self, record: Dict[str, Any]) -> asyncio.Future:
+        """Queue a message for saving; the returned future resolves to its id once stored."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((record, future))
+        return future
+
+    async def _drain(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        self.batches += 1
+        try:
+            ids = await asyncio.to_thread(self.insert, [record for record, _ in batch])
+            outcomes = [(future, message_id, None) for (_, future), message_id in zip(batch, ids)]
+        except Exception as e:
+            print(f"Error saving {len(batch)} chat messages, retrying one at a time: {e}")
+            outcomes = []
+            for record, future in batch:
+                try:
+                    (message_id,) = await asyncio.to_thread(self.insert, [record])
+                    outcomes.append((future, message_id, None))
+                except Exception as row_error:
+                    print(f"Error saving chat message from {record.get('sender_id')}: {row_error}")
+                    outcomes.append((future, None, row_error))
+
+        for future, message_id, error in outcomes:
+            if error is None:
+                self.written += 1
+            else:
+                self.failed += 1
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(message_id)
+            else:
+                future.set_exception(error)
+                # Already printed; marked as retrieved so asyncio does not log it again if no one awaits it
+                future.exception()
+
+    async def flush(self) -> None:
+        """Wait until every queued message has been written (or has failed)."""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
@@ -0,0 +1,177 @@
+"""
+Prebuilt, memory-mappable chatbot model artifact.
+
+build_chatbot_model.py writes the fitted TF-IDF vocabulary, the KB matrices,
+the PhraseMatcher patterns and the stopword set into a versioned directory:
+
+    chatbot_model/
+        CURRENT                 -> name of the active version directory
+        v1-<fingerprint>/
+            manifest.json
+            vocabulary.json, questions.json, answers.json, ...
+            idf.npy, matrix_*.npy, postings_*.npy
+
+The .npy arrays are opened with mmap_mode="r", so loading takes milliseconds
+and the pages are shared through the OS page cache by every worker on the host.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ARTIFACT_FORMAT_VERSION = 1
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot_model")
+
+_SPARSE_PARTS = ("data", "indices", "indptr")
+
+
+def kb_fingerprint(knowledge_base: Dict[str, Any], financial_terms: Dict[str, str], spacy_version: Optional[str]) -> str:
+    """Hash of everything the artifact is derived from; a mismatch means it is stale."""
+    payload = json.dumps(
+        {
+            "format": ARTIFACT_FORMAT_VERSION,
+            "kb": knowledge_base,
+            "terms": financial_terms,
+            "spacy_model": spacy_version,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChatbotArtifact:
+    def __init__(self, path: str, manifest: Dict[str, Any], kb_export: Dict[str, Any],
+                 financial_terms: Dict[str, str], stop_words: List[str], matcher_patterns: List[List[str]]):
+        self.path = path
+        self.manifest = manifest
+        self.kb_export = kb_export
+        self.financial_terms = financial_terms
+        self.stop_words = stop_words
+        self.matcher_patterns = matcher_patterns
+
+    @property
+    def fingerprint(self) -> str:
+        return self.manifest["fingerprint"]
+
+
+def _write_json(directory: str, name: str, value: Any) -> None:
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+
+
+def _read_json(directory: str, name: str) -> Any:
+    with open(os.path.join(directory, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_sparse(directory: str, name: str, matrix) -> None:
+    for part in _SPARSE_PARTS:
+        np.save(os.path.join(directory, f"{name}_{part}.npy"), getattr(matrix, part))
+
+
+def _load_sparse(directory: str, name: str, shape):
+    from scipy.sparse import csr_matrix
+    parts = [np.load(os.path.join(directory, f"{name}_{part}.npy"), mmap_mode="r") for part in _SPARSE_PARTS]
+    return csr_matrix(tuple(parts), shape=tuple(shape), copy=False)
+
+
+def write_artifact(root: str, chatbot, fingerprint: str) -> str:
+    """Write the chatbot's prebuilt state under root and make it the CURRENT version."""
+    kb_export = chatbot.kb_index.export()
+    if any(callable(answer) for answer in kb_export["answers"]):
+        raise ValueError("Knowledge base answers must be plain strings to be stored in an artifact")
+
+    os.makedirs(root, exist_ok=True)
+    version_name = f"v{ARTIFACT_FORMAT_VERSION}-{fingerprint[:12]}"
+    staging = tempfile.mkdtemp(prefix=".building-", dir=root)
+    try:
+        matrix, postings = kb_export["matrix"], kb_export["postings"]
+        manifest = {
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "fingerprint": fingerprint,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "spacy_model": chatbot.nlp.meta.get("name") if chatbot.nlp else None,
+            "spacy_model_version": chatbot.nlp.meta.get("version") if chatbot.nlp else None,
+            "kb_size": len(kb_export["questions"]),
+            "vocabulary_size": len(kb_export["vocabulary"]),
+            "matrix_shape": list(matrix.shape) if matrix is not None else None,
+        }
+
+        _write_json(staging, "questions.json", kb_export["questions"])
+        _write_json(staging, "answers.json", kb_export["answers"])
+        _write_json(staging, "vocabulary.json", kb_export["vocabulary"])
+        _write_json(staging, "financial_terms.json", chatbot.financial_terms)
+        _write_json(staging, "stop_words.json", sorted(chatbot.stop_words))
+        _write_json(staging, "matcher_patterns.json", chatbot.matcher_patterns())
+        np.save(os.path.join(staging, "idf.npy"), np.asarray(kb_export["idf"], dtype=np.float64))
+        if matrix is not None:
+            _save_sparse(staging, "matrix", matrix)
+            _save_sparse(staging, "postings", postings)
+        # The manifest goes last: a directory without one is an incomplete build
+        _write_json(staging, "manifest.json", manifest)
+
+        target = os.path.join(root, version_name)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Switch the CURRENT pointer atomically so running workers never read a half-written file
+    pointer_tmp = os.path.join(root, ".CURRENT.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version_name)
+    os.replace(pointer_tmp, os.path.join(root, "CURRENT"))
+    return target
+
+
+def load_artifact(root: str = DEFAULT_ARTIFACT_DIR, fingerprint: Optional[str] = None) -> Optional[ChatbotArtifact]:
+    """Open the CURRENT artifact under root, or return None if there is none.
+
+    With a fingerprint (see kb_fingerprint), an artifact built from other
+    inputs is stale and None is returned as well.
+    """
+    try:
+        with open(os.path.join(root, "CURRENT"), encoding="utf-8") as f:
+            directory = os.path.join(root, f.read().strip())
+        manifest = _read_json(directory, "manifest.json")
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        print(f"Ignoring chatbot artifact {directory}: unsupported format {manifest.get('format_version')}")
+        return None
+    if fingerprint is not None and manifest.get("fingerprint") != fingerprint:
+        print(f"Chatbot artifact {directory} is stale, rebuilding from source")
+        return None
+
+    matrix = postings = None
+    if manifest.get("matrix_shape"):
+        rows, cols = manifest["matrix_shape"]
+        matrix = _load_sparse(directory, "matrix", (rows, cols))
+        postings = _load_sparse(directory, "postings", (cols, rows))
+
+    kb_export = {
+        "questions": _read_json(directory, "questions.json"),
+        "answers": _read_json(directory, "answers.json"),
+        "vocabulary": _read_json(directory, "vocabulary.json"),
+        "idf": np.load(os.path.join(directory, "idf.npy"), mmap_mode="r"),
+        "matrix": matrix,
+        "postings": postings,
+    }
+    return ChatbotArtifact(
+        directory,
+        manifest,
+        kb_export,
+        _read_json(directory, "financial_terms.json"),
+        _read_json(directory, "stop_words.json"),
+        _read_json(directory, "matcher_patterns.json"),
+    )
@@ -0,0 +1,45 @@
+"""
+Prometheus metrics for the chatbot.
+
+prometheus_client is optional: without it every metric is a no-op and
+/metrics returns 404, so the chatbot runs unchanged.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+except ImportError:
+    Counter = Histogram = None
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, amount: float) -> None:
+        pass
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    if Counter is None:
+        return _NoopMetric()
+    return Counter(name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Optional[Sequence[float]] = None):
+    if Histogram is None:
+        return _NoopMetric()
+    if buckets is None:
+        return Histogram(name, documentation, labelnames)
+    return Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+def render_latest() -> Optional[Tuple[bytes, str]]:
+    """Current metrics in the Prometheus text format, or None without prometheus_client."""
+    if Counter is None:
+        return None
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,88 @@
+"""
+Shared NLP helpers for the financial chatbot.
+
+Every message is parsed exactly once into an AnalyzedMessage, which the
+chatbot handlers then read instead of calling spaCy/NLTK again.
+"""
+
+import re
+from typing import Iterable, List, Optional, Set, Tuple
+
+from chatbot_profiling import stage
+
+SPACY_MODEL = "en_core_web_sm"
+
+# The chatbot reads token text, lemmas and named entities only. The dependency
+# parser is the most expensive component of en_core_web_sm and nothing uses it.
+UNUSED_PIPES = ["parser"]
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def load_pipeline(spacy_module, model: str = SPACY_MODEL):
+    """Load the spaCy model without the components the chatbot never reads."""
+    return spacy_module.load(model, exclude=UNUSED_PIPES)
+
+
+def doc_tokens(doc, stop_words: Set[str]) -> List[str]:
+    """Lowercased, punctuation-free, stopword-filtered lemmas of a parsed doc."""
+    tokens = []
+    for token in doc:
+        if token.is_punct or token.is_space:
+            continue
+        text = _PUNCT_RE.sub("", token.lower_)
+        if not text or text in stop_words:
+            continue
+        lemma = _PUNCT_RE.sub("", token.lemma_.lower()) if token.lemma_ else ""
+        tokens.append(lemma or text)
+    return tokens
+
+
+class AnalyzedMessage:
+    """A chatbot message parsed once and shared by every handler."""
+
+    def __init__(self, text: str, doc=None, matches: Optional[List[Tuple[int, int, int]]] = None,
+                 tokens: Optional[List[str]] = None):
+        self.text = text
+        self.lower = text.lower().strip()
+        self.doc = doc
+        self.matches = matches or []
+        self.tokens = tokens or []
+        # (intent, groups) from the chatbot's IntentRouter, filled in after parsing
+        self.intent: Optional[Tuple[str, Tuple[str, ...]]] = None
+
+    @property
+    def matched_terms(self) -> List[str]:
+        """Text of every PhraseMatcher hit, in document order."""
+        if self.doc is None:
+            return []
+        return [self.doc[start:end].text for _, start, end in self.matches]
+
+    @property
+    def lemmas(self) -> List[str]:
+        if self.doc is None:
+            return list(self.tokens)
+        return [token.lemma_ or token.lower_ for token in self.doc]
+
+
+def analyze_message(text: str, nlp, matcher, stop_words: Set[str]) -> AnalyzedMessage:
+    """Parse a single message with the trimmed pipeline."""
+    with stage("spacy"):
+        doc = nlp(text.lower().strip())
+    return _analyzed(text, doc, matcher, stop_words)
+
+
+def analyze_messages(texts: Iterable[str], nlp, matcher, stop_words: Set[str], batch_size: int = 64) -> List[AnalyzedMessage]:
+    """Parse many messages in one nlp.pipe call."""
+    texts = list(texts)
+    with stage("spacy"):
+        docs = list(nlp.pipe((text.lower().strip() for text in texts), batch_size=batch_size))
+    return [_analyzed(text, doc, matcher, stop_words) for text, doc in zip(texts, docs)]
+
+
+def _analyzed(text: str, doc, matcher, stop_words: Set[str]) -> AnalyzedMessage:
+    with stage("matcher"):
+        matches = matcher(doc) if matcher else []
+    with stage("tokenize"):
+        tokens = doc_tokens(doc, stop_words)
+    return AnalyzedMessage(text, doc, matches, tokens)
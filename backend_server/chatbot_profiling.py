@@ -0,0 +1,124 @@
+"""
+Opt-in per-stage profiling of chatbot messages.
+
+A traced message records the time spent in each stage of answering it
+(response cache, spaCy, tokenization, intent routing, TF-IDF search, market
+data and every handler tried, in "handler:<name>" stages) and which handler
+answered. Stage times are observed in the chatbot_stage_seconds histogram.
+
+Messages are traced when CHATBOT_PROFILING=1, or one at a time when /chatbot
+is called with "debug": true, which returns the trace with the answer.
+
+Untraced, stage() hands back a shared no-op context manager, so an
+instrumented call costs one thread-local lookup.
+"""
+
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from chatbot_metrics import histogram
+
+STAGE_LATENCY = histogram(
+    "chatbot_stage_seconds",
+    "Time spent in each stage of answering a profiled chatbot message",
+    ["stage"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10),
+)
+
+
+class _CurrentTrace(threading.local):
+    # A class attribute, so that reading it in an untraced thread does not raise and catch
+    trace: Optional["MessageTrace"] = None
+
+
+_NOT_TRACED = contextlib.nullcontext()
+_local = _CurrentTrace()
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("CHATBOT_PROFILING", "0").lower() in ("1", "true", "yes")
+
+
+class MessageTrace:
+    """Stage timings and the answering handler of one message (or batch)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+        self.handler: Optional[str] = None
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+        for stage, seconds in self.stages.items():
+            STAGE_LATENCY.labels(stage).observe(seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Stages nest (a handler includes the TF-IDF search it runs), so they do not add up to the total
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return {
+            "handler": self.handler,
+            "total_ms": round((end - self.started) * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+        }
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: MessageTrace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.trace.record(self.name, time.perf_counter() - self.started)
+
+
+def stage(name: str):
+    """Time a block as the named stage of the message being traced, if any."""
+    trace = _local.trace
+    if trace is None:
+        return _NOT_TRACED
+    return _Stage(trace, name)
+
+
+def set_handler(handler: str) -> None:
+    """Record which intent or stage answered the message being traced."""
+    trace = _local.trace
+    if trace is not None:
+        trace.handler = handler
+
+
+class _Tracing:
+    __slots__ = ("trace",)
+
+    def __enter__(self) -> MessageTrace:
+        self.trace = _local.trace = MessageTrace()
+        return self.trace
+
+    def __exit__(self, *exc_info) -> None:
+        _local.trace = None
+        self.trace.finish()
+
+
+def trace_message(enabled: bool = True):
+    """Trace the stages run by this thread inside the block.
+
+    The context manager returns the MessageTrace, or None when not enabled;
+    a nested call joins the trace already in progress.
+    """
+    current = _local.trace
+    if current is not None:
+        return contextlib.nullcontext(current)
+    if not enabled:
+        return _NOT_TRACED
+    return _Tracing()
@@ -0,0 +1,336 @@
+"""
+Lazy, background warm-up of the financial chatbot.
+
+Building AdvancedFinancialChatbot loads spaCy, fits the KB index and may
+download NLTK data, which takes seconds. ChatbotService does that on a
+background thread so the rest of the API serves immediately; /chatbot reports
+the readiness state (503 + Retry-After) until the model is ready.
+
+Inference runs off FastAPI's shared threadpool so that the NLP work does not
+starve the database-backed routes. CHATBOT_EXECUTION selects where:
+
+- thread (default): a dedicated thread pool in the API process
+- process: a pool of worker processes, each with its own chatbot, so the
+  GIL-bound parsing no longer competes with the API threads at all
+
+Either way at most CHATBOT_MAX_PENDING calls are queued or running; callers
+beyond that get ChatbotBusy (429), and each call is bounded by a timeout.
+A batch (generate_responses) takes one slot for at most max_batch messages;
+larger ones get ChatbotBatchTooLarge (413).
+
+stream() runs a generator method (generate_response_stream) on the pool one
+item at a time. Generators cannot cross process boundaries, so in process
+mode the worker collects all items first and they are yielded afterwards.
+"""
+
+import asyncio
+import gc
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+MAX_BATCH_SIZE = 100
+
+
+class ChatbotNotReady(Exception):
+    def __init__(self, state: str, retry_after: int):
+        super().__init__(f"Chatbot is {state}")
+        self.state = state
+        self.retry_after = retry_after
+
+
+class ChatbotInputError(ValueError):
+    """Invalid arguments to a chatbot method (reported as 400, unlike internal errors)."""
+
+
+class ChatbotBatchTooLarge(Exception):
+    def __init__(self, size: int, max_batch: int):
+        super().__init__(f"At most {max_batch} messages per batch")
+        self.size = size
+        self.max_batch = max_batch
+
+
+class ChatbotBusy(Exception):
+    def __init__(self, pending: int, retry_after: int):
+        super().__init__(f"Chatbot has {pending} requests pending")
+        self.pending = pending
+        self.retry_after = retry_after
+
+
+def _build_default_chatbot():
+    # Imported here so that importing main.py does not pull in spaCy/sklearn
+    from simple_chatbot import AdvancedFinancialChatbot
+    return AdvancedFinancialChatbot()
+
+
+# Chatbot of a pool worker process (process execution mode)
+_worker_chatbot = None
+
+
+def _init_worker(factory: Callable[[], Any]) -> None:
+    global _worker_chatbot
+    _worker_chatbot = factory()
+
+
+def _ping_worker() -> int:
+    return os.getpid()
+
+
+def _call_worker(method: str, args: tuple) -> Any:
+    return getattr(_worker_chatbot, method)(*args)
+
+
+def _collect_worker(method: str, args: tuple) -> list:
+    return list(getattr(_worker_chatbot, method)(*args))
+
+
+# Returned by next() on the pool when a streamed generator is exhausted
+_STREAM_END = object()
+
+
+class ChatbotService:
+    NOT_STARTED = "not_started"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+    THREAD = "thread"
+    PROCESS = "process"
+
+    def __init__(self, factory: Optional[Callable[[], Any]] = None, retry_after: int = 5,
+                 execution: Optional[str] = None, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, timeout: Optional[float] = None,
+                 max_batch: int = MAX_BATCH_SIZE):
+        self.factory = factory or _build_default_chatbot
+        self.retry_after = retry_after
+        self.execution = (execution or os.getenv("CHATBOT_EXECUTION", self.THREAD)).lower()
+        if self.execution not in (self.THREAD, self.PROCESS):
+            raise ValueError(f"Unknown chatbot execution mode: {self.execution}")
+        self.workers = workers or int(os.getenv("CHATBOT_WORKERS", 2))
+        self.max_pending = max_pending or int(os.getenv("CHATBOT_MAX_PENDING", 32))
+        self.timeout = timeout or float(os.getenv("CHATBOT_TIMEOUT_SECONDS", 10))
+        self.max_batch = max_batch
+        self.state = self.NOT_STARTED
+        self.error: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
+        self._chatbot = None
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def start_warmup(self) -> None:
+        """Build the chatbot on a daemon thread; no-op if already warming or ready."""
+        with self._lock:
+            if self.state in (self.WARMING, self.READY):
+                return
+            self.state = self.WARMING
+            self.error = None
+        threading.Thread(target=self._warm, name="chatbot-warmup", daemon=True).start()
+
+    def preload(self) -> None:
+        """Build the chatbot synchronously, e.g. in a gunicorn master before fork.
+
+        Afterwards gc.freeze() moves everything allocated so far into the
+        permanent generation, so the cyclic GC in forked workers does not write
+        to (and thereby un-share) the pages holding the model.
+
+        In process execution mode the chatbot lives in each API worker's own
+        pool processes, so there is nothing to build in the master.
+        """
+        if self.execution == self.PROCESS:
+            return
+        with self._lock:
+            if self.state == self.READY:
+                return
+            self.state = self.WARMING
+        self._warm()
+        if self.state == self.READY:
+            gc.freeze()
+
+    def _warm(self) -> None:
+        started = time.perf_counter()
+        try:
+            if self.execution == self.PROCESS:
+                chatbot = None
+                self._start_process_pool()
+            else:
+                chatbot = self.factory()
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                self.state = self.FAILED
+                self.error = str(e)
+                self._failed_at = time.monotonic()
+            return
+        with self._lock:
+            self._chatbot = chatbot
+            self.warmup_seconds = time.perf_counter() - started
+            self.state = self.READY
+        print(f"Chatbot ready in {self.warmup_seconds:.2f}s")
+
+    def _start_process_pool(self) -> None:
+        """Start the worker processes and wait until each has built its chatbot."""
+        context = multiprocessing.get_context(os.getenv("CHATBOT_PROCESS_START_METHOD", "spawn"))
+        executor = ProcessPoolExecutor(self.workers, mp_context=context,
+                                       initializer=_init_worker, initargs=(self.factory,))
+        try:
+            for future in wait([executor.submit(_ping_worker) for _ in range(self.workers)]).done:
+                future.result()
+        except Exception:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        with self._lock:
+            old_executor, self._executor = self._executor, executor
+        if old_executor is not None:
+            old_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> Executor:
+        # Created on first use rather than in preload(), so no threads exist before fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="chatbot")
+            return self._executor
+
+    async def call(self, method: str, *args) -> Any:
+        """Run a chatbot method on the inference pool and await its result.
+
+        Raises ChatbotNotReady while warming up, ChatbotBusy when max_pending
+        calls are already queued or running, and asyncio.TimeoutError after
+        timeout seconds. A call that times out keeps its slot until the pool
+        has actually finished it, so abandoned work still counts as load.
+        """
+        chatbot = self.get()
+        self._acquire()
+        try:
+            executor = self._get_executor()
+            if self.execution == self.PROCESS:
+                future = executor.submit(_call_worker, method, args)
+            else:
+                future = executor.submit(getattr(chatbot, method), *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return await self._result(future)
+
+    def check_batch(self, messages: List[str], client_ids: List[Optional[int]]) -> None:
+        """Raise ChatbotInputError or ChatbotBatchTooLarge for a batch generate_responses would refuse."""
+        if len(messages) != len(client_ids):
+            raise ChatbotInputError("messages and client_ids must have the same length")
+        if len(messages) > self.max_batch:
+            raise ChatbotBatchTooLarge(len(messages), self.max_batch)
+
+    async def generate_responses(self, messages: List[str], client_ids: List[Optional[int]],
+                                 profiles: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[str]:
+        """Answer a batch of messages in one call on the pool; responses keep the input order."""
+        self.check_batch(messages, client_ids)
+        return await self.call("generate_responses", messages, client_ids, profiles)
+
+    async def stream(self, method: str, *args) -> AsyncIterator[Any]:
+        """Run a chatbot generator method on the inference pool and yield its items.
+
+        The stream holds one pending slot until it ends or the consumer goes
+        away, and each item is bounded by the timeout. In thread mode an item
+        is only produced once the previous one was consumed, so the full
+        result is never held in memory.
+        """
+        chatbot = self.get()
+        self._acquire()
+        future = None
+        try:
+            executor = self._get_executor()
+            if self.execution == self.PROCESS:
+                future = executor.submit(_collect_worker, method, args)
+                for item in await self._result(future):
+                    yield item
+                return
+            future = executor.submit(getattr(chatbot, method), *args)
+            iterator = await self._result(future)
+            while True:
+                future = executor.submit(next, iterator, _STREAM_END)
+                item = await self._result(future)
+                if item is _STREAM_END:
+                    return
+                yield item
+        finally:
+            # Like call(), work that is still running keeps its slot until it finishes
+            if future is not None and not future.done():
+                future.add_done_callback(self._release)
+            else:
+                self._release()
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ChatbotBusy(self._pending, self.retry_after)
+            self._pending += 1
+
+    async def _result(self, future: Future) -> Any:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed); rebuild the pool on a later call
+            with self._lock:
+                self.state = self.FAILED
+                self.error = str(e) or "Chatbot worker process died"
+                self._failed_at = time.monotonic()
+            raise
+
+    def _release(self, future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def get(self):
+        """Return the chatbot, or raise ChatbotNotReady while it is warming up.
+
+        The first call starts the warm-up when it was not started eagerly, and a
+        failed warm-up is retried once retry_after seconds have passed. In
+        process execution mode the chatbot lives in the pool, so this returns None.
+        """
+        if self.state == self.READY:
+            return self._chatbot
+        if self.state == self.NOT_STARTED or (
+            self.state == self.FAILED and time.monotonic() - self._failed_at >= self.retry_after
+        ):
+            self.start_warmup()
+        raise ChatbotNotReady(self.state, self.retry_after)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.state == self.READY,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+            "execution": self.execution,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "memory": memory_usage(),
+        }
+
+
+def memory_usage() -> Optional[Dict[str, int]]:
+    """Resident memory of this process split into shared and private kB (Linux only).
+
+    Pss charges shared pages proportionally to each process using them, so
+    the sum of Pss over all workers is the real footprint; Private_* is what
+    a worker holds on its own.
+    """
+    fields = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    usage = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name in fields:
+            usage[name.lower() + "_kb"] = int(value.split()[0])
+    return usage
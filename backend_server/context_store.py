@@ -0,0 +1,186 @@
+"""
+Bounded, pluggable storage for per-client chatbot state.
+
+The chatbot keeps two kinds of per-client state: conversation context (recent
+topics, detected risk profile) and historical financial snapshots. Both used
+to live in plain dicts that grew for the lifetime of the process. A
+ContextStore bounds them with TTL expiry, LRU eviction and a memory cap.
+
+Backends:
+- InMemoryContextStore: per process, the default
+- RedisContextStore: shared by every worker/host, so a conversation keeps its
+  context whichever worker serves the next message
+
+Values must be JSON-serializable so that every backend can store them.
+
+get() followed by set() is last-writer-wins: two workers appending to the
+same client's history would lose one snapshot. update() applies a function
+to the stored value atomically instead (under a lock in memory, as a
+WATCH/MULTI transaction retried on conflict in Redis).
+"""
+
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class ContextStore(ABC):
+    @abstractmethod
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        """The stored value, or None if it is missing or has expired."""
+
+    @abstractmethod
+    def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        """Store value, replacing any previous one and restarting its TTL."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: Hashable) -> None:
+        """Remove the value, if any."""
+
+    @abstractmethod
+    def update(self, namespace: str, key: Hashable, function: Callable[[Optional[Any]], Any]) -> Any:
+        """Atomically replace the value with function(value) and return it.
+
+        function gets None when there is no value, and may be called more than
+        once (Redis retries on conflict), so it must not have side effects.
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemoryContextStore(ContextStore):
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 24 * 3600, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._get((namespace, key))
+
+    def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        encoded = json.dumps(value, default=str)
+        with self._lock:
+            self._set((namespace, key), encoded)
+
+    def update(self, namespace: str, key: Hashable, function: Callable[[Optional[Any]], Any]) -> Any:
+        full_key = (namespace, key)
+        with self._lock:
+            value = function(self._get(full_key))
+            self._set(full_key, json.dumps(value, default=str))
+            return value
+
+    def _get(self, full_key: tuple) -> Optional[Any]:
+        entry = self._entries.get(full_key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(full_key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(full_key)
+        # Hand out a copy so callers cannot mutate the stored value in place,
+        # which keeps the in-memory and shared backends interchangeable
+        return json.loads(entry[2])
+
+    def _set(self, full_key: tuple, encoded: str) -> None:
+        if full_key in self._entries:
+            self._remove(full_key)
+        self._entries[full_key] = (time.monotonic() + self.ttl_seconds, len(encoded), encoded)
+        self._bytes += len(encoded)
+        self._evict()
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        with self._lock:
+            if (namespace, key) in self._entries:
+                self._remove((namespace, key))
+
+    def _remove(self, full_key: tuple) -> None:
+        _, size, _ = self._entries.pop(full_key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        # Expired entries at the LRU end go first, then the least recently used
+        # ones until both the entry count and the memory cap are respected
+        now = time.monotonic()
+        while self._entries:
+            oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at <= now:
+                self._remove(oldest_key)
+                self.expirations += 1
+            elif len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(oldest_key)
+                self.evictions += 1
+            else:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class RedisContextStore(ContextStore):
+    """Shared backend; eviction under memory pressure is left to Redis' maxmemory-policy."""
+
+    def __init__(self, url: str, ttl_seconds: float = 24 * 3600, prefix: str = "chatbot"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+
+    def _key(self, namespace: str, key: Hashable) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        raw = self.client.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        self.client.set(self._key(namespace, key), json.dumps(value, default=str), ex=self.ttl_seconds)
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        self.client.delete(self._key(namespace, key))
+
+    def update(self, namespace: str, key: Hashable, function: Callable[[Optional[Any]], Any]) -> Any:
+        name = self._key(namespace, key)
+
+        def apply(pipe):
+            # Runs again if another client changes the key before EXEC
+            raw = pipe.get(name)
+            value = function(json.loads(raw) if raw is not None else None)
+            pipe.multi()
+            pipe.set(name, json.dumps(value, default=str), ex=self.ttl_seconds)
+            return value
+
+        return self.client.transaction(apply, name, value_from_callable=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+
+def create_context_store() -> ContextStore:
+    """Build the store selected by CHATBOT_CONTEXT_* environment variables."""
+    ttl_seconds = float(os.getenv("CHATBOT_CONTEXT_TTL_SECONDS", 24 * 3600))
+    if os.getenv("CHATBOT_CONTEXT_BACKEND", "memory").lower() == "redis":
+        return RedisContextStore(os.getenv("CHATBOT_CONTEXT_REDIS_URL", "redis://localhost:6379/0"), ttl_seconds)
+    return InMemoryContextStore(
+        max_entries=int(os.getenv("CHATBOT_CONTEXT_MAX_ENTRIES", 10000)),
+        ttl_seconds=ttl_seconds,
+        max_bytes=int(os.getenv("CHATBOT_CONTEXT_MAX_BYTES", 32 * 1024 * 1024)),
+    )
@@ -0,0 +1,265 @@
+"""
+Embedding retrieval over the knowledge base (CHATBOT_RETRIEVAL=embedding).
+
+The TF-IDF index only matches KB questions that share words with a message,
+so paraphrases ("how do mutual funds work") fall below its threshold.
+EmbeddingIndex compares dense sentence embeddings instead, on the CPU:
+
+- Every KB question is encoded once into a contiguous float32 matrix of
+  unit-length rows, so cosine similarity is a dot product. The matrix is
+  cached on disk, keyed on the encoder and the questions, and memory-mapped:
+  workers on a host share its pages and a restart does not re-encode the KB
+- Up to EXACT_SEARCH_MAX_ROWS questions are scored exactly with one matrix
+  multiply. Larger knowledge bases get an inverted-file (IVF) index: the rows
+  are clustered with k-means and stored grouped by cluster, and a query only
+  scores the n_probe clusters whose centroids are nearest to it
+- The queries of a batch are encoded in one call
+
+Encoders:
+- "spacy" (default): mean of the static word vectors of the message's
+  content words, from a model with vectors (en_core_web_md or _lg)
+- "sentence-transformers": e.g. all-MiniLM-L6-v2 (pip install sentence-transformers)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from kb_index import KnowledgeBaseIndex
+
+CACHE_FORMAT_VERSION = 1
+EXACT_SEARCH_MAX_ROWS = 10000
+# Rows assigned to clusters per chunk, to bound the size of the score matrix
+ASSIGN_CHUNK_ROWS = 65536
+
+Query = Union[str, Sequence[str]]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length; all-zero rows (no known words) stay zero."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class SpacyVectorEncoder:
+    """Mean of the static word vectors of a text's content words."""
+
+    # Averaged word vectors of short finance questions are all fairly similar
+    match_threshold = 0.8
+
+    def __init__(self, model: str = "en_core_web_md", nlp=None):
+        if nlp is None:
+            import spacy
+            nlp = spacy.load(model)
+        if not nlp.vocab.vectors.shape[0]:
+            raise ValueError(f"spaCy model {nlp.meta.get('name')} has no word vectors; "
+                             f"use en_core_web_md or en_core_web_lg")
+        self.nlp = nlp
+        self.dimensions = nlp.vocab.vectors.shape[1]
+        self.name = f"spacy:{nlp.meta.get('lang')}_{nlp.meta.get('name')}-{nlp.meta.get('version')}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # Static vectors only need the tokenizer, not the rest of the pipeline
+            words = [token.vector for token in self.nlp.make_doc(text.lower())
+                     if token.has_vector and not (token.is_stop or token.is_punct)]
+            if words:
+                vectors[row] = np.mean(words, axis=0)
+        return normalize_rows(vectors)
+
+
+class SentenceTransformerEncoder:
+    """A sentence-transformers model run on the CPU."""
+
+    match_threshold = 0.6
+
+    def __init__(self, model: str = "all-MiniLM-L6-v2", batch_size: int = 64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("sentence-transformers is required for the sentence-transformers encoder")
+        self.model = SentenceTransformer(model, device="cpu")
+        self.batch_size = batch_size
+        self.name = f"sentence-transformers:{model}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+ENCODERS = {"spacy": SpacyVectorEncoder, "sentence-transformers": SentenceTransformerEncoder}
+
+
+def create_encoder(kind: Optional[str] = None, model: Optional[str] = None, nlp=None):
+    """Encoder configured by CHATBOT_EMBEDDING_ENCODER and CHATBOT_EMBEDDING_MODEL.
+
+    The spaCy encoder reuses nlp when no model is configured and it has vectors.
+    """
+    kind = (kind or os.getenv("CHATBOT_EMBEDDING_ENCODER", "spacy")).lower()
+    model = model or os.getenv("CHATBOT_EMBEDDING_MODEL") or None
+    if kind not in ENCODERS:
+        raise ValueError(f"Unknown embedding encoder '{kind}'; use one of {', '.join(ENCODERS)}")
+    if kind == "spacy":
+        if model is None and nlp is not None and nlp.vocab.vectors.shape[0]:
+            return SpacyVectorEncoder(nlp=nlp)
+        return SpacyVectorEncoder(model or "en_core_web_md")
+    return SentenceTransformerEncoder(model or "all-MiniLM-L6-v2")
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids, trained on a sample of at most 256 rows per list."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * 256)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # A cluster that lost all its rows keeps its previous centroid
+        empty = np.bincount(assignment, minlength=n_lists) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.concatenate([
+        np.argmax(vectors[start:start + ASSIGN_CHUNK_ROWS] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS)
+    ])
+
+
+def build_layout(vectors: np.ndarray, n_lists: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Arrays of the index: vectors (grouped by cluster for IVF), their KB positions, centroids and offsets."""
+    if len(vectors) <= EXACT_SEARCH_MAX_ROWS and n_lists is None:
+        return {"vectors": vectors, "positions": np.arange(len(vectors))}
+    n_lists = n_lists or int(np.sqrt(len(vectors)))
+    n_lists = max(1, min(n_lists, len(vectors)))
+    centroids = _kmeans(vectors, n_lists)
+    assignment = _assign(vectors, centroids)
+    positions = np.argsort(assignment, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+    return {"vectors": np.ascontiguousarray(vectors[positions]), "positions": positions,
+            "centroids": centroids, "offsets": offsets}
+
+
+def _cache_key(encoder_name: str, questions: List[str], n_lists: Optional[int]) -> str:
+    payload = json.dumps([CACHE_FORMAT_VERSION, encoder_name, questions, n_lists, EXACT_SEARCH_MAX_ROWS])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def _load_layout(directory: str) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        names = [name[:-len(".npy")] for name in os.listdir(directory) if name.endswith(".npy")]
+        layout = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in names}
+    except (OSError, ValueError):
+        return None
+    return layout if "vectors" in layout and "positions" in layout else None
+
+
+def _save_layout(cache_dir: str, key: str, layout: Dict[str, np.ndarray]) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".building-", dir=cache_dir)
+    try:
+        for name, array in layout.items():
+            np.save(os.path.join(staging, f"{name}.npy"), array)
+        target = os.path.join(cache_dir, key)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+class EmbeddingIndex:
+    """Nearest KB questions to a message by embedding cosine similarity.
+
+    search() and search_batch() return (question, answer, score) tuples like
+    KnowledgeBaseIndex, but take the message text rather than its tokens.
+    """
+
+    def __init__(self, knowledge_base: Dict[str, Any], encoder, top_k: int = 5,
+                 cache_dir: Optional[str] = None, n_lists: Optional[int] = None,
+                 n_probe: Optional[int] = None, match_threshold: Optional[float] = None):
+        self.encoder = encoder
+        self.top_k = top_k
+        self.match_threshold = match_threshold if match_threshold is not None else encoder.match_threshold
+        self.questions = list(knowledge_base.keys())
+        self.answers = [knowledge_base[q] for q in self.questions]
+        self.cached = False
+
+        layout = None
+        key = _cache_key(encoder.name, self.questions, n_lists)
+        if cache_dir and self.questions:
+            layout = _load_layout(os.path.join(cache_dir, key))
+            self.cached = layout is not None
+        if layout is None:
+            vectors = encoder.encode(self.questions) if self.questions else np.zeros((0, 0), dtype=np.float32)
+            layout = build_layout(vectors, n_lists)
+            if cache_dir and self.questions:
+                try:
+                    _save_layout(cache_dir, key, layout)
+                except OSError as e:
+                    print(f"Could not cache KB embeddings in {cache_dir}: {e}")
+
+        self.vectors = layout["vectors"]
+        self.positions = layout["positions"]
+        self.centroids = layout.get("centroids")
+        self.offsets = layout.get("offsets")
+        n_clusters = 0 if self.centroids is None else len(self.centroids)
+        self.n_probe = min(n_probe or max(8, n_clusters // 10), n_clusters)
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": "embedding",
+            "encoder": self.encoder.name,
+            "dimensions": int(self.vectors.shape[1]) if len(self) else None,
+            "ivf_lists": 0 if self.centroids is None else len(self.centroids),
+            "n_probe": self.n_probe,
+            "match_threshold": self.match_threshold,
+            "cached": self.cached,
+        }
+
+    def search(self, query: Query, k: Optional[int] = None) -> List[Tuple[str, Any, float]]:
+        """Return up to k (question, answer, score) tuples, best match first."""
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries: Sequence[Query], k: Optional[int] = None) -> List[List[Tuple[str, Any, float]]]:
+        """Encode all queries in one call and score each against the KB."""
+        k = k or self.top_k
+        if not len(self) or not queries:
+            return [[] for _ in queries]
+        query_vectors = self.encoder.encode([q if isinstance(q, str) else " ".join(q) for q in queries])
+
+        results = []
+        if self.centroids is None:
+            for scores in query_vectors @ self.vectors.T:
+                results.append(self._results(scores, self.positions, k))
+            return results
+
+        nearest = np.argsort(-(query_vectors @ self.centroids.T), axis=1, kind="stable")[:, :self.n_probe]
+        for query, lists in zip(query_vectors, nearest):
+            # Each cluster's rows are contiguous, so probing it is one slice
+            spans = [(self.offsets[i], self.offsets[i + 1]) for i in lists]
+            scores = np.concatenate([self.vectors[start:end] @ query for start, end in spans])
+            rows = np.concatenate([self.positions[start:end] for start, end in spans])
+            results.append(self._results(scores, rows, k))
+        return results
+
+    def _results(self, scores: np.ndarray, positions: np.ndarray, k: int) -> List[Tuple[str, Any, float]]:
+        return [(self.questions[i], self.answers[i], float(score))
+                for i, score in KnowledgeBaseIndex._top_k(scores, positions, k)]
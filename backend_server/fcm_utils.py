@@ -1,19 +1,43 @@
 import json
+import threading
 import requests
 from google.oauth2 import service_account
 from google.auth.transport.requests import Request
 
-def send_fcm_v1_notification(token, title, body, data=None):
-    
-    SERVICE_ACCOUNT_FILE = r"C:\Users\hp\Desktop\FlutterMane\Taxmate_Project\Taxmate_Project-my-new-branch\backend_server\test-f21bc-firebase-adminsdk-fbsvc-ac09f2676f.json"
-    PROJECT_ID = "test-f21bc"
+SERVICE_ACCOUNT_FILE = r"C:\Users\hp\Desktop\FlutterMane\Taxmate_Project\Taxmate_Project-my-new-branch\backend_server\test-f21bc-firebase-adminsdk-fbsvc-ac09f2676f.json"
+PROJECT_ID = "test-f21bc"
+FCM_TIMEOUT_SECONDS = 10
+
+# Loaded once and refreshed only when the access token expires (about hourly),
+# instead of reading the key file and fetching a token for every notification
+_credentials = None
+_credentials_lock = threading.Lock()
+# Keeps the HTTPS connection to FCM open between notifications
+_session = requests.Session()
+
+
+class FCMError(Exception):
+    def __init__(self, status_code, text):
+        super().__init__(f"FCM returned {status_code}: {text}")
+        self.status_code = status_code
+        # Rate limiting and server errors are worth retrying; an invalid or unregistered token is not
+        self.retryable = status_code == 429 or status_code >= 500
 
-    credentials = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE,
-        scopes=["https://www.googleapis.com/auth/firebase.messaging"],
-    )
-    credentials.refresh(Request())
-    access_token = credentials.token
+
+def get_access_token():
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE,
+                scopes=["https://www.googleapis.com/auth/firebase.messaging"],
+            )
+        if not _credentials.valid:
+            _credentials.refresh(Request())
+        return _credentials.token
+
+def send_fcm_v1_notification(token, title, body, data=None):
+    access_token = get_access_token()
 
     url = f"https://fcm.googleapis.com/v1/projects/{PROJECT_ID}/messages:send"
     headers = {
@@ -33,6 +57,8 @@ def send_fcm_v1_notification(token, title, body, data=None):
         }
     }
     print("Sending to FCM token:", token)
-    response = requests.post(url, headers=headers, data=json.dumps(message))
+    response = _session.post(url, headers=headers, data=json.dumps(message), timeout=FCM_TIMEOUT_SECONDS)
     print("FCM response:", response.status_code, response.text)
+    if not response.ok:
+        raise FCMError(response.status_code, response.text)
     return response.json()
@@ -0,0 +1,126 @@
+"""
+Vectorized financial calculations for the chatbot and the /calculator API.
+
+Every function accepts scalars or NumPy arrays and broadcasts them, so one
+call prices many scenarios at once (e.g. a loan at five rates and three
+tenors). Rates are annual fractions (0.08 for 8%).
+
+Schedules are dicts of 2-D arrays with one row per scenario and one column
+per month. Rows of scenarios with shorter tenors are zero-padded after their
+last month; "months" gives each row's length.
+"""
+
+from typing import Dict
+
+import numpy as np
+
+# Upper bound on schedule length, to keep one request from allocating huge arrays
+MAX_SCHEDULE_MONTHS = 1200
+
+
+def _as_arrays(*values) -> list:
+    return np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in values))
+
+
+def future_value(present_value, annual_rate, years, periods_per_year: int = 1) -> np.ndarray:
+    """Value after years of growth at annual_rate, compounded periods_per_year times a year."""
+    present_value, annual_rate, years = _as_arrays(present_value, annual_rate, years)
+    return present_value * (1 + annual_rate / periods_per_year) ** (years * periods_per_year)
+
+
+def present_value(future_value, annual_rate, years, periods_per_year: int = 1) -> np.ndarray:
+    """Today's value of an amount due after years, discounted at annual_rate."""
+    future_value, annual_rate, years = _as_arrays(future_value, annual_rate, years)
+    return future_value / (1 + annual_rate / periods_per_year) ** (years * periods_per_year)
+
+
+def loan_emi(principal, annual_rate, months) -> np.ndarray:
+    """Equated monthly instalment of a loan repaid over months."""
+    principal, annual_rate, months = _as_arrays(principal, annual_rate, months)
+    rate = annual_rate / 12
+    growth = (1 + rate) ** months
+    # A zero-rate loan is repaid in equal parts; np.where evaluates both branches, so avoid dividing by zero
+    safe_rate = np.where(rate == 0, 1.0, rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        emi = principal * safe_rate * growth / (growth - 1)
+    return np.where(rate == 0, principal / months, emi)
+
+
+def _month_columns(months: np.ndarray) -> np.ndarray:
+    longest = int(months.max()) if months.size else 0
+    if longest > MAX_SCHEDULE_MONTHS:
+        raise ValueError(f"Schedules are limited to {MAX_SCHEDULE_MONTHS} months")
+    return np.arange(1, longest + 1, dtype=np.float64)
+
+
+def amortization_schedule(principal, annual_rate, months) -> Dict[str, np.ndarray]:
+    """Monthly payment, interest, principal repaid and balance of each scenario's loan."""
+    principal, annual_rate, months = (value.reshape(-1) for value in _as_arrays(principal, annual_rate, months))
+    months = np.rint(months)
+    emi = loan_emi(principal, annual_rate, months)
+    month = _month_columns(months)
+
+    rate = (annual_rate / 12)[:, None]
+    growth = (1 + rate) ** month
+    safe_rate = np.where(rate == 0, 1.0, rate)
+    # Closed-form balance after each payment, so no Python loop over months
+    balance = np.where(
+        rate == 0,
+        principal[:, None] - emi[:, None] * month,
+        principal[:, None] * growth - emi[:, None] * (growth - 1) / safe_rate,
+    )
+    active = month <= months[:, None]
+    balance = np.where(active, np.maximum(balance, 0.0), 0.0)
+    opening = np.concatenate([principal[:, None], balance[:, :-1]], axis=1)
+    interest = np.where(active, opening * rate, 0.0)
+    payment = np.where(active, emi[:, None], 0.0)
+    return {
+        "months": months.astype(int),
+        "emi": emi,
+        "payment": payment,
+        "interest": interest,
+        "principal": payment - interest,
+        "balance": balance,
+        "total_interest": interest.sum(axis=1),
+        "total_payment": payment.sum(axis=1),
+    }
+
+
+def sip_future_value(monthly_investment, annual_rate, years) -> np.ndarray:
+    """Value of a SIP investing at the start of every month for years."""
+    monthly_investment, annual_rate, years = _as_arrays(monthly_investment, annual_rate, years)
+    rate = annual_rate / 12
+    months = np.rint(years * 12)
+    safe_rate = np.where(rate == 0, 1.0, rate)
+    value = monthly_investment * ((1 + rate) ** months - 1) / safe_rate * (1 + rate)
+    return np.where(rate == 0, monthly_investment * months, value)
+
+
+def sip_schedule(monthly_investment, annual_rate, years) -> Dict[str, np.ndarray]:
+    """Amount invested and portfolio value at the end of every month of each scenario's SIP."""
+    monthly_investment, annual_rate, years = (
+        value.reshape(-1) for value in _as_arrays(monthly_investment, annual_rate, years))
+    months = np.rint(years * 12)
+    month = _month_columns(months)
+    active = month <= months[:, None]
+
+    rate = (annual_rate / 12)[:, None]
+    safe_rate = np.where(rate == 0, 1.0, rate)
+    value = np.where(
+        rate == 0,
+        monthly_investment[:, None] * month,
+        monthly_investment[:, None] * ((1 + rate) ** month - 1) / safe_rate * (1 + rate),
+    )
+    invested = monthly_investment[:, None] * month
+    value = np.where(active, value, 0.0)
+    invested = np.where(active, invested, 0.0)
+    final_value = sip_future_value(monthly_investment, annual_rate, years)
+    total_invested = monthly_investment * months
+    return {
+        "months": months.astype(int),
+        "invested": invested,
+        "value": value,
+        "final_value": final_value,
+        "total_invested": total_invested,
+        "returns": final_value - total_invested,
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -78,4 +78,72 @@ class ChatMessageOut(BaseModel):
     timestamp: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Financial calculators (calculator_router.py). Rates are percentages and, like
+# tenors, may be a single value or a list: every rate is combined with every tenor.
+
+def _as_list(v):
+    return v if isinstance(v, list) else [v]
+
+def _check_rates(rates):
+    if not rates or any(rate < 0 or rate > 100 for rate in rates):
+        raise ValueError("annual_rates must be percentages between 0 and 100")
+    return rates
+
+class FutureValueRequest(BaseModel):
+    amount: float = Field(..., gt=0)
+    annual_rates: List[float]
+    years: List[float]
+    compounding_per_year: int = Field(1, ge=1, le=365)
+
+    _rates_as_list = validator('annual_rates', 'years', pre=True, allow_reuse=True)(_as_list)
+
+    @validator('annual_rates')
+    def validate_rates(cls, v):
+        return _check_rates(v)
+
+    @validator('years')
+    def validate_years(cls, v):
+        if not v or any(years <= 0 or years > 100 for years in v):
+            raise ValueError("years must be between 0 and 100")
+        return v
+
+class PresentValueRequest(FutureValueRequest):
+    pass
+
+class LoanEMIRequest(BaseModel):
+    principal: float = Field(..., gt=0)
+    annual_rates: List[float]
+    tenure_months: List[int]
+    include_schedule: bool = True
+
+    _rates_as_list = validator('annual_rates', 'tenure_months', pre=True, allow_reuse=True)(_as_list)
+
+    @validator('annual_rates')
+    def validate_rates(cls, v):
+        return _check_rates(v)
+
+    @validator('tenure_months')
+    def validate_tenure(cls, v):
+        if not v or any(months < 1 or months > 600 for months in v):
+            raise ValueError("tenure_months must be between 1 and 600")
+        return v
+
+class SIPRequest(BaseModel):
+    monthly_investment: float = Field(..., gt=0)
+    annual_rates: List[float]
+    years: List[int]
+    include_schedule: bool = True
+
+    _rates_as_list = validator('annual_rates', 'years', pre=True, allow_reuse=True)(_as_list)
+
+    @validator('annual_rates')
+    def validate_rates(cls, v):
+        return _check_rates(v)
+
+    @validator('years')
+    def validate_years(cls, v):
+        if not v or any(years < 1 or years > 50 for years in v):
+            raise ValueError("years must be between 1 and 50")
+        return v
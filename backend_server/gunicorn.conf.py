@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for running the API with several uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+preload_app imports main.py once in the master process. With
+CHATBOT_PRELOAD=1 the financial chatbot (spaCy model, KB index, matcher) is
+built there before the workers are forked, so all workers share those pages
+copy-on-write instead of each holding a private copy. Plain
+`uvicorn --workers N` spawns fresh interpreters and cannot share them.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Read by main.py at import time, i.e. in the master before fork
+os.environ.setdefault("CHATBOT_PRELOAD", "1")
+
+
+def post_fork(server, worker):
+    # Connections opened by the master (create_all at import) must not be
+    # shared with the workers; drop them from the pool without closing them.
+    from database import engine
+    engine.dispose(close=False)
@@ -0,0 +1,76 @@
+"""
+Single-pass intent routing for the financial chatbot.
+
+The chatbot used to try each handler in turn, every one running re.search
+with its own pattern string. IntentRouter compiles all intent patterns into
+one regex and classifies a message with a single match:
+
+    ^(?:(?=.*?(P1))|(?=.*?(P2))|...)
+
+Alternatives are tried in priority order and each lookahead finds the
+leftmost match of its pattern, so the winner and its groups are exactly what
+the old cascade of re.search calls produced, at the cost of one match call.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from chatbot_metrics import histogram
+
+INTENT_LATENCY = histogram(
+    "chatbot_intent_seconds",
+    "Time to answer a chatbot message, by the intent or stage that answered it",
+    ["intent"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+_AMOUNT = r"(\$?\d+(?:,\d+)*(?:\.\d+)?)"
+
+# Checked in this order; the first intent whose pattern occurs anywhere in the message wins.
+# The term explanation stage (PhraseMatcher) runs between the small talk and the rest.
+SMALL_TALK_INTENTS = ("greeting", "gratitude", "farewell")
+FINANCIAL_INTENTS = [
+    ("greeting", r"hello|hi|hey|greetings"),
+    ("gratitude", r"thanks|thank you|appreciate"),
+    ("farewell", r"bye|goodbye|see you"),
+    ("market_price", r"(?:what is|what's|show me|tell me) (?:the )?(?:price|value) of ([A-Z]{1,5})\??"),
+    ("market_performance", r"(?:how is|how's|what is|what's) (?:the )?performance of ([A-Z]{1,5})\??"),
+    ("future_value", r"(?:calculate|what is) (?:the )?future value of " + _AMOUNT + r" at (\d+(?:\.\d+)?)% for (\d+) years?"),
+    ("present_value", r"(?:calculate|what is) (?:the )?present value of " + _AMOUNT + r" at (\d+(?:\.\d+)?)% for (\d+) years?"),
+    ("emi", r"(?:calculate|what is|what's|what would be) (?:the |my )?(?:emi|monthly payment|monthly installment) (?:on|for|of) (?:a |an )?(?:loan of )?"
+            + _AMOUNT + r"(?: loan)? at (\d+(?:\.\d+)?)% for (\d+) (years?|months?)"),
+    ("sip", r"(?:calculate|what is|what's|what will be) (?:the )?(?:value of |returns? on )?(?:a |an |my )?sip of "
+            + _AMOUNT + r"(?: per month| a month| monthly)? at (\d+(?:\.\d+)?)% for (\d+) years?"),
+    ("definition", r"(?:what is|what's|define) (?:a |an |the )?([a-zA-Z\s]+)\??"),
+    ("comparison", r"(?:what is|what's) (?:the )?difference between (?:a |an |the )?([a-zA-Z\s]+) and (?:a |an |the )?([a-zA-Z\s]+)\??"),
+    ("strategy", r"(?:what is|what's|recommend) (?:the )?best (?:strategy|approach|way) for ([a-zA-Z\s]+)\??"),
+]
+
+
+class IntentRouter:
+    def __init__(self, intents: List[Tuple[str, str]] = FINANCIAL_INTENTS):
+        self.intents = []
+        alternatives = []
+        group = 1
+        for name, pattern in intents:
+            groups = re.compile(pattern).groups
+            # group is the index of the wrapper group; the intent's own groups follow it
+            self.intents.append((name, group, groups))
+            alternatives.append(f"(?=.*?({pattern}))")
+            group += groups + 1
+        self._by_group = {wrapper: (name, groups) for name, wrapper, groups in self.intents}
+        self.pattern = re.compile("^(?:" + "|".join(alternatives) + ")", re.IGNORECASE | re.DOTALL)
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _, _ in self.intents]
+
+    def classify(self, message: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """Return (intent, captured groups) of the highest priority matching intent."""
+        match = self.pattern.match(message)
+        if match is None:
+            return None
+        # The wrapper group closes last, so lastindex identifies the winning alternative
+        wrapper = match.lastindex
+        name, groups = self._by_group[wrapper]
+        return name, match.groups()[wrapper:wrapper + groups]
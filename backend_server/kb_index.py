@@ -0,0 +1,144 @@
+"""
+Precomputed TF-IDF index over the general finance knowledge base.
+
+The KB questions are vectorized once and kept as an L2-normalized sparse
+matrix, so cosine similarity is a plain dot product. The matrix is also kept
+transposed (term -> questions) which acts as an inverted index: scoring a query
+only touches the questions that share at least one term with it, instead of
+every entry in the knowledge base.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+Query = Union[str, Sequence[str]]
+
+
+def _identity_analyzer(tokens):
+    # Documents are tokenized before they reach the vectorizer
+    return tokens
+
+
+class KnowledgeBaseIndex:
+    # Cosine similarity a KB question needs to answer a message
+    match_threshold = 0.6
+
+    def __init__(self, knowledge_base: Dict[str, Any], tokenizer: Callable[[str], List[str]], top_k: int = 5,
+                 batch_tokenizer: Optional[Callable[[List[str]], List[List[str]]]] = None):
+        self.tokenizer = tokenizer
+        self.batch_tokenizer = batch_tokenizer
+        self.top_k = top_k
+        self.version = 0
+        self.rebuild(knowledge_base)
+
+    def rebuild(self, knowledge_base: Dict[str, Any]) -> None:
+        """Re-fit the vectorizer and matrices, e.g. after the KB has changed."""
+        questions = list(knowledge_base.keys())
+        answers = [knowledge_base[q] for q in questions]
+
+        # norm="l2" makes every row unit length, so cosine similarity is a dot product
+        vectorizer = TfidfVectorizer(analyzer=_identity_analyzer, norm="l2")
+        matrix = None
+        postings = None
+        if questions:
+            if self.batch_tokenizer:
+                token_lists = self.batch_tokenizer(questions)
+            else:
+                token_lists = [self.tokenizer(q) for q in questions]
+            matrix = vectorizer.fit_transform(token_lists).tocsr()
+            postings = matrix.T.tocsr()
+        else:
+            vectorizer.fit([self.tokenizer("What is finance?")])
+
+        # Swap everything in one assignment so concurrent searches never see
+        # a vectorizer from one build and a matrix from another
+        self._state = (questions, answers, vectorizer, matrix, postings)
+        self.version += 1
+
+    @classmethod
+    def from_arrays(cls, questions: List[str], answers: List[Any], vocabulary: List[str], idf: np.ndarray,
+                    matrix, postings, tokenizer: Callable[[str], List[str]], top_k: int = 5,
+                    batch_tokenizer: Optional[Callable[[List[str]], List[List[str]]]] = None,
+                    version: int = 1) -> "KnowledgeBaseIndex":
+        """Restore an index from exported arrays without re-fitting (see chatbot_artifact)."""
+        index = cls.__new__(cls)
+        index.tokenizer = tokenizer
+        index.batch_tokenizer = batch_tokenizer
+        index.top_k = top_k
+        index.version = version
+
+        vectorizer = TfidfVectorizer(analyzer=_identity_analyzer, norm="l2")
+        vectorizer.vocabulary_ = {term: i for i, term in enumerate(vocabulary)}
+        vectorizer.idf_ = idf
+        index._state = (list(questions), list(answers), vectorizer, matrix, postings)
+        return index
+
+    def export(self) -> Dict[str, Any]:
+        """Everything needed by from_arrays(), with the vocabulary in column order."""
+        questions, answers, vectorizer, matrix, postings = self._state
+        vocabulary = [""] * len(vectorizer.vocabulary_)
+        for term, i in vectorizer.vocabulary_.items():
+            vocabulary[i] = term
+        return {
+            "questions": questions,
+            "answers": answers,
+            "vocabulary": vocabulary,
+            "idf": vectorizer.idf_,
+            "matrix": matrix,
+            "postings": postings,
+        }
+
+    @property
+    def vectorizer(self) -> TfidfVectorizer:
+        return self._state[2]
+
+    @property
+    def matrix(self):
+        """L2-normalized question vectors, one row per KB question."""
+        return self._state[3]
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def _tokens(self, query: Query) -> Sequence[str]:
+        return self.tokenizer(query) if isinstance(query, str) else query
+
+    def search(self, query: Query, k: Optional[int] = None) -> List[Tuple[str, Any, float]]:
+        """Return up to k (question, answer, score) tuples, best match first."""
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries: Sequence[Query], k: Optional[int] = None) -> List[List[Tuple[str, Any, float]]]:
+        """Score several queries with a single sparse matrix multiply."""
+        questions, answers, vectorizer, _, postings = self._state
+        k = k or self.top_k
+        if postings is None or not queries:
+            return [[] for _ in queries]
+
+        query_vecs = vectorizer.transform([self._tokens(q) for q in queries])
+        scores = (query_vecs @ postings).tocsr()
+
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data = scores.data[start:end]
+            idx = scores.indices[start:end]
+            results.append([(questions[i], answers[i], float(s)) for i, s in self._top_k(data, idx, k)])
+        return results
+
+    @staticmethod
+    def _top_k(data: np.ndarray, idx: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top-k (index, score) pairs; ties go to the earlier KB entry."""
+        nonzero = data > 0
+        data, idx = data[nonzero], idx[nonzero]
+        if data.size == 0:
+            return []
+        if data.size > k:
+            # Keep everything that ties with the k-th best score so the
+            # ordering below stays deterministic
+            kth = np.partition(data, data.size - k)[data.size - k]
+            keep = data >= kth
+            data, idx = data[keep], idx[keep]
+        order = np.lexsort((idx, -data))[:k]
+        return [(int(idx[i]), data[i]) for i in order]
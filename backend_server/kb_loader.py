@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Knowledge base content loaded from external files.
+
+The chatbot ships with its knowledge base, knowledge graph and financial
+terms as dict literals in simple_chatbot.py. CHATBOT_KB_PATH points it at an
+external file instead, which it loads in the background and reloads when
+the file changes, without a redeploy:
+
+- JSON (.json) or YAML (.yaml/.yml) with the sections below
+- SQLite (.db/.sqlite), see SQLITE_SCHEMA; suited to large knowledge bases
+- a directory of such files: the one named in its CURRENT file, otherwise
+  the last one by name (e.g. kb-2025-01-15.json)
+
+    {
+      "version": "2025-01-15",
+      "knowledge_base": {"what is sip": "SIP (Systematic Investment Plan) is ..."},
+      "knowledge_graph": {"investments": {"stocks": {"definition": "..."}}},
+      "financial_terms": {"SIP": "Systematic Investment Plan - ..."},
+      "glossary": {"Budget": "A plan for your income and expenses ..."}
+    }
+
+Missing sections keep the built-in content. financial_terms are matched in
+messages and listed by "what terms do you know"; glossary holds further
+definitions for get_definition.
+
+To start from the built-in content:
+
+    python kb_loader.py export knowledge_base.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+SECTIONS = ("knowledge_base", "knowledge_graph", "financial_terms", "glossary")
+FILE_EXTENSIONS = {".json": "json", ".yaml": "yaml", ".yml": "yaml", ".db": "sqlite", ".sqlite": "sqlite"}
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS knowledge_base (position INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS terms (position INTEGER PRIMARY KEY, kind TEXT NOT NULL, term TEXT NOT NULL, definition TEXT NOT NULL);
+"""
+# Rows are fetched in chunks so a large table is never materialized twice
+SQLITE_FETCH_SIZE = 1000
+
+
+class KnowledgeContent:
+    """The knowledge base, knowledge graph and term dictionaries the chatbot answers from."""
+
+    def __init__(self, knowledge_base: Dict[str, Any], knowledge_graph: Dict[str, Any],
+                 financial_terms: Dict[str, str], glossary: Optional[Dict[str, str]] = None,
+                 version: Optional[str] = None, source: str = "builtin"):
+        self.knowledge_base = knowledge_base
+        self.knowledge_graph = knowledge_graph
+        self.financial_terms = financial_terms
+        self.glossary = glossary if glossary is not None else financial_terms
+        self.source = source
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [knowledge_base, knowledge_graph, financial_terms, self.glossary], sort_keys=True, default=str,
+        ).encode("utf-8")).hexdigest()
+        self.version = version or self.fingerprint[:12]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], defaults: "KnowledgeContent", source: str) -> "KnowledgeContent":
+        if not isinstance(data, dict):
+            raise ValueError(f"{source}: expected a mapping with {', '.join(SECTIONS)}")
+        sections = {}
+        for section in SECTIONS:
+            value = data.get(section)
+            if value is not None and not isinstance(value, dict):
+                raise ValueError(f"{source}: '{section}' must be a mapping")
+            sections[section] = value if value is not None else getattr(defaults, section)
+        return cls(version=str(data["version"]) if data.get("version") is not None else None,
+                   source=source, **sections)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, **{section: getattr(self, section) for section in SECTIONS}}
+
+    def __len__(self) -> int:
+        return len(self.knowledge_base)
+
+
+class KnowledgeSnapshot:
+    """One immutable generation of the chatbot's knowledge and the indexes built from it.
+
+    A reload builds a complete new snapshot and swaps it in with a single
+    assignment; requests that started on the old snapshot finish on it.
+    """
+
+    def __init__(self, version: int, content: KnowledgeContent, kb_index, term_index, matcher):
+        # Monotonic across reloads; the response cache is keyed on it
+        self.version = version
+        self.content = content
+        self.kb_index = kb_index
+        self.term_index = term_index
+        self.matcher = matcher
+
+
+def resolve_path(path: str) -> str:
+    """The knowledge base file to load for a file or versioned directory path."""
+    if not os.path.isdir(path):
+        return path
+    current = os.path.join(path, "CURRENT")
+    if os.path.exists(current):
+        with open(current, encoding="utf-8") as f:
+            return os.path.join(path, f.read().strip())
+    names = sorted(name for name in os.listdir(path)
+                   if os.path.splitext(name)[1].lower() in FILE_EXTENSIONS and not name.startswith("."))
+    if not names:
+        raise FileNotFoundError(f"No knowledge base files in {path}")
+    return os.path.join(path, names[-1])
+
+
+def file_signature(path: str) -> Tuple[str, float, int]:
+    """Cheap change check: which file, when it was modified and how big it is."""
+    resolved = resolve_path(path)
+    stat = os.stat(resolved)
+    return resolved, stat.st_mtime, stat.st_size
+
+
+def _file_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FILE_EXTENSIONS:
+        raise ValueError(f"Unsupported knowledge base file {path}; use one of {', '.join(FILE_EXTENSIONS)}")
+    return FILE_EXTENSIONS[extension]
+
+
+def load_knowledge(path: str, defaults: KnowledgeContent) -> KnowledgeContent:
+    """Read a knowledge base file (or the current file of a directory)."""
+    path = resolve_path(path)
+    file_format = _file_format(path)
+    if file_format == "sqlite":
+        return _load_sqlite(path, defaults)
+    with open(path, encoding="utf-8") as f:
+        if file_format == "yaml":
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to load YAML knowledge bases")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    return KnowledgeContent.from_dict(data, defaults, path)
+
+
+def _rows(connection: sqlite3.Connection, query: str) -> Iterator[tuple]:
+    cursor = connection.execute(query)
+    while True:
+        rows = cursor.fetchmany(SQLITE_FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def _load_sqlite(path: str, defaults: KnowledgeContent) -> KnowledgeContent:
+    # Read-only, so a half-written file is never created or modified
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        metadata = dict(_rows(connection, "SELECT key, value FROM metadata"))
+        data: Dict[str, Any] = {"version": metadata.get("version")}
+        if metadata.get("knowledge_graph"):
+            data["knowledge_graph"] = json.loads(metadata["knowledge_graph"])
+        knowledge_base = dict(_rows(connection, "SELECT question, answer FROM knowledge_base ORDER BY position"))
+        if knowledge_base:
+            data["knowledge_base"] = knowledge_base
+        for kind, term, definition in _rows(connection, "SELECT kind, term, definition FROM terms ORDER BY position"):
+            if kind not in ("financial_terms", "glossary"):
+                raise ValueError(f"{path}: unknown term kind '{kind}'")
+            data.setdefault(kind, {})[term] = definition
+    finally:
+        connection.close()
+    return KnowledgeContent.from_dict(data, defaults, path)
+
+
+def write_knowledge(content: KnowledgeContent, path: str) -> None:
+    """Write content as JSON, YAML or SQLite, by the extension of path."""
+    file_format = _file_format(path)
+    if any(callable(answer) for answer in content.knowledge_base.values()):
+        raise ValueError("Knowledge base answers must be plain strings to be written to a file")
+    staging = f"{path}.tmp"
+    if file_format == "sqlite":
+        if os.path.exists(staging):
+            os.remove(staging)
+        connection = sqlite3.connect(staging)
+        try:
+            connection.executescript(SQLITE_SCHEMA)
+            connection.executemany("INSERT INTO metadata VALUES (?, ?)", [
+                ("version", content.version),
+                ("knowledge_graph", json.dumps(content.knowledge_graph, ensure_ascii=False)),
+            ])
+            connection.executemany("INSERT INTO knowledge_base VALUES (?, ?, ?)",
+                                   ((i, q, a) for i, (q, a) in enumerate(content.knowledge_base.items())))
+            terms = [("financial_terms", term, definition) for term, definition in content.financial_terms.items()]
+            terms += [("glossary", term, definition) for term, definition in content.glossary.items()]
+            connection.executemany("INSERT INTO terms VALUES (?, ?, ?, ?)",
+                                   ((i,) + row for i, row in enumerate(terms)))
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        with open(staging, "w", encoding="utf-8") as f:
+            if file_format == "yaml":
+                import yaml
+                yaml.safe_dump(content.to_dict(), f, allow_unicode=True, sort_keys=False)
+            else:
+                json.dump(content.to_dict(), f, ensure_ascii=False, indent=2)
+    # Readers polling the path never see a partially written file
+    os.replace(staging, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the chatbot's built-in knowledge base to a file")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export = subcommands.add_parser("export", help="Write the built-in knowledge base as JSON, YAML or SQLite")
+    export.add_argument("path", help="Output file (.json, .yaml, .yml, .db or .sqlite)")
+    export.add_argument("--version", help="Version label stored in the file")
+    args = parser.parse_args()
+
+    from simple_chatbot import builtin_knowledge
+    content = builtin_knowledge()
+    if args.version:
+        content.version = args.version
+    try:
+        write_knowledge(content, args.path)
+    except (ValueError, OSError) as e:
+        print(f"❌ Error writing knowledge base: {e}")
+        return False
+    print(f"✅ Wrote {len(content)} KB entries, {len(content.financial_terms)} terms to {args.path} (version {content.version})")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
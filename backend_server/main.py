@@ -1,10 +1,15 @@
 # Standard library imports
+import asyncio
+import json
+import os
+from contextlib import contextmanager
 from datetime import date, datetime
 from typing import Optional, List
 
 # Third-party imports
 from fastapi import Body, FastAPI, Depends, HTTPException, status, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 import uvicorn
 from passlib.context import CryptContext
@@ -13,11 +18,14 @@ from database import SessionLocal, engine, get_db
 from models import User, ServiceRequest, LoanRequest, LoanStatus
 from schemas import UserOut, UserShort, ServiceRequestCreate, ServiceRequestOut, LoanRequestCreate, LoanRequestOut, LoanStatusCreate, LoanStatusOut
 from file_upload import router as upload_router
-from chat1 import chat_router
+from chat1 import chat_broker, chat_router, message_writer, notification_outbox
 from password_router import password_router
+from calculator_router import calculator_router
 from fcm_utils import send_fcm_v1_notification
 from financial_report import router as financial_report_router
-from simple_chatbot import AdvancedFinancialChatbot
+from chatbot_service import ChatbotBatchTooLarge, ChatbotBusy, ChatbotInputError, ChatbotService, ChatbotNotReady
+from chatbot_metrics import render_latest
+from profile_cache import ProfileCache
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
@@ -27,10 +35,65 @@ app = FastAPI()
 app.include_router(upload_router)
 app.include_router(chat_router)
 app.include_router(password_router)
+app.include_router(calculator_router)
 app.include_router(financial_report_router)
 
-# Initialize the financial chatbot
-financial_chatbot = AdvancedFinancialChatbot()
+# The financial chatbot warms up in the background so that importing this
+# module (and every other route) is not blocked by spaCy/sklearn start-up.
+# Set CHATBOT_WARMUP=lazy to defer it to the first /chatbot request.
+financial_chatbot = ChatbotService()
+
+# Clients' FinancialData rows and summaries for personalized chatbot advice,
+# read once per client instead of once per message
+financial_profiles = ProfileCache(ttl_seconds=float(os.getenv("CHATBOT_PROFILE_TTL_SECONDS", 300)))
+
+# Under gunicorn (gunicorn.conf.py) the chatbot is built in the master before
+# fork so that every worker shares the same copy-on-write pages
+if os.getenv("CHATBOT_PRELOAD") == "1":
+    financial_chatbot.preload()
+
+@app.on_event("startup")
+def start_chatbot_warmup():
+    if os.getenv("CHATBOT_WARMUP", "background").lower() != "lazy":
+        financial_chatbot.start_warmup()
+
+@app.on_event("shutdown")
+async def flush_chat_messages():
+    # Save chat messages still queued in the write-behind writer
+    await message_writer.close()
+    await chat_broker.close()
+    await notification_outbox.close()
+
+async def call_chatbot(method: str, *args):
+    """Run a chatbot method on its inference pool (see chatbot_service.py)."""
+    with chatbot_http_errors():
+        return await financial_chatbot.call(method, *args)
+
+@contextmanager
+def chatbot_http_errors():
+    """Map chatbot service errors to HTTP responses."""
+    try:
+        yield
+    except ChatbotNotReady as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Chatbot is {e.state}, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ChatbotBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Chatbot is busy, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ChatbotBatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Chatbot took too long to respond")
+    except ChatbotInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -42,6 +105,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Chat history cursors (see chat_history.py)
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor"],
 )
 
 # Dependency to get DB session
@@ -550,6 +615,7 @@ from financial_schemas import FinancialDataCreate, FinancialDataOut, FinancialSu
 def save_financial_data(client_id: int, financial_data: FinancialDataCreate):
     try:
         result = create_or_update_financial_data(client_id, financial_data.dict())
+        financial_profiles.invalidate(client_id)
         if result:
             return {"message": "Financial data saved successfully", "data": result}
         else:
@@ -580,20 +646,101 @@ def get_financial_summary(client_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/chatbot/status")
+def get_chatbot_status():
+    """
+    Readiness of the financial chatbot (not_started, warming, ready or failed).
+    """
+    return financial_chatbot.status()
+
+@app.get("/chatbot/stats")
+async def get_chatbot_stats():
+    """
+    Context store and market data cache statistics (hit ratio, provider latency).
+    In process execution mode these are the stats of the pool worker that answered.
+    """
+    stats = await call_chatbot("stats")
+    stats["profiles"] = financial_profiles.stats()
+    return stats
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics of this worker.
+    """
+    metrics = render_latest()
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="prometheus_client is not installed")
+    body, content_type = metrics
+    return Response(content=body, media_type=content_type)
+
 @app.post("/chatbot")
-def chat_with_financial_assistant(
+async def chat_with_financial_assistant(
     message: str = Body(..., embed=True),
-    client_id: int = Body(..., embed=True)
+    client_id: int = Body(..., embed=True),
+    debug: bool = Body(False, embed=True)
 ):
     """
     Financial chatbot endpoint that provides personalized financial advice.
+    With debug=true the response also carries the time spent in each stage
+    and the handler that answered (see chatbot_profiling.py).
     """
-    try:
-        # Generate response using the chatbot
-        response = financial_chatbot.generate_response(message, client_id)
-        return {"response": response}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
+    profile = await asyncio.to_thread(financial_profiles.get, client_id)
+    if debug:
+        return await call_chatbot("generate_response_debug", message, client_id, profile)
+    # Generate response using the chatbot
+    response = await call_chatbot("generate_response", message, client_id, profile)
+    return {"response": response}
+
+@app.post("/chatbot/batch")
+async def chat_with_financial_assistant_batch(
+    messages: List[str] = Body(..., embed=True),
+    client_ids: List[int] = Body(..., embed=True)
+):
+    """
+    Answer several chatbot messages in one call (bulk QA replays, messages
+    queued by the mobile app while offline). Responses keep the input order.
+    """
+    # Rejected before any profile is loaded
+    with chatbot_http_errors():
+        financial_chatbot.check_batch(messages, client_ids)
+    profiles = await asyncio.to_thread(lambda: {client_id: financial_profiles.get(client_id) for client_id in set(client_ids)})
+    with chatbot_http_errors():
+        responses = await financial_chatbot.generate_responses(messages, client_ids,
+                                                               [profiles[client_id] for client_id in client_ids])
+    return {"responses": responses}
+
+@app.post("/chatbot/stream")
+async def stream_financial_assistant(
+    message: str = Body(..., embed=True),
+    client_id: int = Body(..., embed=True)
+):
+    """
+    Streaming variant of /chatbot as Server-Sent Events. Long personalized
+    answers arrive section by section; the text of all `data` events
+    concatenated equals the /chatbot response. The stream ends with an
+    `end` event, or an `error` event if the answer cannot be finished.
+    """
+    profile = await asyncio.to_thread(financial_profiles.get, client_id)
+    chunks = financial_chatbot.stream("generate_response_stream", message, client_id, profile)
+    # Wait for the first chunk here so that a busy or warming chatbot still gets a proper status code
+    with chatbot_http_errors():
+        first = await chunks.__anext__()
+
+    async def events():
+        try:
+            yield f"data: {json.dumps({'text': first})}\n\n"
+            async for chunk in chunks:
+                yield f"data: {json.dumps({'text': chunk})}\n\n"
+            yield "event: end\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Chatbot stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Chatbot could not finish the response'})}\n\n"
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,240 @@
+"""
+Cached market-data layer for the financial chatbot.
+
+Stock questions used to call yfinance synchronously on every request. A
+MarketDataCache now sits in front of a pluggable provider:
+
+- quotes ("1d" history) are cached for 60s and the 1y history for a day
+- failed or empty lookups are cached briefly so a bad ticker is not retried per request
+- concurrent requests for the same ticker share a single upstream call
+- prefetch() fetches the misses of a whole batch in one provider call
+
+Providers:
+- YFinanceProvider: live data from Yahoo Finance
+- FileMarketDataProvider: <TICKER>.csv files, for offline tests and demos
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from chatbot_metrics import counter, histogram
+
+MARKET_DATA_REQUESTS = counter(
+    "chatbot_market_data_requests_total",
+    "Market data lookups by cache result (hit, miss, coalesced, error)",
+    ["result"],
+)
+MARKET_DATA_LATENCY = histogram(
+    "chatbot_market_data_provider_seconds",
+    "Latency of upstream market data provider calls",
+    ["provider"],
+)
+
+# Approximate calendar length of the yfinance period strings
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827}
+
+
+class MarketDataProvider(ABC):
+    name = "base"
+
+    @abstractmethod
+    def get_history(self, ticker: str, period: str) -> Optional[pd.DataFrame]:
+        """Daily history with at least Close and Volume columns, oldest row first."""
+
+    def get_histories(self, tickers: List[str], period: str) -> Dict[str, Optional[pd.DataFrame]]:
+        """Histories of several tickers; providers with a bulk API override this."""
+        return {ticker: self.get_history(ticker, period) for ticker in tickers}
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+
+    def get_history(self, ticker: str, period: str) -> Optional[pd.DataFrame]:
+        import yfinance as yf
+        return yf.Ticker(ticker).history(period=period, timeout=self.timeout)
+
+    def get_histories(self, tickers: List[str], period: str) -> Dict[str, Optional[pd.DataFrame]]:
+        if len(tickers) == 1:
+            return {tickers[0]: self.get_history(tickers[0], period)}
+        import yfinance as yf
+        data = yf.download(tickers, period=period, group_by="ticker", progress=False, timeout=self.timeout)
+        histories = {}
+        for ticker in tickers:
+            if isinstance(data.columns, pd.MultiIndex) and ticker in data.columns.get_level_values(0):
+                histories[ticker] = data[ticker].dropna(how="all")
+            else:
+                histories[ticker] = None
+        return histories
+
+
+class FileMarketDataProvider(MarketDataProvider):
+    """Reads <directory>/<TICKER>.csv files with Date, Close and Volume columns."""
+
+    name = "file"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get_history(self, ticker: str, period: str) -> Optional[pd.DataFrame]:
+        path = os.path.join(self.directory, f"{ticker.upper()}.csv")
+        if not os.path.exists(path):
+            return None
+        history = pd.read_csv(path, parse_dates=["Date"], index_col="Date").sort_index()
+        if history.empty or period not in PERIOD_DAYS:
+            return history
+        if period == "1d":
+            return history.tail(1)
+        cutoff = history.index[-1] - pd.Timedelta(days=PERIOD_DAYS[period])
+        return history[history.index > cutoff]
+
+
+class _Inflight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[pd.DataFrame] = None
+
+
+class MarketDataCache:
+    DEFAULT_TTLS = {"1d": 60, "1y": 24 * 3600}
+
+    def __init__(self, provider: MarketDataProvider, ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = 300, negative_ttl: float = 30, max_entries: int = 1024):
+        self.provider = provider
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[pd.DataFrame]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], _Inflight] = {}
+        self._lock = threading.Lock()
+        self._counts = {"hit": 0, "miss": 0, "coalesced": 0, "error": 0}
+        self._provider_calls = 0
+        self._provider_seconds = 0.0
+
+    def get_history(self, ticker: str, period: str) -> Optional[pd.DataFrame]:
+        """Cached history of a ticker, or None when the provider has no data for it."""
+        key = (ticker.upper(), period)
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                self._record("hit")
+                return cached[1]
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight[key] = _Inflight()
+                self._record("miss")
+            else:
+                self._record("coalesced")
+
+        if not leader:
+            inflight.event.wait()
+            return inflight.result
+
+        try:
+            result = self._fetch(lambda: self.provider.get_history(key[0], period))
+            self._store(key, result)
+        except Exception as e:
+            print(f"Error getting market data for {key[0]}: {e}")
+            with self._lock:
+                self._record("error")
+            result = None
+            self._store(key, None)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        inflight.result = result
+        inflight.event.set()
+        return result
+
+    def prefetch(self, tickers: Iterable[str], period: str) -> None:
+        """Fetch every uncached ticker of a batch with a single provider call."""
+        with self._lock:
+            missing = sorted({
+                ticker.upper() for ticker in tickers
+                if self._lookup((ticker.upper(), period)) is None and (ticker.upper(), period) not in self._inflight
+            })
+        if not missing:
+            return
+        try:
+            histories = self._fetch(lambda: self.provider.get_histories(missing, period))
+        except Exception as e:
+            print(f"Error prefetching market data: {e}")
+            with self._lock:
+                self._record("error")
+            return
+        for ticker in missing:
+            self._store((ticker, period), histories.get(ticker))
+
+    def _fetch(self, call):
+        started = time.perf_counter()
+        try:
+            return call()
+        finally:
+            elapsed = time.perf_counter() - started
+            MARKET_DATA_LATENCY.labels(self.provider.name).observe(elapsed)
+            with self._lock:
+                self._provider_calls += 1
+                self._provider_seconds += elapsed
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[Tuple[float, Optional[pd.DataFrame]]]:
+        # Caller holds the lock; returns the (expires_at, value) entry if still fresh
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Tuple[str, str], history: Optional[pd.DataFrame]) -> None:
+        if history is not None and history.empty:
+            history = None
+        ttl = self.ttls.get(key[1], self.default_ttl) if history is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, history)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _record(self, result: str) -> None:
+        # Caller holds the lock
+        self._counts[result] += 1
+        MARKET_DATA_REQUESTS.labels(result).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counts["hit"] + self._counts["miss"] + self._counts["coalesced"]
+            return {
+                "provider": self.provider.name,
+                "entries": len(self._entries),
+                **self._counts,
+                "hit_ratio": self._counts["hit"] / lookups if lookups else None,
+                "provider_calls": self._provider_calls,
+                "provider_avg_ms": self._provider_seconds / self._provider_calls * 1000 if self._provider_calls else None,
+            }
+
+
+def create_market_data() -> MarketDataCache:
+    """Build the cache and provider selected by CHATBOT_MARKET_DATA_* environment variables."""
+    if os.getenv("CHATBOT_MARKET_DATA", "yfinance").lower() == "file":
+        provider = FileMarketDataProvider(os.getenv("CHATBOT_MARKET_DATA_DIR", "market_data"))
+    else:
+        provider = YFinanceProvider(timeout=float(os.getenv("CHATBOT_MARKET_DATA_TIMEOUT", 10)))
+    return MarketDataCache(
+        provider,
+        ttls={
+            "1d": float(os.getenv("CHATBOT_QUOTE_TTL_SECONDS", 60)),
+            "1y": float(os.getenv("CHATBOT_HISTORY_TTL_SECONDS", 24 * 3600)),
+        },
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date,ForeignKey,DateTime, Enum,Boolean, Text, Float
+from sqlalchemy import Column, Integer, String, Date,ForeignKey,DateTime, Enum,Boolean, Text, Float, Index, UniqueConstraint
 from database import Base
 from datetime import datetime,timezone
 from sqlalchemy.orm import relationship
@@ -62,6 +62,33 @@ class Message(Base):
     receiver_id = Column(Integer)
     message = Column(String)
     timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # "<smaller user id>:<larger user id>", see chat_history.py
+    conversation_key = Column(String(64))
+
+    # Pages of a conversation's history are a range scan of this index
+    __table_args__ = (
+        Index("ix_messages_conversation_timestamp_id", "conversation_key", "timestamp", "id"),
+    )
+
+class Conversation(Base):
+    """A user's inbox entry for one counterpart, kept up to date as messages are stored."""
+    __tablename__ = "conversations"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    counterpart_id = Column(Integer, nullable=False)
+    last_message_id = Column(Integer)
+    last_sender_id = Column(Integer)
+    last_message = Column(String)  # First PREVIEW_CHARS characters (see chat_history.py)
+    last_timestamp = Column(DateTime(timezone=True))
+    unread_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "counterpart_id", name="uq_conversations_user_counterpart"),
+        # The inbox lists a user's conversations, most recent first; with id as the
+        # tie-breaker of the keyset, a page is a single index range scan
+        Index("ix_conversations_user_last_timestamp_id", "user_id", "last_timestamp", "id"),
+    )
 
 class LoanRequest(Base):
     __tablename__ = "loan_requests"
@@ -0,0 +1,133 @@
+"""
+Asynchronous outbox for chat push notifications.
+
+Notifying an offline receiver means two user lookups and an HTTPS request to
+FCM, all blocking. NotificationOutbox.notify() only records the notification
+and returns, so a slow or failing push service never delays the sender:
+
+- Coalescing: messages from one sender to one receiver that arrive within
+  coalesce_seconds become a single push ("3 new messages from X")
+- Concurrency: `concurrency` workers send pushes, each in a thread, so a
+  burst cannot take every thread of the worker's default pool
+- Retries: failures are retried with exponential backoff, up to max_attempts,
+  unless the error has retryable = False (e.g. an unregistered token)
+- Bounded: past max_pending waiting notifications, new ones are dropped
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+class PendingNotification:
+    __slots__ = ("receiver_id", "sender_id", "message", "count", "attempts")
+
+    def __init__(self, receiver_id: int, sender_id: int, message: str):
+        self.receiver_id = receiver_id
+        self.sender_id = sender_id
+        self.message = message
+        self.count = 1
+        self.attempts = 0
+
+
+class NotificationOutbox:
+    def __init__(self, send: Callable[[int, int, str, int], Any], concurrency: int = 4,
+                 coalesce_seconds: float = 1.0, max_attempts: int = 4,
+                 retry_seconds: float = 2.0, max_pending: int = 10000):
+        # send(receiver_id, sender_id, latest_message, message_count) is blocking and raises on failure
+        self.send = send
+        self.concurrency = concurrency
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_pending = max_pending
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        # Notifications still collecting messages, by (receiver, sender)
+        self._pending: Dict[Tuple[int, int], PendingNotification] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Notifications waiting out their coalescing window or retry backoff
+        self._timers: Set[asyncio.TimerHandle] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._pending.clear()
+            self._timers = set()
+            self._workers = []
+        if not self._workers:
+            self._workers = [loop.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def _schedule(self, delay: float, notification: PendingNotification) -> None:
+        def release():
+            self._timers.discard(timer)
+            self._queue.put_nowait(notification)
+
+        timer = self._loop.call_later(delay, release)
+        self._timers.add(timer)
+
+    def notify(self, receiver_id: int, sender_id: int, message: str) -> None:
+        """Queue a push for a message to an offline receiver; never blocks."""
+        self._ensure_started()
+        key = (receiver_id, sender_id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.count += 1
+            pending.message = message
+            self.coalesced += 1
+            return
+        if len(self._timers) + self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        pending = self._pending[key] = PendingNotification(receiver_id, sender_id, message)
+        self._schedule(self.coalesce_seconds, pending)
+
+    async def _work(self) -> None:
+        while True:
+            notification = await self._queue.get()
+            key = (notification.receiver_id, notification.sender_id)
+            # Messages arriving from now on start a new notification
+            if self._pending.get(key) is notification:
+                del self._pending[key]
+            notification.attempts += 1
+            try:
+                await asyncio.to_thread(self.send, notification.receiver_id, notification.sender_id,
+                                        notification.message, notification.count)
+                self.sent += 1
+            except Exception as e:
+                if getattr(e, "retryable", True) and notification.attempts < self.max_attempts:
+                    self.retried += 1
+                    self._schedule(self.retry_seconds * 2 ** (notification.attempts - 1), notification)
+                else:
+                    self.failed += 1
+                    print(f"Giving up on chat notification to user {notification.receiver_id} "
+                          f"after {notification.attempts} attempts: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self) -> None:
+        unsent = len(self._timers) + (self._queue.qsize() if self._queue is not None else 0)
+        for timer in self._timers:
+            timer.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        self._timers, self._workers = set(), []
+        if unsent:
+            print(f"Notification outbox closed with up to {unsent} notifications unsent")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": len(self._timers),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,85 @@
+"""
+Per-client financial profile cache for the chatbot's personalized advice.
+
+A profile is the client's FinancialData row plus its computed summary. The
+API loads it once per client and hands it to the chatbot with each message,
+so a conversation of many turns costs one database read, and the chatbot
+itself stays free of database access.
+
+Entries live in a ContextStore, so with CHATBOT_CONTEXT_BACKEND=redis all
+API workers share them and an invalidation after /financial-data/{client_id}
+is saved reaches every worker. With the in-memory store, other workers see
+the change after at most ttl_seconds.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from context_store import ContextStore, create_context_store
+
+PROFILE_NAMESPACE = "profile"
+
+
+def load_financial_profile(client_id: int) -> Optional[Dict[str, Any]]:
+    """Read a client's FinancialData row and compute its summary."""
+    from financial_crud import calculate_financial_summary, get_financial_data
+
+    row = get_financial_data(client_id)
+    if not row:
+        return None
+    # Drop SQLAlchemy's instance state so the profile can be stored and pickled
+    data = {key: value for key, value in row.items() if not key.startswith("_")}
+    return {"data": data, "summary": calculate_financial_summary(data)}
+
+
+class ProfileCache:
+    def __init__(self, loader: Callable[[int], Optional[Dict[str, Any]]] = load_financial_profile,
+                 store: Optional[ContextStore] = None, ttl_seconds: float = 300, negative_ttl_seconds: float = 60):
+        self.loader = loader
+        self.store = store or create_context_store()
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def get(self, client_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """The client's profile ({"data", "summary"}), or None if they have none."""
+        if not client_id:
+            return None
+        entry = self.store.get(PROFILE_NAMESPACE, client_id)
+        if entry is not None:
+            ttl = self.ttl_seconds if entry["profile"] is not None else self.negative_ttl_seconds
+            if time.time() - entry["loaded_at"] < ttl:
+                self._count("hits")
+                return entry["profile"]
+
+        self._count("misses")
+        try:
+            profile = self.loader(client_id)
+        except Exception as e:
+            # Personalization is optional; answer without it rather than fail the message
+            print(f"Error loading financial profile for client {client_id}: {e}")
+            self._count("errors")
+            return None
+        self.store.set(PROFILE_NAMESPACE, client_id, {"loaded_at": time.time(), "profile": profile})
+        return profile
+
+    def invalidate(self, client_id: int) -> None:
+        self.store.delete(PROFILE_NAMESPACE, client_id)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_ratio": self.hits / lookups if lookups else None,
+            }
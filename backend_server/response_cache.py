@@ -0,0 +1,85 @@
+"""
+LRU cache of deterministic chatbot answers.
+
+Most /chatbot traffic repeats a small set of general questions whose answers
+only depend on the message. AdvancedFinancialChatbot looks the message up
+here before parsing it, so a hit skips spaCy, the intent router and the KB
+search entirely.
+
+Only answers that are a pure function of the message are stored. Randomized
+greetings and fallbacks, market data and personalized advice never are. The
+whole cache is dropped when the knowledge base version changes.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class CachedResponse:
+    def __init__(self, response: str, after_personalization: bool,
+                 financial_focus: Optional[str] = None, risk_profile: Optional[str] = None):
+        self.response = response
+        # Answered by a stage that runs after personalized advice (KB, general
+        # answers); only valid for requests that would skip personalization
+        self.after_personalization = after_personalization
+        # Context signals of the message, applied to the client's context on a hit
+        self.financial_focus = financial_focus
+        self.risk_profile = risk_profile
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Any) -> Optional[CachedResponse]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def record(self, hit: bool) -> None:
+        """Count a lookup; callers may still reject an entry they got back."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key: Hashable, version: Any, entry: CachedResponse) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _check_version(self, version: Any) -> None:
+        # Caller holds the lock
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+            }
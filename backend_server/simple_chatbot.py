@@ -1,37 +1,106 @@
 
 # --- Enhanced Financial Chatbot Implementation ---
+import functools
 import re
+from contextlib import contextmanager
 import random
 import json
-from typing import Dict, List, Optional, Any, Tuple
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
-# Note: Database functionality temporarily disabled for chatbot independence
-# from financial_crud import get_financial_data_supabase, calculate_financial_summary
-# from financial_schemas import RiskTolerance
-get_financial_data_supabase = None
-calculate_financial_summary = None
-RiskTolerance = None
+import os
+from chatbot_artifact import DEFAULT_ARTIFACT_DIR, kb_fingerprint, load_artifact
+from context_store import ContextStore, create_context_store
+from market_data import MarketDataCache, create_market_data
+from intent_router import INTENT_LATENCY, SMALL_TALK_INTENTS, IntentRouter
+from term_index import TermIndex
+from response_cache import CachedResponse, ResponseCache
+from kb_loader import KnowledgeContent, KnowledgeSnapshot, file_signature, load_knowledge
+from chatbot_profiling import profiling_enabled, set_handler, stage, trace_message
+from chatbot_service import ChatbotInputError
+from financial_calculator import amortization_schedule, future_value, present_value, sip_schedule
+# The chatbot does not access the database itself: personalized advice uses the
+# financial profile ({"data": FinancialData row, "summary": ...}) that the API
+# passes in, loaded through profile_cache.ProfileCache
 
 # Enhanced NLP and financial analysis capabilities
 try:
     import spacy
     from spacy.matcher import PhraseMatcher
-    from fuzzywuzzy import process
     import yfinance as yf
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    from kb_index import KnowledgeBaseIndex
+    from embedding_index import EmbeddingIndex, create_encoder
+    from chatbot_nlp import AnalyzedMessage, analyze_message, analyze_messages, doc_tokens, load_pipeline
+    from spacy.tokens import Doc
     import nltk
     from nltk.corpus import stopwords
     from nltk.stem import WordNetLemmatizer
-    nltk.download(['stopwords', 'wordnet', 'punkt'])
 except ImportError as e:
     print(f"Import error: {e}. Some features may be limited.")
     spacy = None
-    process = None
     yf = None
 
+# Answer sources whose responses only depend on the message (see response_cache.py);
+# greetings, fallbacks, market data and personalized advice are never cached
+CACHEABLE_SOURCES = {
+    "gratitude", "farewell", "term", "future_value", "present_value", "emi", "sip",
+    "definition", "comparison", "strategy", "knowledge_base", "general", "fuzzy",
+}
+POST_PERSONALIZATION_SOURCES = {"knowledge_base", "general", "fuzzy"}
+# Answer to a batch message that failed, so that the rest of the batch is still answered
+BATCH_ERROR_RESPONSE = "I couldn't answer this message. Please try again."
+
+class SectionStream:
+    """An answer produced section by section by a generator.
+
+    str() joins the sections with newlines, which is what the non-streaming
+    endpoints return; chunks() yields the same text piece by piece without
+    ever holding all of it.
+    """
+
+    def __init__(self, sections: Iterator[str]):
+        self.sections = sections
+
+    def chunks(self) -> Iterator[str]:
+        separator = ""
+        for section in self.sections:
+            yield separator + section
+            separator = "\n"
+
+    def __str__(self) -> str:
+        return "\n".join(self.sections)
+
+
+def sectioned(build_sections):
+    """Make a generator of answer sections return a SectionStream."""
+    @functools.wraps(build_sections)
+    def handler(*args, **kwargs) -> SectionStream:
+        return SectionStream(build_sections(*args, **kwargs))
+    return handler
+
+# Context store namespaces for per-client conversation context and financial snapshots
+CONTEXT_NAMESPACE = "context"
+HISTORY_NAMESPACE = "history"
+MAX_HISTORY_SNAPSHOTS = 100
+
+# NLTK datasets used by the chatbot, keyed by their nltk.data lookup path
+NLTK_DATASETS = {
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+    "punkt": "tokenizers/punkt",
+}
+
+def ensure_nltk_data() -> None:
+    """Download NLTK datasets that are not installed yet (see setup_nltk.py)."""
+    for dataset, path in NLTK_DATASETS.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(dataset, quiet=True)
+
 # Financial knowledge base with hierarchical structure
 FINANCIAL_KNOWLEDGE_GRAPH = {
     "investments": {
@@ -58,6 +127,50 @@ FINANCIAL_KNOWLEDGE_GRAPH = {
     }
 }
 
+# Financial terms matched in messages by the PhraseMatcher
+FINANCIAL_TERMS = {
+    "Net Worth": "The total value of your assets minus liabilities. Calculated as: Assets - Liabilities.",
+    "Debt-to-Income Ratio": "Your monthly debt payments divided by your gross monthly income.",
+    "Savings Rate": "The percentage of your income that you're saving each month.",
+    "Emergency Fund": "Savings to cover 3-6 months of living expenses for financial emergencies.",
+    "Asset Allocation": "How your investments are distributed among different asset classes like stocks, bonds, and cash.",
+    "Diversification": "Spreading investments across different assets to reduce risk.",
+    "401(k)": "Employer-sponsored retirement account with tax advantages.",
+    "IRA": "Individual Retirement Account with tax benefits.",
+    "Roth Conversion": "Moving funds from a traditional IRA to a Roth IRA, with tax implications.",
+    "Refinancing": "Replacing an existing loan with a new one, typically to get better terms.",
+    "Amortization": "The process of paying off debt with regular payments over time.",
+    "Tax Deductions": "Expenses that can be subtracted from your income to reduce taxable income.",
+    "Life Insurance": "Policy that pays out to beneficiaries upon the policyholder's death.",
+    "Mutual Fund": "A pooled investment vehicle that collects money from many investors to invest in a diversified portfolio of securities. Managed by professional fund managers.",
+    "SIP": "Systematic Investment Plan - A method of investing in mutual funds where you invest a fixed amount regularly.",
+    "NAV": "Net Asset Value - The per-share value of a mutual fund, calculated by dividing total assets minus liabilities by number of shares.",
+    "Expense Ratio": "The annual fee charged by mutual funds, expressed as a percentage of your investment."
+}
+
+# Glossary used by get_definition (a superset of the terms the PhraseMatcher knows)
+FINANCIAL_TERM_DEFINITIONS = {
+    "Net Worth": "The total value of your assets minus liabilities. Calculated as: Assets - Liabilities.",
+    "Debt-to-Income Ratio": "Your monthly debt payments divided by your gross monthly income.",
+    "Savings Rate": "The percentage of your income that you're saving each month.",
+    "Emergency Fund": "Savings to cover 3-6 months of living expenses for financial emergencies.",
+    "Asset Allocation": "How your investments are distributed among different asset classes like stocks, bonds, and cash.",
+    "Diversification": "Spreading investments across different assets to reduce risk.",
+    "401(k)": "Employer-sponsored retirement account with tax advantages.",
+    "IRA": "Individual Retirement Account with tax benefits.",
+    "Roth Conversion": "Moving funds from a traditional IRA to a Roth IRA, with tax implications.",
+    "Refinancing": "Replacing an existing loan with a new one, typically to get better terms.",
+    "Amortization": "The process of paying off debt with regular payments over time.",
+    "Tax Deductions": "Expenses that can be subtracted from your income to reduce taxable income.",
+    "Life Insurance": "Policy that pays out to beneficiaries upon the policyholder's death.",
+    "Mutual Fund": "A pooled investment vehicle that collects money from many investors to invest in a diversified portfolio of securities. Managed by professional fund managers.",
+    "SIP": "Systematic Investment Plan - A method of investing in mutual funds where you invest a fixed amount regularly.",
+    "NAV": "Net Asset Value - The per-share value of a mutual fund, calculated by dividing total assets minus liabilities by number of shares.",
+    "Expense Ratio": "The annual fee charged by mutual funds, expressed as a percentage of your investment.",
+    "Budget": "A plan for your income and expenses over a specific period, helping you manage money and achieve financial goals.",
+    "Budgeting": "The process of creating a plan to spend your money wisely, tracking income and expenses to ensure you live within your means."
+}
+
 # Expanded general finance Q&A
 GENERAL_FINANCE_KB = {
     "what is a mutual fund": "A mutual fund is a pooled investment vehicle that collects money from many investors to invest in a diversified portfolio of securities like stocks, bonds, and other assets. It's managed by professional fund managers.",
@@ -84,54 +197,78 @@ GENERAL_FINANCE_KB = {
     "budget": "A budget helps you plan and control your spending. Follow the 50/30/20 rule: allocate 50% of income to needs (rent, utilities, groceries), 30% to wants (entertainment, dining), and 20% to savings and debt payment. Track expenses to see where your money goes."
 }
 
+
+def builtin_knowledge() -> KnowledgeContent:
+    """The knowledge base and terms defined in this module."""
+    return KnowledgeContent(GENERAL_FINANCE_KB, FINANCIAL_KNOWLEDGE_GRAPH, FINANCIAL_TERMS,
+                            FINANCIAL_TERM_DEFINITIONS, version="builtin")
+
 class AdvancedFinancialChatbot:
-    def __init__(self):
+    def __init__(self, model_path: Optional[str] = None, use_artifact: bool = True,
+                 context_store: Optional[ContextStore] = None, market_data: Optional[MarketDataCache] = None,
+                 response_cache: Optional[ResponseCache] = None):
         self.greetings = [
             "Hello! I'm your advanced financial assistant. How can I help you today?",
             "Hi there! I'm ready to discuss any financial topic or analyze your personal finances.",
             "Welcome back! What financial questions or analysis can I help with today?"
         ]
 
-        # Enhanced financial keywords with categories and descriptions
-        self.financial_terms = {
-            "Net Worth": "The total value of your assets minus liabilities. Calculated as: Assets - Liabilities.",
-            "Debt-to-Income Ratio": "Your monthly debt payments divided by your gross monthly income.",
-            "Savings Rate": "The percentage of your income that you're saving each month.",
-            "Emergency Fund": "Savings to cover 3-6 months of living expenses for financial emergencies.",
-            "Asset Allocation": "How your investments are distributed among different asset classes like stocks, bonds, and cash.",
-            "Diversification": "Spreading investments across different assets to reduce risk.",
-            "401(k)": "Employer-sponsored retirement account with tax advantages.",
-            "IRA": "Individual Retirement Account with tax benefits.",
-            "Roth Conversion": "Moving funds from a traditional IRA to a Roth IRA, with tax implications.",
-            "Refinancing": "Replacing an existing loan with a new one, typically to get better terms.",
-            "Amortization": "The process of paying off debt with regular payments over time.",
-            "Tax Deductions": "Expenses that can be subtracted from your income to reduce taxable income.",
-            "Life Insurance": "Policy that pays out to beneficiaries upon the policyholder's death.",
-            "Mutual Fund": "A pooled investment vehicle that collects money from many investors to invest in a diversified portfolio of securities. Managed by professional fund managers.",
-            "SIP": "Systematic Investment Plan - A method of investing in mutual funds where you invest a fixed amount regularly.",
-            "NAV": "Net Asset Value - The per-share value of a mutual fund, calculated by dividing total assets minus liabilities by number of shares.",
-            "Expense Ratio": "The annual fee charged by mutual funds, expressed as a percentage of your investment."
-        }
 
-        # Initialize NLP components
-        self.nlp = spacy.load("en_core_web_sm") if spacy else None
+        # All intent patterns compiled into one regex, matched once per message
+        self.intent_router = IntentRouter()
+
+        # Initialize NLP components (trimmed pipeline, see chatbot_nlp.UNUSED_PIPES)
+        self.nlp = load_pipeline(spacy) if spacy else None
         self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
 
-        # Initialize phrase matcher for financial terms
-        if self.nlp:
-            self.matcher = PhraseMatcher(self.nlp.vocab)
-            patterns = [self.nlp(text) for text in self.financial_terms.keys()]
-            self.matcher.add("FinancialTerms", patterns)
-
-        # Initialize TF-IDF vectorizer for document similarity
-        self.vectorizer = TfidfVectorizer(tokenizer=self._preprocess_text, stop_words=list(self.stop_words))
-        kb_questions = list(GENERAL_FINANCE_KB.keys())
-        # Only fit if there are questions, else use a default placeholder
-        if kb_questions:
-            self.vectorizer.fit(kb_questions)
+        # Prefer the prebuilt artifact from build_chatbot_model.py; it is only
+        # used when it was built from the same KB, terms and spaCy model
+        builtin = builtin_knowledge()
+        artifact = None
+        if use_artifact:
+            artifact = load_artifact(model_path or os.getenv("CHATBOT_MODEL_PATH", DEFAULT_ARTIFACT_DIR),
+                                     self.model_fingerprint(builtin))
+        self.artifact_path = artifact.path if artifact else None
+
+        if artifact:
+            self.stop_words = set(artifact.stop_words)
         else:
-            self.vectorizer.fit(["What is finance?"])
+            # Only hits the network when a dataset is missing
+            ensure_nltk_data()
+            self.stop_words = set(stopwords.words('english'))
+
+        # KB retrieval engine: "tfidf" (default) or "embedding" (see embedding_index.py)
+        self.retrieval = os.getenv("CHATBOT_RETRIEVAL", "tfidf").lower()
+        self.embedding_encoder = None
+        self.embedding_cache_dir = os.getenv("CHATBOT_EMBEDDING_CACHE") or os.path.join(DEFAULT_ARTIFACT_DIR, "embeddings")
+        if self.retrieval == "embedding":
+            try:
+                self.embedding_encoder = create_encoder(nlp=self.nlp)
+            except (ImportError, OSError, ValueError) as e:
+                print(f"Embedding retrieval unavailable ({e}), using TF-IDF")
+                self.retrieval = "tfidf"
+        elif self.retrieval != "tfidf":
+            print(f"Unknown CHATBOT_RETRIEVAL '{self.retrieval}', using TF-IDF")
+            self.retrieval = "tfidf"
+
+        # Knowledge base, terms and every index built from them, replaced as a
+        # whole when an external knowledge base is loaded (see kb_loader.py)
+        self._knowledge_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._pinned = threading.local()
+        self._knowledge_versions = 0
+        self._knowledge = self._build_knowledge(builtin, artifact)
+        self.knowledge_path = os.getenv("CHATBOT_KB_PATH") or None
+        self.knowledge_reload_seconds = float(os.getenv("CHATBOT_KB_RELOAD_SECONDS", 30))
+        self._knowledge_signature = None
+        self._knowledge_error: Optional[str] = None
+        self._watcher_pid = None
+        if self.knowledge_path:
+            if os.getenv("CHATBOT_KB_LOAD", "background") == "blocking":
+                self.reload_knowledge()
+            # Otherwise the built-in knowledge answers until the file is indexed
+            self._ensure_knowledge_watcher()
 
         # Response templates
         self.response_templates = {
@@ -148,41 +285,52 @@ class AdvancedFinancialChatbot:
             "term_definition": self._generate_term_definition_response
         }
 
-        # User context tracking with historical data
-        self.user_context = {}
-        self.historical_data = {}  # Stores historical financial data by client_id
+        # Per-client conversation context and historical snapshots, bounded by TTL/LRU
+        self.context_store = context_store or create_context_store()
 
-    def generate_response(self, message: str, client_id: Optional[int] = None) -> str:
-        """Generate a response to the user's financial query."""
-        message_lower = message.lower().strip()
+        # Stock quotes and history, cached in front of yfinance (or a local provider)
+        self.market_data = market_data or create_market_data()
 
-        # Check for financial term explanation request
-        term_response = self._handle_term_explanation_request(message)
-        if term_response:
-            return term_response
-        # ...existing code...
+        # Per-intent handlers; latency of every answering intent or stage is tracked
+        self.intent_handlers = {
+            "greeting": lambda: self.response_templates["greeting"](),
+            "gratitude": lambda: "You're welcome! Is there anything else I can help you with today?",
+            "farewell": lambda: "Goodbye! Feel free to return if you have more financial questions.",
+            "market_price": lambda ticker: self.response_templates["market_data"](ticker.upper(), "price"),
+            "market_performance": lambda ticker: self.response_templates["market_data"](ticker.upper(), "performance"),
+            "future_value": lambda *args: self.response_templates["calculation"]("future_value", *self._parse_calculation(*args)),
+            "present_value": lambda *args: self.response_templates["calculation"]("present_value", *self._parse_calculation(*args)),
+            "emi": lambda amount, rate, tenure, unit: self.response_templates["calculation"](
+                "emi", *self._parse_calculation(amount, rate, tenure), unit),
+            "sip": lambda *args: self.response_templates["calculation"]("sip", *self._parse_calculation(*args)),
+            "definition": lambda term: self.response_templates["definition"](term.strip()),
+            "comparison": lambda term1, term2: self.response_templates["comparison"](term1.strip(), term2.strip()),
+            "strategy": lambda goal: self.response_templates["strategy"](goal.strip()),
+        }
+        self._intent_stats: Dict[str, List[float]] = {}
+        self._intent_stats_lock = threading.Lock()
+        # Per-stage timings of every message (chatbot_profiling.py); off by default
+        self.profiling = profiling_enabled()
+
+        # Deterministic answers, looked up before a message is parsed
+        self.response_cache = response_cache or ResponseCache(
+            int(os.getenv("CHATBOT_RESPONSE_CACHE_SIZE", 2048)))
 
-    def _handle_term_explanation_request(self, message: str) -> Optional[str]:
+    def _handle_term_explanation_request(self, message) -> Optional[str]:
         """Handle requests for financial term explanations."""
         if not self.nlp:
             return None
 
-        doc = self.nlp(message.lower())
+        analysis = self._ensure_analysis(message)
 
         # Check if user is asking about financial terms generally
-        if any(word in message.lower() for word in ["what terms", "what financial terms", "list of terms", "what do you know"]):
+        if any(word in analysis.lower for word in ["what terms", "what financial terms", "list of terms", "what do you know"]):
             return self.response_templates["term_list"]()
 
         # Check for specific term matches
-        matches = self.matcher(doc)
-        if matches:
-            matched_terms = []
-            for match_id, start, end in matches:
-                span = doc[start:end]
-                matched_terms.append(span.text)
-
-            if matched_terms:
-                return self.response_templates["term_definition"](matched_terms[0])
+        matched_terms = analysis.matched_terms
+        if matched_terms:
+            return self.response_templates["term_definition"](matched_terms[0])
 
         return None
 
@@ -231,10 +379,12 @@ class AdvancedFinancialChatbot:
 
     def _calculate_net_worth_change(self, client_id: int, current_nw: float) -> str:
         """Calculate net worth change over the past year."""
-        if client_id not in self.historical_data:
+        history = self.context_store.get(HISTORY_NAMESPACE, client_id)
+        if not history:
             return "I don't have historical data to compare your net worth."
 
-        historical_nw = self.historical_data[client_id].get("net_worth")
+        # Snapshots are kept oldest first, so the first one is the year-ago baseline
+        historical_nw = history[0].get("net_worth")
         if not historical_nw:
             return "I don't have historical net worth data for comparison."
 
@@ -299,140 +449,325 @@ class AdvancedFinancialChatbot:
 
     def update_historical_data(self, client_id: int, financial_data: Dict[str, Any]):
         """Update historical financial data for trend analysis."""
-        if client_id not in self.historical_data:
-            self.historical_data[client_id] = {}
-
-        # Store current data with timestamp
-        self.historical_data[client_id][datetime.now()] = {
+        # Store current data with timestamp; snapshots stay sorted oldest first
+        now = datetime.now()
+        snapshot = {
+            "timestamp": now.timestamp(),
             "net_worth": financial_data.get("net_worth"),
             "assets": financial_data.get("total_assets"),
             "liabilities": financial_data.get("total_liabilities"),
             "income": financial_data.get("annual_income")
         }
+        cutoff = (now - timedelta(days=730)).timestamp()
 
-        # Keep only the last 2 years of data
-        cutoff = datetime.now() - timedelta(days=730)
-        self.historical_data[client_id] = {
-            k: v for k, v in self.historical_data[client_id].items() 
-            if isinstance(k, datetime) and k > cutoff
-        }
+        def append(history):
+            history = (history or []) + [snapshot]
+            # Keep only the last 2 years of data, capped at MAX_HISTORY_SNAPSHOTS entries
+            start = 0
+            while start < len(history) and history[start]["timestamp"] <= cutoff:
+                start += 1
+            return history[start:][-MAX_HISTORY_SNAPSHOTS:]
+
+        # Atomic, so that concurrent updates of one client (e.g. on two workers) keep both snapshots
+        self.context_store.update(HISTORY_NAMESPACE, client_id, append)
     
-    def generate_response(self, message: str, client_id: Optional[int] = None) -> str:
-        """Generate a response to the user's financial query."""
-        message_lower = message.lower().strip()
-        
+    def _analyze(self, message: str) -> AnalyzedMessage:
+        """Parse a message once; every handler reads the same analysis."""
+        if self.nlp:
+            analysis = analyze_message(message, self.nlp, self.matcher, self.stop_words)
+        else:
+            with stage("tokenize"):
+                analysis = AnalyzedMessage(message, tokens=self._preprocess_text(message).split())
+        with stage("intent"):
+            analysis.intent = self.intent_router.classify(analysis.lower)
+        return analysis
+
+    def _analyze_many(self, messages: List[str]) -> List[AnalyzedMessage]:
+        """Parse a batch of messages with a single nlp.pipe call."""
+        if not self.nlp:
+            return [self._analyze(message) for message in messages]
+        analyses = analyze_messages(messages, self.nlp, self.matcher, self.stop_words)
+        with stage("intent"):
+            for analysis in analyses:
+                analysis.intent = self.intent_router.classify(analysis.lower)
+        return analyses
+
+    def _ensure_analysis(self, message) -> AnalyzedMessage:
+        return message if isinstance(message, AnalyzedMessage) else self._analyze(message)
+
+    def generate_response(self, message: str, client_id: Optional[int] = None,
+                          profile: Optional[Dict[str, Any]] = None) -> str:
+        """Generate a response to the user's financial query.
+
+        profile is the client's cached financial profile; without it the
+        personalized advice stage is skipped.
+        """
+        with trace_message(self.profiling):
+            return self._generate_response(message, client_id, profile)
+
+    def generate_response_debug(self, message: str, client_id: Optional[int] = None,
+                                profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """generate_response plus the message's stage timings and answering handler."""
+        with trace_message() as trace:
+            response = self._generate_response(message, client_id, profile)
+        return {"response": response, "debug": trace.to_dict()}
+
+    def _generate_response(self, message: str, client_id: Optional[int],
+                           profile: Optional[Dict[str, Any]]) -> str:
+        self._ensure_knowledge_watcher()
+        with self._pin_knowledge():
+            cached = self._cached_response(message, client_id, profile)
+            if cached is not None:
+                return cached
+            return self._respond(self._analyze(message), client_id, profile=profile)
+
+    def generate_response_stream(self, message: str, client_id: Optional[int] = None,
+                                 profile: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Generate a response as text chunks that add up to generate_response's answer.
+
+        Long personalized answers are yielded section by section as their
+        handlers produce them; every other answer is a single chunk. An error
+        while building a later section is raised after the chunks already
+        yielded, so that the caller can tell the answer is incomplete.
+        """
+        self._ensure_knowledge_watcher()
+        # Neither pinned nor traced across yields: the next chunk may be produced on another thread
+        with self._pin_knowledge(), trace_message(self.profiling):
+            response = self._cached_response(message, client_id, profile)
+            if response is None:
+                response = self._respond(self._analyze(message), client_id, profile=profile, stream=True)
+        if not isinstance(response, SectionStream):
+            yield response
+            return
+        try:
+            yield from response.chunks()
+        except Exception as e:
+            # Sections already sent cannot be taken back; the caller must report the truncated answer
+            print(f"Error building personalized advice: {e}")
+            raise
+
+    def generate_responses(self, messages: List[str], client_ids: Optional[List[Optional[int]]] = None,
+                           profiles: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[str]:
+        """Generate responses for a batch of messages.
+
+        All messages go through spaCy in one nlp.pipe call and are scored
+        against the knowledge base with a single sparse matrix multiply.
+        Responses keep the input order; a message whose handler fails gets
+        BATCH_ERROR_RESPONSE instead of failing the whole batch.
+        """
+        if client_ids is None:
+            client_ids = [None] * len(messages)
+        if profiles is None:
+            profiles = [None] * len(messages)
+        if len(client_ids) != len(messages) or len(profiles) != len(messages):
+            raise ChatbotInputError("messages, client_ids and profiles must have the same length")
+
+        self._ensure_knowledge_watcher()
+        # One trace for the whole batch: its stages are shared by all messages
+        with self._pin_knowledge(), trace_message(self.profiling):
+            return self._generate_responses(messages, client_ids, profiles)
+
+    def _generate_responses(self, messages: List[str], client_ids: List[Optional[int]],
+                            profiles: List[Optional[Dict[str, Any]]]) -> List[str]:
+        responses = [
+            self._cached_response(message, client_id, profile)
+            for message, client_id, profile in zip(messages, client_ids, profiles)
+        ]
+        misses = [i for i, response in enumerate(responses) if response is None]
+        if not misses:
+            return responses
+
+        analyses = self._analyze_many([messages[i] for i in misses])
+        self._prefetch_market_data(analyses)
+        with stage(self.retrieval):
+            kb_matches = self.kb_index.search_batch([self._kb_query(analysis) for analysis in analyses], k=1)
+        for i, analysis, kb_match in zip(misses, analyses, kb_matches):
+            try:
+                responses[i] = self._respond(analysis, client_ids[i], kb_match, profiles[i])
+            except Exception as e:
+                print(f"Error answering batch message {i}: {e}")
+                responses[i] = BATCH_ERROR_RESPONSE
+        return responses
+
+    def _respond(self, analysis: AnalyzedMessage, client_id: Optional[int] = None,
+                 kb_matches: Optional[List[Tuple[str, Any, float]]] = None,
+                 profile: Optional[Dict[str, Any]] = None, stream: bool = False) -> Any:
+        """Answer an already analyzed message and record which stage answered it."""
+        started = time.perf_counter()
+
         # Track conversation context
-        self._update_context(message_lower, client_id)
-        
-        # Check for greetings
-        if any(greet in message_lower for greet in ["hello", "hi", "hey", "greetings"]):
-            return self.response_templates["greeting"]()
-            
-        # Check for gratitude
-        if any(thanks in message_lower for thanks in ["thanks", "thank you", "appreciate"]):
-            return "You're welcome! Is there anything else I can help you with today?"
-            
-        # Check for farewell
-        if any(bye in message_lower for bye in ["bye", "goodbye", "see you"]):
-            return "Goodbye! Feel free to return if you have more financial questions."
-        
+        focus_area, risk_level = self._context_signals(analysis)
+        self._apply_context(client_id, focus_area, risk_level)
+
+        response, source = self._dispatch(analysis, client_id, kb_matches, profile, stream)
+        if source in CACHEABLE_SOURCES:
+            self.response_cache.put(
+                self._response_cache_key(analysis.text, client_id),
+                self.knowledge.version,
+                CachedResponse(response, source in POST_PERSONALIZATION_SOURCES, focus_area, risk_level),
+            )
+        self._record_intent(source, time.perf_counter() - started)
+        set_handler(source)
+        return response
+
+    def _response_cache_key(self, message: str, client_id: Optional[int]) -> Tuple[str, bool]:
+        # Every handler reads the lowercased, stripped message; general answers
+        # only depend on whether a client_id was given
+        return message.lower().strip(), bool(client_id)
+
+    def _cached_response(self, message: str, client_id: Optional[int],
+                         profile: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Serve a cached answer without parsing the message, or None on a miss."""
+        started = time.perf_counter()
+        with stage("response_cache"):
+            entry = self.response_cache.get(self._response_cache_key(message, client_id), self.knowledge.version)
+        if entry is not None and entry.after_personalization and client_id and profile:
+            # This client may get personalized advice instead of the cached general answer
+            entry = None
+        self.response_cache.record(entry is not None)
+        if entry is None:
+            return None
+        self._apply_context(client_id, entry.financial_focus, entry.risk_profile)
+        self._record_intent("cache", time.perf_counter() - started)
+        set_handler("cache")
+        return entry.response
+
+    def _dispatch(self, analysis: AnalyzedMessage, client_id: Optional[int] = None,
+                  kb_matches: Optional[List[Tuple[str, Any, float]]] = None,
+                  profile: Optional[Dict[str, Any]] = None, stream: bool = False) -> Tuple[Any, str]:
+        """Route a message straight to its intent handler; returns (response, intent or stage).
+
+        With stream=True long personalized answers come back as an unjoined
+        SectionStream; every other response is a string.
+        """
+        message_lower = analysis.lower
+
+        intent = analysis.intent
+        if intent and intent[0] in SMALL_TALK_INTENTS:
+            with stage(f"handler:{intent[0]}"):
+                return self.intent_handlers[intent[0]](), intent[0]
+
         # Check for financial term explanation request
-        term_response = self._handle_term_explanation_request(message)
+        with stage("handler:term"):
+            term_response = self._handle_term_explanation_request(analysis)
         if term_response:
-            return term_response
-        
-        # Try to extract market data requests
-        market_response = self._handle_market_data_requests(message_lower)
-        if market_response:
-            return market_response
-            
-        # Try to match calculation patterns
-        calculation_response = self._handle_calculations(message_lower)
-        if calculation_response:
-            return calculation_response
-            
-        # Try to match definition requests
-        definition_response = self._handle_definitions(message_lower)
-        if definition_response:
-            return definition_response
-            
-        # Try to match comparison requests
-        comparison_response = self._handle_comparisons(message_lower)
-        if comparison_response:
-            return comparison_response
-            
-        # Try to match strategy requests
-        strategy_response = self._handle_strategy_requests(message_lower)
-        if strategy_response:
-            return strategy_response
-            
+            return term_response, "term"
+
+        # Market data, calculations, definitions, comparisons and strategies
+        if intent:
+            with stage(f"handler:{intent[0]}"):
+                response = self.intent_handlers[intent[0]](*intent[1])
+            if response:
+                return response, intent[0]
+
         # Try personalized advice if user has data
-        if client_id and get_financial_data_supabase is not None:
+        if client_id and profile:
             try:
-                financial_data = get_financial_data_supabase(client_id)
-                summary = calculate_financial_summary(financial_data) if financial_data else None
+                financial_data, summary = profile["data"], profile["summary"]
                 
                 if financial_data:
-                    personalized = self._try_personalized(message_lower, financial_data, summary)
-                    if personalized:
-                        return personalized
+                    with stage("handler:personalized"):
+                        personalized = self._try_personalized(message_lower, financial_data, summary)
+                        if personalized:
+                            return self._finish(personalized, stream), "personalized"
                         
-                    # If no specific personalized match, provide contextual summary
-                    if "summary" in message_lower or "overview" in message_lower:
-                        return self.response_templates["summary"](financial_data, summary)
+                        # If no specific personalized match, provide contextual summary
+                        if "summary" in message_lower or "overview" in message_lower:
+                            summary_response = self.response_templates["summary"](financial_data, summary)
+                            return self._finish(summary_response, stream), "personalized"
             except Exception as e:
-                print(f"Error accessing financial data: {e}")
-                # Continue to general responses if database access fails
+                print(f"Error building personalized advice: {e}")
+                # Continue to general responses if the profile cannot be used
         
         # Enhanced knowledge base matching with semantic similarity
-        kb_answer = self._query_knowledge_base(message_lower)
+        with stage("handler:knowledge_base"):
+            kb_answer = self._query_knowledge_base(analysis, kb_matches)
         if kb_answer:
-            return kb_answer
+            return kb_answer, "knowledge_base"
             
         # Try to answer generally for any user
-        general_answer = self._answer_general_finance_question(message_lower)
+        with stage("handler:general"):
+            general_answer = self._answer_general_finance_question(analysis)
         if general_answer:
             if client_id:
-                return general_answer + "\n\nFor personalized advice, please complete your financial profile."
-            return general_answer
+                return general_answer + "\n\nFor personalized advice, please complete your financial profile.", "general"
+            return general_answer, "general"
+
+        # Typo-tolerant match against glossary terms, graph nodes and KB questions
+        with stage("handler:fuzzy"):
+            fuzzy_match = self.term_index.fuzzy_lookup(message_lower)
+        if fuzzy_match:
+            label, answer, _ = fuzzy_match
+            return f"Did you mean '{label}'? {answer}", "fuzzy"
             
         # Ultimate fallback
-        return self.response_templates["fallback"]()
-    
-    def _update_context(self, message: str, client_id: Optional[int]) -> None:
-        """Update the conversation context based on the current message."""
-        if client_id not in self.user_context:
-            self.user_context[client_id] = {
+        with stage("handler:fallback"):
+            return self.response_templates["fallback"](), "fallback"
+
+    @staticmethod
+    def _finish(response: Any, stream: bool) -> Any:
+        # Join sectioned answers here, inside the caller's error handling, unless they are streamed
+        if isinstance(response, SectionStream) and not stream:
+            return str(response)
+        return response
+
+    def _record_intent(self, intent: str, seconds: float) -> None:
+        INTENT_LATENCY.labels(intent).observe(seconds)
+        with self._intent_stats_lock:
+            stats = self._intent_stats.setdefault(intent, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+    def intent_stats(self) -> Dict[str, Dict[str, float]]:
+        """Message count and average latency per answering intent or stage."""
+        with self._intent_stats_lock:
+            return {
+                intent: {"count": count, "avg_ms": seconds / count * 1000}
+                for intent, (count, seconds) in self._intent_stats.items()
+            }
+
+    def _context_signals(self, message) -> Tuple[Optional[str], Optional[str]]:
+        """Financial focus area and risk profile expressed by a message."""
+        analysis = self._ensure_analysis(message)
+        focus_area = self._detect_financial_focus(analysis)
+        risk_level = self._detect_risk_language(analysis.lower) if "risk" in analysis.lower else None
+        return focus_area, risk_level
+
+    def _apply_context(self, client_id: Optional[int], focus_area: Optional[str], risk_level: Optional[str]) -> None:
+        """Update the conversation context with the signals of the current message."""
+        # Only write back when something changed, so a shared backend is not hit on every message
+        if not focus_area and not risk_level:
+            return
+        def apply(context):
+            context = context or {
                 "last_topics": [],
                 "financial_focus": None,
                 "risk_profile": None
             }
-        
-        # Detect financial focus area
-        focus_area = self._detect_financial_focus(message)
-        if focus_area:
-            self.user_context[client_id]["financial_focus"] = focus_area
-            self.user_context[client_id]["last_topics"].append(focus_area)
-            if len(self.user_context[client_id]["last_topics"]) > 5:
-                self.user_context[client_id]["last_topics"].pop(0)
-                
-        # Detect risk-related language
-        if "risk" in message:
-            risk_level = self._detect_risk_language(message)
+            if focus_area:
+                context["financial_focus"] = focus_area
+                context["last_topics"] = (context["last_topics"] + [focus_area])[-5:]
             if risk_level:
-                self.user_context[client_id]["risk_profile"] = risk_level
+                context["risk_profile"] = risk_level
+            return context
+
+        self.context_store.update(CONTEXT_NAMESPACE, client_id, apply)
+
+    def get_user_context(self, client_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Conversation context stored for a client, or None if it expired or never existed."""
+        return self.context_store.get(CONTEXT_NAMESPACE, client_id)
     
-    def _detect_financial_focus(self, message: str) -> Optional[str]:
+    def _detect_financial_focus(self, message) -> Optional[str]:
         """Detect the main financial focus area of the message."""
         if not self.nlp:
             return None
             
-        doc = self.nlp(message)
-        matches = self.matcher(doc)
+        analysis = self._ensure_analysis(message)
+        matches = analysis.matches
         
         if matches:
             match_id, start, end = matches[0]
-            span = doc[start:end]
+            span = analysis.doc[start:end]
             # Map financial terms to categories
             finance_categories = {
                 "investments": ["mutual fund", "sip", "stocks", "bonds", "investment"],
@@ -460,76 +795,22 @@ class AdvancedFinancialChatbot:
                 return level
         return None
     
-    def _handle_market_data_requests(self, message: str) -> Optional[str]:
-        """Handle requests for market data and stock information."""
-        # Pattern for stock price requests
-        price_pattern = r"(?:what is|what's|show me|tell me) (?:the )?(?:price|value) of ([A-Z]{1,5})\??"
-        price_match = re.search(price_pattern, message, re.IGNORECASE)
-        if price_match:
-            ticker = price_match.group(1).upper()
-            return self.response_templates["market_data"](ticker, "price")
-            
-        # Pattern for stock performance requests
-        perf_pattern = r"(?:how is|how's|what is|what's) (?:the )?performance of ([A-Z]{1,5})\??"
-        perf_match = re.search(perf_pattern, message, re.IGNORECASE)
-        if perf_match:
-            ticker = perf_match.group(1).upper()
-            return self.response_templates["market_data"](ticker, "performance")
-            
-        return None
-    
-    def _handle_calculations(self, message: str) -> Optional[str]:
-        """Handle financial calculation requests."""
-        # Future value calculation
-        fv_pattern = r"(?:calculate|what is) (?:the )?future value of (\$?\d+(?:,\d+)*(?:\.\d+)?) at (\d+(?:\.\d+)?)% for (\d+) years?"
-        fv_match = re.search(fv_pattern, message, re.IGNORECASE)
-        if fv_match:
-            amount = float(fv_match.group(1).replace('$', '').replace(',', ''))
-            rate = float(fv_match.group(2)) / 100
-            years = int(fv_match.group(3))
-            return self.response_templates["calculation"]("future_value", amount, rate, years)
-            
-        # Present value calculation
-        pv_pattern = r"(?:calculate|what is) (?:the )?present value of (\$?\d+(?:,\d+)*(?:\.\d+)?) at (\d+(?:\.\d+)?)% for (\d+) years?"
-        pv_match = re.search(pv_pattern, message, re.IGNORECASE)
-        if pv_match:
-            amount = float(pv_match.group(1).replace('$', '').replace(',', ''))
-            rate = float(pv_match.group(2)) / 100
-            years = int(pv_match.group(3))
-            return self.response_templates["calculation"]("present_value", amount, rate, years)
-            
-        return None
-    
-    def _handle_definitions(self, message: str) -> Optional[str]:
-        """Handle requests for financial definitions."""
-        def_pattern = r"(?:what is|what's|define) (?:a |an |the )?([a-zA-Z\s]+)\??"
-        def_match = re.search(def_pattern, message, re.IGNORECASE)
-        if def_match:
-            term = def_match.group(1).strip()
-            return self.response_templates["definition"](term)
-            
-        return None
-    
-    def _handle_comparisons(self, message: str) -> Optional[str]:
-        """Handle requests to compare financial terms."""
-        comp_pattern = r"(?:what is|what's) (?:the )?difference between (?:a |an |the )?([a-zA-Z\s]+) and (?:a |an |the )?([a-zA-Z\s]+)\??"
-        comp_match = re.search(comp_pattern, message, re.IGNORECASE)
-        if comp_match:
-            term1 = comp_match.group(1).strip()
-            term2 = comp_match.group(2).strip()
-            return self.response_templates["comparison"](term1, term2)
-            
-        return None
-    
-    def _handle_strategy_requests(self, message: str) -> Optional[str]:
-        """Handle requests for financial strategies."""
-        strat_pattern = r"(?:what is|what's|recommend) (?:the )?best (?:strategy|approach|way) for ([a-zA-Z\s]+)\??"
-        strat_match = re.search(strat_pattern, message, re.IGNORECASE)
-        if strat_match:
-            goal = strat_match.group(1).strip()
-            return self.response_templates["strategy"](goal)
-            
-        return None
+    def _prefetch_market_data(self, analyses: List[AnalyzedMessage]) -> None:
+        """Fetch the tickers asked about in a batch with one provider call per period."""
+        tickers = {"1d": set(), "1y": set()}
+        for analysis in analyses:
+            if analysis.intent and analysis.intent[0] in ("market_price", "market_performance"):
+                period = "1d" if analysis.intent[0] == "market_price" else "1y"
+                tickers[period].add(analysis.intent[1][0].upper())
+        for period, period_tickers in tickers.items():
+            if period_tickers:
+                with stage("market_data"):
+                    self.market_data.prefetch(period_tickers, period)
+
+    @staticmethod
+    def _parse_calculation(amount: str, rate: str, years: str) -> Tuple[float, float, int]:
+        """Convert the captured amount, percentage and years (or months) of a calculation request."""
+        return float(amount.replace('$', '').replace(',', '')), float(rate) / 100, int(years)
     
     def _try_personalized(self, message: str, financial_data: Dict[str, Any], 
                          summary: Dict[str, Any]) -> Optional[str]:
@@ -631,26 +912,188 @@ class AdvancedFinancialChatbot:
         
         return None
     
-    def _query_knowledge_base(self, message: str) -> Optional[str]:
+    def stats(self) -> Dict[str, Any]:
+        """Cache and store statistics for monitoring."""
+        return {
+            "context_store": self.context_store.stats(),
+            "market_data": self.market_data.stats(),
+            "intents": self.intent_stats(),
+            "response_cache": self.response_cache.stats(),
+            "knowledge_base": self.knowledge_stats(),
+        }
+
+    def model_fingerprint(self, content: Optional[KnowledgeContent] = None) -> str:
+        """Identifies the inputs a prebuilt artifact must have been built from."""
+        content = content or self.knowledge.content
+        spacy_version = None
+        if self.nlp:
+            spacy_version = f"{self.nlp.meta.get('name')}-{self.nlp.meta.get('version')}"
+        return kb_fingerprint(content.knowledge_base, content.financial_terms, spacy_version)
+
+    def matcher_patterns(self) -> List[List[str]]:
+        """Tokenized financial terms, as stored in the prebuilt artifact."""
+        if not self.nlp:
+            return []
+        return [[token.text for token in self.nlp.make_doc(term)] for term in self.financial_terms]
+
+    def rebuild_knowledge_base_index(self) -> None:
+        """Re-index the built-in knowledge after GENERAL_FINANCE_KB has been modified."""
+        with self._reload_lock:
+            self._knowledge = self._build_knowledge(builtin_knowledge())
+
+    @property
+    def knowledge(self) -> KnowledgeSnapshot:
+        """The snapshot pinned by the current request, else the latest one."""
+        return getattr(self._pinned, "snapshot", None) or self._knowledge
+
+    @property
+    def kb_index(self) -> "KnowledgeBaseIndex":
+        return self.knowledge.kb_index
+
+    @property
+    def term_index(self) -> TermIndex:
+        return self.knowledge.term_index
+
+    @property
+    def matcher(self):
+        return self.knowledge.matcher
+
+    @property
+    def financial_terms(self) -> Dict[str, str]:
+        return self.knowledge.content.financial_terms
+
+    @property
+    def knowledge_graph(self) -> Dict[str, Any]:
+        return self.knowledge.content.knowledge_graph
+
+    @contextmanager
+    def _pin_knowledge(self):
+        """Answer a whole request from one snapshot, even if a reload swaps in another meanwhile."""
+        if getattr(self._pinned, "snapshot", None) is not None:
+            yield
+            return
+        self._pinned.snapshot = self._knowledge
+        try:
+            yield
+        finally:
+            self._pinned.snapshot = None
+
+    def _build_knowledge(self, content: KnowledgeContent, artifact=None) -> KnowledgeSnapshot:
+        """Build the matcher, KB index and term index of content, from the artifact if given."""
+        # Patterns match on token text only, so the tokenizer alone is enough
+        matcher = None
+        if self.nlp:
+            matcher = PhraseMatcher(self.nlp.vocab)
+            if artifact:
+                patterns = [Doc(self.nlp.vocab, words=words) for words in artifact.matcher_patterns]
+            else:
+                patterns = [self.nlp.make_doc(text) for text in content.financial_terms.keys()]
+            matcher.add("FinancialTerms", patterns)
+
+        # Precompute the TF-IDF matrix (or the embeddings) of KB questions once;
+        # queries are then scored with a single matrix product against it
+        if self.embedding_encoder:
+            threshold = os.getenv("CHATBOT_EMBEDDING_THRESHOLD")
+            kb_index = EmbeddingIndex(content.knowledge_base, self.embedding_encoder,
+                                      cache_dir=self.embedding_cache_dir,
+                                      n_probe=int(os.getenv("CHATBOT_EMBEDDING_PROBES", 0)) or None,
+                                      match_threshold=float(threshold) if threshold else None)
+        elif artifact:
+            kb_index = KnowledgeBaseIndex.from_arrays(tokenizer=self._tokenize,
+                                                      batch_tokenizer=self._tokenize_many,
+                                                      **artifact.kb_export)
+        else:
+            kb_index = KnowledgeBaseIndex(content.knowledge_base, tokenizer=self._tokenize,
+                                          batch_tokenizer=self._tokenize_many)
+
+        # Glossary, KB and knowledge graph indexed once for definition lookups
+        term_index = TermIndex(content.glossary, content.knowledge_base, content.knowledge_graph)
+
+        with self._knowledge_lock:
+            self._knowledge_versions += 1
+            return KnowledgeSnapshot(self._knowledge_versions, content, kb_index, term_index, matcher)
+
+    def reload_knowledge(self) -> bool:
+        """Load CHATBOT_KB_PATH if it changed and swap it in; True if a new snapshot was installed.
+
+        The new snapshot is built completely before the swap, so requests
+        keep being answered from the old one until then. On any error the
+        current knowledge stays in place.
+        """
+        if not self.knowledge_path:
+            return False
+        with self._reload_lock:
+            try:
+                signature = file_signature(self.knowledge_path)
+                if signature == self._knowledge_signature:
+                    return False
+                # A broken file is retried once it changes, not on every poll
+                self._knowledge_signature = signature
+                content = load_knowledge(self.knowledge_path, builtin_knowledge())
+                started = time.perf_counter()
+                snapshot = None
+                if content.fingerprint != self._knowledge.content.fingerprint:
+                    snapshot = self._build_knowledge(content)
+            except Exception as e:
+                if str(e) != self._knowledge_error:
+                    print(f"Error loading knowledge base from {self.knowledge_path}: {e}")
+                self._knowledge_error = str(e)
+                return False
+            self._knowledge_error = None
+            if snapshot is None:
+                return False
+            self._knowledge = snapshot
+        print(f"Knowledge base {content.version} loaded from {content.source} "
+              f"({len(content)} entries, {time.perf_counter() - started:.2f}s)")
+        return True
+
+    def _ensure_knowledge_watcher(self) -> None:
+        # Threads do not survive fork, so a preloaded chatbot starts one per worker process
+        if not self.knowledge_path or self._watcher_pid == os.getpid():
+            return
+        with self._watcher_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            if self._watcher_pid is not None:
+                # Forked while the parent's watcher may have held these mid-reload
+                self._reload_lock = threading.Lock()
+                self._knowledge_lock = threading.Lock()
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch_knowledge, name="chatbot-kb-watcher", daemon=True).start()
+
+    def _watch_knowledge(self) -> None:
+        while True:
+            self.reload_knowledge()
+            if self.knowledge_reload_seconds <= 0:
+                return
+            time.sleep(self.knowledge_reload_seconds)
+
+    def knowledge_stats(self) -> Dict[str, Any]:
+        snapshot = self._knowledge
+        return {
+            "version": snapshot.content.version,
+            "snapshot": snapshot.version,
+            "source": snapshot.content.source,
+            "entries": len(snapshot.content),
+            "terms": len(snapshot.content.financial_terms),
+            "path": self.knowledge_path,
+            "error": self._knowledge_error,
+            "retrieval": snapshot.kb_index.stats() if self.embedding_encoder else {"engine": "tfidf"},
+        }
+
+    def _query_knowledge_base(self, message, matches: Optional[List[Tuple[str, Any, float]]] = None) -> Optional[str]:
         """Enhanced knowledge base query with semantic similarity."""
-        # Preprocess the message
-        processed_message = self._preprocess_text(message)
-        
-        # Transform the message and KB questions to vectors
+        analysis = self._ensure_analysis(message)
+        message = analysis.lower
         try:
-            message_vec = self.vectorizer.transform([processed_message])
-            kb_questions = list(GENERAL_FINANCE_KB.keys())
-            kb_vecs = self.vectorizer.transform(kb_questions)
-            
-            # Calculate cosine similarities
-            similarities = cosine_similarity(message_vec, kb_vecs)
-            best_match_idx = similarities.argmax()
-            best_score = similarities[0, best_match_idx]
+            # Batched requests arrive with their KB matches already scored
+            if matches is None:
+                with stage(self.retrieval):
+                    matches = self.kb_index.search(self._kb_query(analysis), k=1)
             
             # Threshold for considering a match
-            if best_score > 0.6:
-                best_question = kb_questions[best_match_idx]
-                answer = GENERAL_FINANCE_KB[best_question]
+            if matches and matches[0][2] > self.kb_index.match_threshold:
+                best_question, answer, _ = matches[0]
                 
                 # Handle lambda functions in KB
                 if callable(answer):
@@ -669,6 +1112,10 @@ class AdvancedFinancialChatbot:
         
         return None
     
+    def _kb_query(self, analysis: AnalyzedMessage) -> Any:
+        # TF-IDF scores the message's tokens, embeddings are computed from its text
+        return analysis.lower if self.embedding_encoder else analysis.tokens
+
     def _extract_parameters(self, pattern: str, message: str) -> Optional[List[str]]:
         """Extract parameters from message based on a pattern with placeholders."""
         # Convert KB pattern to regex
@@ -682,12 +1129,14 @@ class AdvancedFinancialChatbot:
             return list(match.groups())
         return None
     
-    def _answer_general_finance_question(self, message: str) -> Optional[str]:
+    def _answer_general_finance_question(self, message) -> Optional[str]:
         """Attempt to answer general finance questions using knowledge graph."""
         if not self.nlp:
             return None
             
-        doc = self.nlp(message)
+        analysis = self._ensure_analysis(message)
+        message = analysis.lower
+        doc = analysis.doc
         
         # Check for definition questions
         if any(token.text.lower() in ["what", "define", "definition"] for token in doc):
@@ -712,7 +1161,7 @@ class AdvancedFinancialChatbot:
         # Check for strategy questions
         if any(word in message.lower() for word in ["how to", "strategy", "approach", "best way"]):
             for token in doc:
-                if token.text.lower() in FINANCIAL_KNOWLEDGE_GRAPH.get("investments", {}).get("strategies", []):
+                if token.text.lower() in self.knowledge_graph.get("investments", {}).get("strategies", []):
                     return self.suggest_strategy(token.text)
         
         return None
@@ -731,12 +1180,27 @@ class AdvancedFinancialChatbot:
         
         return " ".join(words)
     
-    def _generate_summary_response(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    def _tokenize(self, text: str) -> List[str]:
+        """Tokens used by the KB index; must match AnalyzedMessage.tokens."""
+        if self.nlp:
+            return doc_tokens(self.nlp(text.lower().strip()), self.stop_words)
+        return self._preprocess_text(text).split()
+    
+    def _tokenize_many(self, texts: List[str]) -> List[List[str]]:
+        """Batch version of _tokenize used when (re)building the KB index."""
+        if not self.nlp:
+            return [self._tokenize(text) for text in texts]
+        # Tokens need neither the matcher nor intents, which a snapshot being built does not have yet
+        return [analysis.tokens for analysis in analyze_messages(texts, self.nlp, None, self.stop_words)]
+    
+    @sectioned
+    def _generate_summary_response(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate a comprehensive financial summary."""
         if not summary:
-            return self.response_templates["no_data"]
-            
-        response = [
+            yield self.response_templates["no_data"]
+            return
+
+        yield from [
             "Here's a detailed summary of your financial situation:",
             f"• Net Worth: ${summary.get('net_worth', 0):,.2f}",
             f"• Total Assets: ${summary.get('total_assets', 0):,.2f}",
@@ -751,20 +1215,18 @@ class AdvancedFinancialChatbot:
         
         # Add recommendations based on summary
         if summary.get('savings_rate', 0) < 15:
-            response.append("- Consider increasing your savings rate to at least 15% of income")
+            yield "- Consider increasing your savings rate to at least 15% of income"
             
         if summary.get('debt_to_income_ratio', 0) > 0.35:
-            response.append("- Focus on reducing debt to improve financial flexibility")
+            yield "- Focus on reducing debt to improve financial flexibility"
             
         if not summary.get('has_retirement_account', False):
-            response.append("- Open a retirement account (IRA or 401k) if available")
+            yield "- Open a retirement account (IRA or 401k) if available"
             
         if not summary.get('has_emergency_fund', False):
-            response.append("- Build an emergency fund with 3-6 months of expenses")
+            yield "- Build an emergency fund with 3-6 months of expenses"
             
-        response.append("\nAsk me about specific areas for more detailed advice!")
-        
-        return "\n".join(response)
+        yield "\nAsk me about specific areas for more detailed advice!"
     
     def _generate_market_response(self, ticker: str, request_type: str) -> str:
         """Generate response for market data requests."""
@@ -790,15 +1252,33 @@ class AdvancedFinancialChatbot:
         try:
             if calc_type == "future_value":
                 amount, rate, years = args
-                fv = amount * (1 + rate) ** years
+                fv = float(future_value(amount, rate, years))
                 return (f"The future value of ${amount:,.2f} at {rate*100:.2f}% annual growth "
                         f"after {years} years will be ${fv:,.2f}.")
                         
             elif calc_type == "present_value":
                 amount, rate, years = args
-                pv = amount / (1 + rate) ** years
+                pv = float(present_value(amount, rate, years))
                 return (f"The present value of ${amount:,.2f} discounted at {rate*100:.2f}% "
                         f"for {years} years is ${pv:,.2f}.")
+
+            elif calc_type == "emi":
+                principal, rate, tenure, unit = args
+                months = tenure * 12 if unit.startswith("year") else tenure
+                schedule = amortization_schedule(principal, rate, months)
+                first_year_interest = schedule["interest"][0, :12].sum()
+                return (f"For a loan of ${principal:,.2f} at {rate*100:.2f}% over {months} months, "
+                        f"the EMI is ${schedule['emi'][0]:,.2f}. You will pay ${schedule['total_interest'][0]:,.2f} "
+                        f"in interest (${schedule['total_payment'][0]:,.2f} in total), "
+                        f"${first_year_interest:,.2f} of it in the first year.")
+
+            elif calc_type == "sip":
+                monthly, rate, years = args
+                schedule = sip_schedule(monthly, rate, years)
+                return (f"Investing ${monthly:,.2f} every month at {rate*100:.2f}% expected annual return "
+                        f"for {years} years grows to about ${schedule['final_value'][0]:,.2f}: "
+                        f"${schedule['total_invested'][0]:,.2f} invested and "
+                        f"${schedule['returns'][0]:,.2f} in estimated returns.")
                         
         except Exception as e:
             print(f"Error in calculation: {e}")
@@ -806,9 +1286,12 @@ class AdvancedFinancialChatbot:
     
     def _generate_definition_response(self, term: str) -> str:
         """Generate response for definition requests."""
-        definition = self.get_definition(term)
-        if definition:
-            return f"{term.capitalize()}: {definition}"
+        match = self.term_index.lookup_definition(term)
+        if match:
+            label, definition, exact = match
+            if exact:
+                return f"{term.capitalize()}: {definition}"
+            return f"Did you mean '{label}'? {definition}"
         return f"I don't have a definition for '{term}'. Try asking about a different financial term."
     
     def _generate_comparison_response(self, term1: str, term2: str) -> str:
@@ -825,13 +1308,14 @@ class AdvancedFinancialChatbot:
             return strategy
         return f"I don't have specific strategies for '{goal}'. Try asking about common financial goals like retirement or debt reduction."
     
-    def _generate_budget_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _generate_budget_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized budget advice."""
         expenses = summary.get("monthly_expenses", 0)
         income = summary.get("monthly_income", 1)  # Avoid division by zero
         savings_rate = summary.get("savings_rate", 0)
         
-        response = [f"Your monthly budget summary:\nIncome: ${income:,.2f}\nExpenses: ${expenses:,.2f}"]
+        yield f"Your monthly budget summary:\nIncome: ${income:,.2f}\nExpenses: ${expenses:,.2f}"
         
         # Basic 50/30/20 rule analysis
         needs = expenses * 0.5
@@ -839,25 +1323,24 @@ class AdvancedFinancialChatbot:
         savings = expenses * 0.2
         
         if savings_rate < 20:
-            response.append(f"\nYou're saving {savings_rate:.1f}% of income. The 50/30/20 rule suggests aiming for 20% savings.")
+            yield f"\nYou're saving {savings_rate:.1f}% of income. The 50/30/20 rule suggests aiming for 20% savings."
         
         # Expense category analysis
         if "expense_categories" in summary:
             largest_category = max(summary["expense_categories"].items(), key=lambda x: x[1])
-            response.append(f"\nYour largest expense category is {largest_category[0]} (${largest_category[1]:,.2f}/month).")
+            yield f"\nYour largest expense category is {largest_category[0]} (${largest_category[1]:,.2f}/month)."
             
             if largest_category[0].lower() in ["dining out", "entertainment", "shopping"]:
-                response.append("Consider reducing discretionary spending in this category to increase savings.")
-        
-        return "\n".join(response)
+                yield "Consider reducing discretionary spending in this category to increase savings."
     
-    def _personalized_investment_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _personalized_investment_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized investment advice."""
         assets = financial_data.get("assets", [])
         age = financial_data.get("age", 30)
         risk_tolerance = financial_data.get("risk_tolerance", "moderate")
         
-        response = ["Here's your personalized investment analysis:"]
+        yield "Here's your personalized investment analysis:"
         
         # Asset allocation analysis
         if assets and isinstance(assets, list):
@@ -868,81 +1351,79 @@ class AdvancedFinancialChatbot:
                 a_type = asset.get("type", "other").lower()
                 asset_types[a_type] = asset_types.get(a_type, 0) + asset.get("value", 0)
             
-            response.append("\nCurrent Asset Allocation:")
+            yield "\nCurrent Asset Allocation:"
             for a_type, value in asset_types.items():
-                response.append(f"- {a_type.capitalize()}: ${value:,.2f} ({value/total_value*100:.1f}%)")
+                yield f"- {a_type.capitalize()}: ${value:,.2f} ({value/total_value*100:.1f}%)"
             
             # Diversification check
             if len(asset_types) < 3:
-                response.append("\nConsider diversifying across more asset classes to reduce risk.")
+                yield "\nConsider diversifying across more asset classes to reduce risk."
             
             # Stock concentration check
             if asset_types.get("stock", 0) / total_value > 0.7:
-                response.append("\nYour portfolio is heavily weighted toward stocks. Consider adding bonds for balance.")
+                yield "\nYour portfolio is heavily weighted toward stocks. Consider adding bonds for balance."
         
         # Age-appropriate advice
         years_to_retire = max(65 - age, 5)
         if years_to_retire > 30:
-            response.append("\nWith many years until retirement, you can afford more growth-oriented investments.")
+            yield "\nWith many years until retirement, you can afford more growth-oriented investments."
         elif years_to_retire < 10:
-            response.append("\nAs you approach retirement, consider shifting to more conservative investments.")
+            yield "\nAs you approach retirement, consider shifting to more conservative investments."
         
         # Risk tolerance advice
         if risk_tolerance.lower() == "conservative":
-            response.append("\nGiven your conservative risk tolerance, focus on bonds, CDs, and dividend stocks.")
+            yield "\nGiven your conservative risk tolerance, focus on bonds, CDs, and dividend stocks."
         elif risk_tolerance.lower() == "aggressive":
-            response.append("\nWith aggressive risk tolerance, you might consider growth stocks and alternative investments.")
+            yield "\nWith aggressive risk tolerance, you might consider growth stocks and alternative investments."
         else:
-            response.append("\nA balanced mix of stocks and bonds suits your moderate risk tolerance.")
-        
-        return "\n".join(response)
+            yield "\nA balanced mix of stocks and bonds suits your moderate risk tolerance."
     
-    def _personalized_insurance_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _personalized_insurance_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized insurance advice."""
         insurance = financial_data.get("insurance", [])
         dependents = financial_data.get("dependents", 0)
         assets = summary.get("total_assets", 0)
         
-        response = ["Here's your insurance needs analysis:"]
+        yield "Here's your insurance needs analysis:"
         
         # Life insurance check
         has_life = any(i.get("type", "").lower() == "life" for i in insurance)
         if not has_life and (dependents > 0 or assets > 500000):
-            response.append("\nYou may need life insurance to protect your family's financial future.")
+            yield "\nYou may need life insurance to protect your family's financial future."
         elif has_life:
-            response.append("\nYou have life insurance coverage. Review beneficiaries periodically.")
+            yield "\nYou have life insurance coverage. Review beneficiaries periodically."
         
         # Health insurance check
         has_health = any(i.get("type", "").lower() == "health" for i in insurance)
         if not has_health:
-            response.append("\nHealth insurance is essential to protect against medical expenses.")
+            yield "\nHealth insurance is essential to protect against medical expenses."
         
         # Property insurance check
         has_home = any(i.get("type", "").lower() in ["home", "renters"] for i in insurance)
         if not has_home and assets > 100000:
-            response.append("\nConsider property insurance to protect your home and belongings.")
+            yield "\nConsider property insurance to protect your home and belongings."
         
         # Disability insurance check
         has_disability = any(i.get("type", "").lower() == "disability" for i in insurance)
         if not has_disability and summary.get("monthly_income", 0) > 3000:
-            response.append("\nDisability insurance can protect your income if you're unable to work.")
-        
-        return "\n".join(response)
+            yield "\nDisability insurance can protect your income if you're unable to work."
     
-    def _personalized_tax_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _personalized_tax_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized tax advice."""
         accounts = financial_data.get("accounts", [])
         income = summary.get("total_income", 0)
         deductions = financial_data.get("deductions", [])
         
-        response = ["Here's your tax planning analysis:"]
+        yield "Here's your tax planning analysis:"
         
         # Retirement account check
         has_tax_advantaged = any(a.get("type", "").lower() in ["401k", "ira", "roth"] for a in accounts)
         if not has_tax_advantaged and income > 40000:
-            response.append("\nConsider contributing to tax-advantaged retirement accounts to reduce taxable income.")
+            yield "\nConsider contributing to tax-advantaged retirement accounts to reduce taxable income."
         elif has_tax_advantaged:
-            response.append("\nYou're using tax-advantaged accounts. Maximize contributions for additional savings.")
+            yield "\nYou're using tax-advantaged accounts. Maximize contributions for additional savings."
         
         # Deduction check
         common_deductions = {"mortgage": False, "student_loan": False, "charitable": False}
@@ -954,18 +1435,16 @@ class AdvancedFinancialChatbot:
             elif "charit" in d.get("type", "").lower():
                 common_deductions["charitable"] = True
         
-        response.append("\nPotential Deductions:")
+        yield "\nPotential Deductions:"
         for ded, has in common_deductions.items():
-            response.append(f"- {ded.replace('_', ' ').title()}: {'Claimed' if has else 'Not claimed'}")
+            yield f"- {ded.replace('_', ' ').title()}: {'Claimed' if has else 'Not claimed'}"
         
         # Tax bracket info
         if income > 0:
             bracket = self._estimate_tax_bracket(income)
-            response.append(f"\nEstimated tax bracket: {bracket}%")
+            yield f"\nEstimated tax bracket: {bracket}%"
             if bracket >= 22:
-                response.append("Consider tax-loss harvesting and other advanced strategies.")
-        
-        return "\n".join(response)
+                yield "Consider tax-loss harvesting and other advanced strategies."
     
     def _estimate_tax_bracket(self, income: float) -> int:
         """Estimate federal tax bracket (simplified)."""
@@ -977,18 +1456,20 @@ class AdvancedFinancialChatbot:
         elif income <= 578125: return 35
         else: return 37
     
-    def _personalized_goal_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _personalized_goal_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized advice for financial goals."""
         goals = financial_data.get("goals", [])
         net_worth = summary.get("net_worth", 0)
         savings_rate = summary.get("savings_rate", 0)
         
         if not goals:
-            return ("You haven't set any financial goals yet. Common goals include: "
+            yield ("You haven't set any financial goals yet. Common goals include: "
                    "retirement savings, buying a home, education funding, or debt freedom. "
                    "Let me know if you'd like help setting specific goals!")
+            return
         
-        response = ["Your financial goals and progress:"]
+        yield "Your financial goals and progress:"
         for goal in goals:
             g_name = goal.get("name", "Unnamed goal")
             g_amount = goal.get("target_amount", 0)
@@ -998,26 +1479,25 @@ class AdvancedFinancialChatbot:
             progress = min(g_saved / g_amount * 100, 100) if g_amount > 0 else 0
             needed_per_year = (g_amount - g_saved) / g_years if g_years > 0 else 0
             
-            response.append(f"\n{g_name}: ${g_saved:,.2f} of ${g_amount:,.2f} ({progress:.1f}%)")
-            response.append(f"To reach goal in {g_years} years, save ${needed_per_year:,.2f} annually")
+            yield f"\n{g_name}: ${g_saved:,.2f} of ${g_amount:,.2f} ({progress:.1f}%)"
+            yield f"To reach goal in {g_years} years, save ${needed_per_year:,.2f} annually"
             
             if needed_per_year > summary.get("annual_income", float('inf')) * 0.2:
-                response.append("This goal may be too ambitious. Consider adjusting target or timeline.")
-        
-        return "\n".join(response)
+                yield "This goal may be too ambitious. Consider adjusting target or timeline."
     
-    def _personalized_college_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _personalized_college_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized college planning advice."""
         kids = financial_data.get("dependents", 0)
         college_funds = sum(a.get("value", 0) for a in financial_data.get("assets", []) 
                           if a.get("purpose", "").lower() == "education")
         
-        response = ["College planning advice:"]
+        yield "College planning advice:"
         
         if kids == 0:
-            response.append("\nYou don't have any dependents listed. College planning may not be needed.")
+            yield "\nYou don't have any dependents listed. College planning may not be needed."
         else:
-            response.append(f"\nYou have {kids} dependent(s). Estimated college costs:")
+            yield f"\nYou have {kids} dependent(s). Estimated college costs:"
             
             # Simplified cost projections
             current_cost = 25000  # Average public college annual cost
@@ -1026,90 +1506,88 @@ class AdvancedFinancialChatbot:
             future_cost = current_cost * (1 + inflation) ** years_until_college
             total_4yr_cost = future_cost * 4
             
-            response.append(f"- Projected annual cost in {years_until_college} years: ${future_cost:,.2f}")
-            response.append(f"- Total 4-year cost: ${total_4yr_cost:,.2f}")
+            yield f"- Projected annual cost in {years_until_college} years: ${future_cost:,.2f}"
+            yield f"- Total 4-year cost: ${total_4yr_cost:,.2f}"
             
             if college_funds > 0:
-                response.append(f"\nYou've saved ${college_funds:,.2f} for education.")
+                yield f"\nYou've saved ${college_funds:,.2f} for education."
                 needed_per_year = (total_4yr_cost - college_funds) / years_until_college
-                response.append(f"Save ${needed_per_year:,.2f} per year to fully fund education.")
+                yield f"Save ${needed_per_year:,.2f} per year to fully fund education."
             else:
-                response.append("\nConsider starting a 529 plan or other education savings account.")
-        
-        return "\n".join(response)
+                yield "\nConsider starting a 529 plan or other education savings account."
     
-    def _personalized_home_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> str:
+    @sectioned
+    def _personalized_home_advice(self, financial_data: Dict[str, Any], summary: Dict[str, Any]) -> Iterator[str]:
         """Generate personalized home buying advice."""
         owns_home = any(a.get("type", "").lower() == "primary residence" for a in financial_data.get("assets", []))
         down_payment = financial_data.get("down_payment_saved", 0)
         income = summary.get("annual_income", 0)
         debt = summary.get("total_debt", 0)
         
-        response = ["Home buying analysis:"]
+        yield "Home buying analysis:"
         
         if owns_home:
-            response.append("\nYou own a home. Consider these strategies:")
+            yield "\nYou own a home. Consider these strategies:"
             mortgage = next((a for a in financial_data.get("liabilities", []) 
                            if a.get("type", "").lower() == "mortgage"), None)
             if mortgage:
                 rate = mortgage.get("interest_rate", 0)
                 balance = mortgage.get("balance", 0)
-                response.append(f"- Mortgage balance: ${balance:,.2f} at {rate:.2f}%")
+                yield f"- Mortgage balance: ${balance:,.2f} at {rate:.2f}%"
                 if rate > 5:
-                    response.append("Consider refinancing if rates have dropped since you got your mortgage.")
+                    yield "Consider refinancing if rates have dropped since you got your mortgage."
             else:
-                response.append("- You own your home free and clear!")
+                yield "- You own your home free and clear!"
             
             home_value = next((a.get("value", 0) for a in financial_data.get("assets", []) 
                              if a.get("type", "").lower() == "primary residence"), 0)
-            response.append(f"- Estimated home value: ${home_value:,.2f}")
+            yield f"- Estimated home value: ${home_value:,.2f}"
             
         else:
-            response.append("\nYou don't currently own a home. Home buying considerations:")
+            yield "\nYou don't currently own a home. Home buying considerations:"
             
             # Affordability estimate
             affordable_price = income * 3  # Simple rule of thumb
             needed_down = affordable_price * 0.2
-            response.append(f"- Based on your income, you might afford a home up to ${affordable_price:,.2f}")
-            response.append(f"- Recommended 20% down payment: ${needed_down:,.2f}")
+            yield f"- Based on your income, you might afford a home up to ${affordable_price:,.2f}"
+            yield f"- Recommended 20% down payment: ${needed_down:,.2f}"
             
             if down_payment > 0:
-                response.append(f"- You've saved ${down_payment:,.2f} for a down payment")
+                yield f"- You've saved ${down_payment:,.2f} for a down payment"
                 if down_payment >= needed_down:
-                    response.append("You have enough saved for a 20% down payment!")
+                    yield "You have enough saved for a 20% down payment!"
                 else:
-                    response.append(f"Save ${needed_down - down_payment:,.2f} more for 20% down")
+                    yield f"Save ${needed_down - down_payment:,.2f} more for 20% down"
             
             # Debt-to-income check
             dti = debt / income if income > 0 else 0
             if dti > 0.43:
-                response.append("\nYour debt-to-income ratio is high for mortgage approval. Pay down debt first.")
+                yield "\nYour debt-to-income ratio is high for mortgage approval. Pay down debt first."
             elif dti > 0.36:
-                response.append("\nYour debt-to-income ratio is borderline. Consider reducing debt before buying.")
+                yield "\nYour debt-to-income ratio is borderline. Consider reducing debt before buying."
             else:
-                response.append("\nYour debt-to-income ratio is good for mortgage approval.")
-        
-        return "\n".join(response)
+                yield "\nYour debt-to-income ratio is good for mortgage approval."
     
-    @staticmethod
-    def get_stock_price(ticker: str) -> Optional[float]:
-        """Get current stock price using yfinance."""
+    def get_stock_price(self, ticker: str) -> Optional[float]:
+        """Get current stock price from the cached market data provider."""
         try:
-            stock = yf.Ticker(ticker)
-            price = stock.history(period="1d")["Close"].iloc[-1]
+            with stage("market_data"):
+                hist = self.market_data.get_history(ticker, "1d")
+            if hist is None:
+                return None
+            price = hist["Close"].iloc[-1]
             return price
         except Exception as e:
             print(f"Error getting stock price: {e}")
             return None
-    
-    @staticmethod
-    def get_stock_performance(ticker: str) -> Optional[str]:
+
+    def get_stock_performance(self, ticker: str) -> Optional[str]:
         """Get stock performance summary."""
         try:
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period="1y")
-            
-            if hist.empty:
+            with stage("market_data"):
+                hist = self.market_data.get_history(ticker, "1y")
+
+            if hist is None:
                 return None
                 
             start_price = hist["Close"].iloc[0]
@@ -1129,81 +1607,17 @@ class AdvancedFinancialChatbot:
     
     @staticmethod
     def calculate_future_value(present_value: float, rate: float, years: int) -> float:
-        """Calculate future value of an investment."""
-        return present_value * (1 + rate) ** years
+        """Calculate future value of an investment (see financial_calculator for vectors)."""
+        return float(future_value(present_value, rate, years))
     
-    @staticmethod
-    def get_definition(term: str) -> Optional[str]:
-        """Get definition of a financial term from knowledge graph."""
-        term_lower = term.lower().replace(" ", "_")
-        
-        # First, try to find in the financial terms dictionary (case-insensitive)
-        # Check direct matches first
-        financial_terms_dict = {
-            "Net Worth": "The total value of your assets minus liabilities. Calculated as: Assets - Liabilities.",
-            "Debt-to-Income Ratio": "Your monthly debt payments divided by your gross monthly income.",
-            "Savings Rate": "The percentage of your income that you're saving each month.",
-            "Emergency Fund": "Savings to cover 3-6 months of living expenses for financial emergencies.",
-            "Asset Allocation": "How your investments are distributed among different asset classes like stocks, bonds, and cash.",
-            "Diversification": "Spreading investments across different assets to reduce risk.",
-            "401(k)": "Employer-sponsored retirement account with tax advantages.",
-            "IRA": "Individual Retirement Account with tax benefits.",
-            "Roth Conversion": "Moving funds from a traditional IRA to a Roth IRA, with tax implications.",
-            "Refinancing": "Replacing an existing loan with a new one, typically to get better terms.",
-            "Amortization": "The process of paying off debt with regular payments over time.",
-            "Tax Deductions": "Expenses that can be subtracted from your income to reduce taxable income.",
-            "Life Insurance": "Policy that pays out to beneficiaries upon the policyholder's death.",
-            "Mutual Fund": "A pooled investment vehicle that collects money from many investors to invest in a diversified portfolio of securities. Managed by professional fund managers.",
-            "SIP": "Systematic Investment Plan - A method of investing in mutual funds where you invest a fixed amount regularly.",
-            "NAV": "Net Asset Value - The per-share value of a mutual fund, calculated by dividing total assets minus liabilities by number of shares.",
-            "Expense Ratio": "The annual fee charged by mutual funds, expressed as a percentage of your investment.",
-            "Budget": "A plan for your income and expenses over a specific period, helping you manage money and achieve financial goals.",
-            "Budgeting": "The process of creating a plan to spend your money wisely, tracking income and expenses to ensure you live within your means."
-        }
-        
-        for key, value in financial_terms_dict.items():
-            if key.lower() == term.lower():
-                return value
-        
-        # Try knowledge base entries (case-insensitive)
-        for kb_key, kb_value in GENERAL_FINANCE_KB.items():
-            # Check if the term matches the key or is contained in the key
-            if term.lower() in kb_key.lower() or kb_key.lower().endswith(term.lower()):
-                return kb_value
-        
-        # Search knowledge graph recursively
-        def search_graph(graph, term_parts):
-            if not term_parts:
-                return None
-                
-            current = term_parts[0]
-            if current in graph:
-                if isinstance(graph[current], dict):
-                    if "definition" in graph[current]:
-                        return graph[current]["definition"]
-                    return search_graph(graph[current], term_parts[1:])
-                return graph[current]
-            return None
-        
-        # Try different term variations
-        definition = search_graph(FINANCIAL_KNOWLEDGE_GRAPH, term_lower.split("_"))
-        if definition:
-            return definition
-            
-        # Try singular/plural variations
-        if term_lower.endswith("s"):
-            singular = term_lower[:-1]
-            definition = search_graph(FINANCIAL_KNOWLEDGE_GRAPH, singular.split("_"))
-            if definition:
-                return definition
-        
-        return None
+    def get_definition(self, term: str) -> Optional[str]:
+        """Get definition of a financial term from the glossary, knowledge base and knowledge graph."""
+        return self.term_index.get_definition(term)
     
-    @staticmethod
-    def compare_terms(term1: str, term2: str) -> Optional[str]:
+    def compare_terms(self, term1: str, term2: str) -> Optional[str]:
         """Compare two financial terms."""
-        def1 = AdvancedFinancialChatbot.get_definition(term1)
-        def2 = AdvancedFinancialChatbot.get_definition(term2)
+        def1 = self.get_definition(term1)
+        def2 = self.get_definition(term2)
         
         if not def1 or not def2:
             return None
@@ -1215,13 +1629,12 @@ class AdvancedFinancialChatbot:
                 f"Key difference: {term1} is typically {'more' if len(def1) > len(def2) else 'less'} "
                 "complex than {term2} in most financial contexts.")
     
-    @staticmethod
-    def suggest_strategy(goal: str) -> Optional[str]:
+    def suggest_strategy(self, goal: str) -> Optional[str]:
         """Suggest strategy for a financial goal."""
         goal_lower = goal.lower().replace(" ", "_")
         
         # Search knowledge graph for strategies
-        for category, data in FINANCIAL_KNOWLEDGE_GRAPH.items():
+        for category, data in self.knowledge_graph.items():
             if isinstance(data, dict) and "strategies" in data:
                 if goal_lower in category.lower():
                     strategies = data["strategies"]
@@ -1257,8 +1670,9 @@ class AdvancedFinancialChatbot:
         
         # Context-aware fallback
         client_id = kwargs.get("client_id")
-        if client_id and client_id in self.user_context:
-            last_topics = self.user_context[client_id]["last_topics"]
+        context = self.get_user_context(client_id) if client_id else None
+        if context:
+            last_topics = context["last_topics"]
             if last_topics:
                 return (f"I'm happy to discuss {', '.join(set(last_topics))} further. "
                         "Could you clarify or ask about a specific aspect?")
@@ -0,0 +1,275 @@
+"""
+Prebuilt term index for definition lookups.
+
+get_definition used to rebuild its glossary dict on every call, scan every
+knowledge base key for a substring match and then walk the knowledge graph.
+TermIndex is built once from the three sources and answers steps 1-4 in
+time proportional to the length of the term, however large they grow:
+
+1. glossary: hash map of lowercased terms
+2. knowledge base: the first KB question (in KB order) that contains the term,
+   found by walking a generalized suffix automaton over all questions
+3. knowledge graph: walk of the nested graph by the term's words
+4. aliases: abbreviations, spelled-out forms and plurals of glossary terms,
+   tried only when none of the above matched
+5. fuzzy (lookup_definition and fuzzy_lookup only): the closest glossary
+   term, KB question or graph node by character trigrams, for misspellings
+   such as "mutal fund" or "amortisation", returned with the matched label
+"""
+
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Spelled-out forms and abbreviations of glossary terms
+TERM_ALIASES = {
+    "dti": "Debt-to-Income Ratio",
+    "debt to income ratio": "Debt-to-Income Ratio",
+    "401k": "401(k)",
+    "individual retirement account": "IRA",
+    "systematic investment plan": "SIP",
+    "net asset value": "NAV",
+}
+
+
+class _SuffixAutomaton:
+    """Generalized suffix automaton recording, per state, the first string containing it."""
+
+    def __init__(self, strings: List[str]):
+        self.next: List[Dict[str, int]] = [{}]
+        self.link: List[int] = [-1]
+        self.length: List[int] = [0]
+        self.first: List[float] = [float("inf")]
+        for index, text in enumerate(strings):
+            last = 0
+            for char in text:
+                last = self._extend(last, char)
+                self.first[last] = min(self.first[last], index)
+        # A state's strings are suffixes of its children's along suffix links,
+        # so whatever contains a child also contains its link
+        for state in sorted(range(1, len(self.length)), key=self.length.__getitem__, reverse=True):
+            parent = self.link[state]
+            self.first[parent] = min(self.first[parent], self.first[state])
+
+    def _new_state(self, length: int, transitions: Dict[str, int], link: int) -> int:
+        self.next.append(transitions)
+        self.link.append(link)
+        self.length.append(length)
+        self.first.append(float("inf"))
+        return len(self.length) - 1
+
+    def _clone(self, p: int, q: int, char: str) -> int:
+        clone = self._new_state(self.length[p] + 1, dict(self.next[q]), self.link[q])
+        while p != -1 and self.next[p].get(char) == q:
+            self.next[p][char] = clone
+            p = self.link[p]
+        self.link[q] = clone
+        return clone
+
+    def _extend(self, last: int, char: str) -> int:
+        if char in self.next[last]:
+            q = self.next[last][char]
+            if self.length[last] + 1 == self.length[q]:
+                return q
+            return self._clone(last, q, char)
+
+        current = self._new_state(self.length[last] + 1, {}, 0)
+        p = last
+        while p != -1 and char not in self.next[p]:
+            self.next[p][char] = current
+            p = self.link[p]
+        if p != -1:
+            q = self.next[p][char]
+            if self.length[p] + 1 == self.length[q]:
+                self.link[current] = q
+            else:
+                self.link[current] = self._clone(p, q, char)
+        return current
+
+    def first_containing(self, text: str) -> Optional[int]:
+        """Index of the first string that contains text, or None."""
+        state = 0
+        for char in text:
+            state = self.next[state].get(char)
+            if state is None:
+                return None
+        first = self.first[state]
+        return None if first == float("inf") else int(first)
+
+
+# Minimum trigram similarity (Dice coefficient) of a fuzzy match
+FUZZY_THRESHOLD = 0.6
+# Trigrams shared by more keys than this do not generate candidates
+MAX_CANDIDATE_POSTINGS = 500
+
+
+def _ngrams(text: str, n: int = 3) -> set:
+    padded = f" {' '.join(text.lower().split())} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NgramIndex:
+    """Inverted index of character trigrams for typo-tolerant lookups.
+
+    Common trigrams (" wh", "hat") are shared by most keys, so counting every
+    posting of every query trigram costs time proportional to the number of
+    keys. search() uses prefix filtering instead: a key similar enough to the
+    query shares at least min_overlap of its trigrams, so it must contain one
+    of the query's len(grams) - min_overlap + 1 rarest trigrams. Only those
+    postings are read, and each candidate found there is scored exactly.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]]):
+        self.labels: List[str] = []
+        self.values: List[Any] = []
+        self.sizes: List[int] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        seen = set()
+        for label, value in entries:
+            key = " ".join(label.lower().split())
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            grams = _ngrams(key)
+            for gram in grams:
+                self.postings[gram].append(len(self.labels))
+            self.labels.append(label)
+            self.values.append(value)
+            self.sizes.append(len(grams))
+        self.postings = dict(self.postings)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @staticmethod
+    def size_bounds(query_size: int, threshold: float) -> Tuple[int, int, int]:
+        """Smallest and largest key sizes that can reach threshold, and the overlap the smallest needs."""
+        # Dice = 2c / (q + s) with c <= min(q, s) bounds s to [q t / (2 - t), q (2 - t) / t]
+        min_size = math.ceil(query_size * threshold / (2 - threshold) - 1e-9)
+        max_size = math.floor(query_size * (2 - threshold) / threshold + 1e-9)
+        min_overlap = max(1, math.ceil(threshold * (query_size + min_size) / 2 - 1e-9))
+        return min_size, max_size, min_overlap
+
+    def search(self, text: str, threshold: float = FUZZY_THRESHOLD) -> Optional[Tuple[str, Any, float]]:
+        """Best (label, value, similarity) at or above threshold; earlier entries win ties."""
+        grams = _ngrams(text)
+        if not grams:
+            return None
+        min_size, max_size, min_overlap = self.size_bounds(len(grams), threshold)
+        rarest = sorted(grams, key=lambda gram: len(self.postings.get(gram, ())))
+        shared: Dict[int, int] = defaultdict(int)
+        scanned = 0
+        for gram in rarest[:len(grams) - min_overlap + 1]:
+            postings = self.postings.get(gram, ())
+            if len(postings) > MAX_CANDIDATE_POSTINGS:
+                # The rest are even more common; they still count when candidates are scored
+                break
+            for entry in postings:
+                shared[entry] += 1
+            scanned += 1
+        unscanned = len(grams) - scanned
+
+        best, best_score = None, threshold
+        for entry, count in shared.items():
+            size = self.sizes[entry]
+            if size < min_size or size > max_size:
+                continue
+            # Even sharing every unscanned trigram, the key would score at most this
+            if 2 * (count + min(unscanned, size - count)) / (len(grams) + size) < best_score:
+                continue
+            score = 2 * len(grams & _ngrams(self.labels[entry])) / (len(grams) + size)
+            if score > best_score or (score == best_score and (best is None or entry < best)):
+                best, best_score = entry, score
+        if best is None:
+            return None
+        return self.labels[best], self.values[best], best_score
+
+
+class TermIndex:
+    def __init__(self, glossary: Dict[str, str], knowledge_base: Dict[str, Any],
+                 knowledge_graph: Dict[str, Any], aliases: Dict[str, str] = TERM_ALIASES):
+        self.glossary = {term.lower(): definition for term, definition in reversed(list(glossary.items()))}
+        self.kb_answers = list(knowledge_base.values())
+        self.kb_automaton = _SuffixAutomaton([question.lower() for question in knowledge_base])
+        self.knowledge_graph = knowledge_graph
+
+        self.aliases = {}
+        for term in self.glossary:
+            self.aliases[term + "s"] = term
+        for alias, term in aliases.items():
+            if term.lower() in self.glossary:
+                self.aliases[alias.lower()] = term.lower()
+                self.aliases[alias.lower() + "s"] = term.lower()
+
+        # Glossary terms first so that they win ties against KB questions
+        self.fuzzy = NgramIndex(
+            list(glossary.items())
+            + [(node.replace("_", " "), definition) for node, definition in self._graph_definitions(knowledge_graph)]
+            + list(knowledge_base.items())
+        )
+
+    def get_definition(self, term: str) -> Optional[Any]:
+        """Definition of the term itself (steps 1-4); misspellings are left to lookup_definition."""
+        term_lower = term.lower()
+        definition = self.glossary.get(term_lower)
+        if definition is not None:
+            return definition
+
+        kb_position = self.kb_automaton.first_containing(term_lower)
+        if kb_position is not None:
+            return self.kb_answers[kb_position]
+
+        graph_key = term_lower.replace(" ", "_")
+        definition = self._search_graph(graph_key.split("_"))
+        if definition:
+            return definition
+
+        # Try singular/plural variations
+        if graph_key.endswith("s"):
+            definition = self._search_graph(graph_key[:-1].split("_"))
+            if definition:
+                return definition
+
+        alias = self.aliases.get(term_lower)
+        if alias:
+            return self.glossary[alias]
+        return None
+
+    def lookup_definition(self, term: str) -> Optional[Tuple[str, Any, bool]]:
+        """(label, definition, exact): the term's own definition, else its closest fuzzy match.
+
+        A fuzzy match returns the label it matched, so that callers can ask
+        "Did you mean ...?" instead of answering for a different term.
+        """
+        definition = self.get_definition(term)
+        if definition is not None:
+            return term, definition, True
+        match = self.fuzzy.search(term.lower())
+        return (match[0], match[1], False) if match else None
+
+    def fuzzy_lookup(self, text: str, threshold: float = FUZZY_THRESHOLD) -> Optional[Tuple[str, Any, float]]:
+        """Closest glossary term, graph node or KB question as (label, answer, similarity)."""
+        return self.fuzzy.search(text, threshold)
+
+    @classmethod
+    def _graph_definitions(cls, graph: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        definitions = []
+        for node, value in graph.items():
+            if isinstance(value, dict):
+                if "definition" in value:
+                    definitions.append((node, value["definition"]))
+                else:
+                    definitions.extend(cls._graph_definitions(value))
+        return definitions
+
+    def _search_graph(self, term_parts: List[str]) -> Optional[Any]:
+        node = self.knowledge_graph
+        for part in term_parts:
+            if part not in node:
+                return None
+            node = node[part]
+            if not isinstance(node, dict):
+                return node
+            if "definition" in node:
+                return node["definition"]
+        return None
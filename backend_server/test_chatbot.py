@@ -24,5 +24,1081 @@ def test_mutual_fund_response():
         print(f"Error: {e}")
         return False
 
+def test_knowledge_base_index():
+    from kb_index import KnowledgeBaseIndex
+
+    kb = {
+        "what is sip": "sip answer",
+        "sip risks": "risks answer",
+        "budget": "budget answer",
+    }
+    index = KnowledgeBaseIndex(kb, tokenizer=lambda text: text.lower().split())
+
+    matches = index.search("sip risks", k=2)
+    assert matches[0][:2] == ("sip risks", "risks answer")
+    assert abs(matches[0][2] - 1.0) < 1e-9
+    assert [m[0] for m in matches] == ["sip risks", "what is sip"]
+    assert index.search("unrelated words") == []
+
+    kb["emergency fund"] = "emergency answer"
+    index.rebuild(kb)
+    assert index.version == 2
+    assert index.search("emergency fund", k=1)[0][1] == "emergency answer"
+
+def test_market_data_cache():
+    import tempfile
+    import pandas as pd
+    from market_data import FileMarketDataProvider, MarketDataCache
+
+    with tempfile.TemporaryDirectory() as directory:
+        dates = pd.date_range("2024-01-01", periods=400, freq="D")
+        pd.DataFrame({"Date": dates, "Close": range(400), "Volume": 1000}).to_csv(
+            f"{directory}/AAPL.csv", index=False)
+        cache = MarketDataCache(FileMarketDataProvider(directory))
+
+        assert cache.get_history("aapl", "1d")["Close"].iloc[-1] == 399
+        assert cache.get_history("AAPL", "1d")["Close"].iloc[-1] == 399
+        assert len(cache.get_history("AAPL", "1y")) == 366
+        assert cache.get_history("MSFT", "1d") is None
+
+        stats = cache.stats()
+        assert (stats["hit"], stats["miss"], stats["provider_calls"]) == (1, 3, 3)
+
+def test_market_data_coalescing():
+    import threading
+    import time
+    import pandas as pd
+    from market_data import MarketDataCache, MarketDataProvider
+
+    class BlockingProvider(MarketDataProvider):
+        name = "blocking"
+
+        def __init__(self):
+            self.calls, self.release = 0, threading.Event()
+
+        def get_history(self, ticker, period):
+            self.calls += 1
+            self.release.wait(5)
+            return pd.DataFrame({"Close": [1.0], "Volume": [10]})
+
+    provider = BlockingProvider()
+    cache = MarketDataCache(provider)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_history("aapl", "1d"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Hold the upstream call until every other thread is waiting on it
+    deadline = time.monotonic() + 5
+    while cache.stats()["coalesced"] < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    provider.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert provider.calls == 1 and len(results) == 8
+    assert all(result is results[0] for result in results)
+    stats = cache.stats()
+    assert (stats["miss"], stats["coalesced"], stats["provider_calls"]) == (1, 7, 1)
+
+def test_intent_router():
+    from intent_router import IntentRouter
+
+    router = IntentRouter()
+    assert router.classify("calculate the future value of $1,000 at 5% for 10 years") == (
+        "future_value", ("$1,000", "5", "10"))
+    assert router.classify("what is the price of aapl?") == ("market_price", ("aapl",))
+    # Earlier intents win even when a later one matches first in the text
+    assert router.classify("define inflation, thanks")[0] == "gratitude"
+    assert router.classify("recommend the best strategy for retirement") == ("strategy", ("retirement",))
+    assert router.classify("mutual fund") is None
+
+def test_term_index():
+    from term_index import TermIndex
+
+    kb = {"what is sip": "sip answer", "sip risks": "risks answer"}
+    graph = {"investments": {"stocks": {"definition": "stocks answer"}}}
+    index = TermIndex({"Net Worth": "net worth answer", "SIP": "glossary sip"}, kb, graph)
+
+    assert index.get_definition("NET WORTH") == "net worth answer"
+    assert index.get_definition("sip") == "glossary sip"
+    # First KB question containing the term, in KB order
+    assert index.get_definition("risk") == "risks answer"
+    assert index.get_definition("is s") == "sip answer"
+    assert index.get_definition("investments stocks") == "stocks answer"
+    assert index.get_definition("net worths") == "net worth answer"
+    assert index.get_definition("systematic investment plan") == "glossary sip"
+    assert index.get_definition("bonds") is None
+    # Near misses are only answered by lookup_definition, with the label they matched
+    assert index.get_definition("net wort") is None
+    assert index.lookup_definition("net wort") == ("Net Worth", "net worth answer", False)
+    assert index.lookup_definition("net worth") == ("net worth", "net worth answer", True)
+    assert index.fuzzy_lookup("sip risk")[:2] == ("sip risks", "risks answer")
+
+def test_fuzzy_lookup():
+    import random
+    import term_index
+    from term_index import NgramIndex, TermIndex
+
+    glossary = {"Mutual Fund": "fund answer", "Amortization": "amortization answer", "Net Worth": "net worth answer"}
+    graph = {"investments": {"exchange_traded_fund": {"definition": "etf answer"}}}
+    index = TermIndex(glossary, {"how do index funds work": "index answer"}, graph)
+    assert index.lookup_definition("mutal fund") == ("Mutual Fund", "fund answer", False)
+    assert index.lookup_definition("amortisation")[:2] == ("Amortization", "amortization answer")
+    assert index.lookup_definition("exchange traded funds")[:2] == ("exchange traded fund", "etf answer")
+    assert index.fuzzy_lookup("how do index fund work")[:2] == ("how do index funds work", "index answer")
+    assert index.lookup_definition("cryptocurrency") is None
+    assert index.fuzzy_lookup("net") is None
+
+    # A KB of questions that share "what is", "how do" etc.: matching a message
+    # must not score every key that shares a common trigram with it
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abcdefghiklmnoprstuvwy") for _ in range(rng.randint(4, 9))) for _ in range(3000)]
+    starts = ["what is", "how do i", "what are the", "how does", "should i", "can i"]
+    entries = [(f"{rng.choice(starts)} {' '.join(rng.sample(words, 3))}", i) for i in range(20000)]
+    fuzzy = NgramIndex(entries)
+    target = entries[1234][0]
+    scored = []
+    original = term_index._ngrams
+    term_index._ngrams = lambda text, n=3: scored.append(text) or original(text, n)
+    try:
+        match = fuzzy.search(target[:-1] + "x")
+    finally:
+        term_index._ngrams = original
+    assert match[0] == target
+    # The query itself plus a handful of candidates, not a large share of the 20,000 keys
+    assert len(scored) < 100
+
+def test_response_cache():
+    from response_cache import CachedResponse, ResponseCache
+
+    cache = ResponseCache(max_entries=2)
+    cache.put(("what is sip", False), 1, CachedResponse("sip answer", False))
+    cache.put(("budget", False), 1, CachedResponse("budget answer", True))
+    assert cache.get(("what is sip", False), 1).response == "sip answer"
+
+    # "budget" is now the least recently used entry
+    cache.put(("mutual fund", False), 1, CachedResponse("fund answer", True))
+    assert cache.get(("budget", False), 1) is None
+    assert cache.get(("what is sip", False), 1) is not None
+
+    # A new knowledge base version drops everything
+    assert cache.get(("what is sip", False), 2) is None
+    assert cache.stats()["entries"] == 0
+
+def test_profile_cache():
+    from context_store import InMemoryContextStore
+    from profile_cache import ProfileCache
+
+    loads = []
+    def loader(client_id):
+        loads.append(client_id)
+        return {"data": {"monthly_salary": 5000}, "summary": {"net_worth": 19000}} if client_id == 1 else None
+
+    profiles = ProfileCache(loader, InMemoryContextStore())
+    assert profiles.get(1)["summary"]["net_worth"] == 19000
+    assert profiles.get(1)["summary"]["net_worth"] == 19000
+    # Clients without financial data are cached too
+    assert profiles.get(2) is None and profiles.get(2) is None
+    assert loads == [1, 2]
+
+    # Saving financial data invalidates the client's profile
+    profiles.invalidate(1)
+    profiles.get(1)
+    assert loads == [1, 2, 1]
+    assert profiles.stats()["hits"] == 2
+
+def test_section_stream():
+    from simple_chatbot import SectionStream
+
+    built = []
+    def sections():
+        for section in ["Home buying analysis:", "\nYou own a home.", "- Mortgage balance: $1,000.00"]:
+            built.append(section)
+            yield section
+
+    stream = SectionStream(sections()).chunks()
+    assert next(stream) == "Home buying analysis:"
+    # Sections are only built as the stream is consumed
+    assert len(built) == 1
+    assert "".join(stream) == "\n\nYou own a home.\n- Mortgage balance: $1,000.00"
+    assert str(SectionStream(iter(built))) == "\n".join(built)
+
+def test_benchmark_compare():
+    from benchmark_chatbot import SyntheticMarketDataProvider, compare
+
+    provider = SyntheticMarketDataProvider()
+    assert provider.get_history("AAPL", "1y").equals(provider.get_history("AAPL", "1y"))
+    assert len(provider.get_history("AAPL", "1d")) == 1
+
+    def run(handler, digest, p95_ms):
+        return {
+            "queries": [{"name": "mutual_fund", "handler": handler, "response_sha1": digest}],
+            "handlers": {"knowledge_base": {"p95_ms": p95_ms}},
+        }
+
+    baseline = run("knowledge_base", "abc", 1.0)
+    assert compare(baseline, run("knowledge_base", "abc", 1.2), 0.25) == []
+    # Small absolute jitter is not a regression
+    assert compare(baseline, run("knowledge_base", "abc", 1.4), 0.25) == []
+    assert len(compare(baseline, run("knowledge_base", "abc", 2.0), 0.25)) == 1
+    assert len(compare(baseline, run("knowledge_base", "def", 1.0), 0.25)) == 1
+    assert len(compare(baseline, run("fallback", "abc", 1.0), 0.25)) == 1
+
+def test_kb_loader():
+    import os
+    import tempfile
+    from kb_loader import KnowledgeContent, load_knowledge, resolve_path, write_knowledge
+
+    defaults = KnowledgeContent({"budget": "A plan for income and expenses."}, {}, {"SIP": "Systematic Investment Plan"})
+    content = KnowledgeContent({"what is a roth ira": "An IRA funded with after-tax money.", "budget": "v2"},
+                               {"investments": {}}, defaults.financial_terms, version="2025-01")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("kb-2025-01.json", "kb-2025-01.db"):
+            path = os.path.join(directory, name)
+            write_knowledge(content, path)
+            loaded = load_knowledge(path, defaults)
+            assert loaded.version == "2025-01"
+            assert loaded.fingerprint == content.fingerprint
+            assert list(loaded.knowledge_base) == ["what is a roth ira", "budget"]
+
+        # Sections missing from a file keep the defaults
+        with open(os.path.join(directory, "kb-2025-02.json"), "w") as f:
+            f.write('{"version": "2025-02", "knowledge_base": {"budget": "v3"}}')
+        # A directory resolves to its last file by name
+        loaded = load_knowledge(directory, defaults)
+        assert loaded.version == "2025-02"
+        assert loaded.knowledge_base == {"budget": "v3"}
+        assert loaded.financial_terms == defaults.financial_terms
+
+        with open(os.path.join(directory, "CURRENT"), "w") as f:
+            f.write("kb-2025-01.db")
+        assert resolve_path(directory).endswith("kb-2025-01.db")
+
+def test_stage_profiling():
+    from chatbot_profiling import set_handler, stage, trace_message
+
+    # Untraced stages are no-ops
+    with stage("spacy"):
+        pass
+    with trace_message() as trace:
+        with stage("spacy"):
+            with stage("tfidf"):
+                pass
+        with stage("tfidf"):
+            pass
+        with trace_message(False) as nested:
+            assert nested is trace
+        set_handler("knowledge_base")
+    debug = trace.to_dict()
+    assert debug["handler"] == "knowledge_base"
+    assert set(debug["stages_ms"]) == {"spacy", "tfidf"}
+    assert debug["total_ms"] >= debug["stages_ms"]["spacy"]
+    with trace_message(False) as untraced:
+        assert untraced is None
+
+def test_embedding_index():
+    import tempfile
+    import zlib
+    import numpy as np
+    from embedding_index import EmbeddingIndex, normalize_rows
+
+    class TrigramEncoder:
+        """Hashed character trigrams: a stand-in for a real sentence encoder"""
+        name = "test-trigrams"
+        match_threshold = 0.5
+
+        def encode(self, texts):
+            vectors = np.zeros((len(texts), 256), dtype=np.float32)
+            for row, text in enumerate(texts):
+                text = f" {text.lower()} "
+                for i in range(len(text) - 2):
+                    vectors[row, zlib.crc32(text[i:i + 3].encode()) % 256] += 1
+            return normalize_rows(vectors)
+
+    kb = {f"question {i} about {topic}": f"answer {i}"
+          for i, topic in enumerate(["mutual funds", "sip risks", "budgeting", "tax saving"] * 50)}
+    exact = EmbeddingIndex(kb, TrigramEncoder())
+    assert exact.centroids is None and exact.vectors.dtype == np.float32
+    with tempfile.TemporaryDirectory() as cache_dir:
+        ivf = EmbeddingIndex(kb, TrigramEncoder(), cache_dir=cache_dir, n_lists=8, n_probe=8)
+        cached = EmbeddingIndex(kb, TrigramEncoder(), cache_dir=cache_dir, n_lists=8, n_probe=8)
+        assert not ivf.cached and cached.cached
+        queries = ["question 5 about sip risks", "question 42 about budgeting"]
+        # Probing every cluster is an exact search
+        for index in (ivf, cached):
+            for (match,), (expected,) in zip(index.search_batch(queries, k=1), exact.search_batch(queries, k=1)):
+                assert match[:2] == expected[:2] and np.isclose(match[2], expected[2])
+    question, answer, score = exact.search("question 5 about sip risks", k=1)[0]
+    assert (question, answer) == ("question 5 about sip risks", "answer 5") and score > 0.99
+
+def test_financial_calculator():
+    import numpy as np
+    from financial_calculator import amortization_schedule, future_value, loan_emi, sip_future_value, sip_schedule
+    from intent_router import IntentRouter
+
+    assert np.isclose(future_value(10000, 0.07, 20), 10000 * 1.07 ** 20)
+    # Vectors of rates and tenors broadcast into one call
+    assert future_value(100, np.array([0.05, 0.1]), np.array([[1], [2]])).shape == (2, 2)
+    assert np.isclose(loan_emi(1000000, 0.085, 240), 8678.23, atol=0.01)
+
+    schedule = amortization_schedule(120000, [0.06, 0.0], [240, 12])
+    assert list(schedule["months"]) == [240, 12] and schedule["payment"].shape == (2, 240)
+    assert np.allclose(schedule["principal"].sum(axis=1), 120000)
+    assert np.allclose(schedule["balance"][:, -1], 0) and schedule["payment"][1, 12:].sum() == 0
+    assert np.isclose(schedule["emi"][1], 10000) and schedule["total_interest"][1] == 0
+
+    sip = sip_schedule(5000, [0.12, 0.12], [10, 5])
+    assert np.isclose(sip["final_value"][0], 1161695.38, atol=0.01)
+    assert np.isclose(sip["value"][1, 59], sip_future_value(5000, 0.12, 5))
+    assert list(sip["total_invested"]) == [600000, 300000]
+
+    router = IntentRouter()
+    assert router.classify("what is the emi on a loan of 1,000,000 at 8.5% for 20 years") == (
+        "emi", ("1,000,000", "8.5", "20", "years"))
+    assert router.classify("calculate sip of $200 monthly at 8% for 15 years") == ("sip", ("$200", "8", "15"))
+    assert router.classify("what is sip")[0] == "definition"
+
+def test_message_writer():
+    import asyncio
+    from chat_persistence import MessageWriter
+
+    batches = []
+
+    def insert(records):
+        if any(record["message"] == "bad" for record in records):
+            raise ValueError("rejected")
+        batches.append(len(records))
+        return [sum(batches) - len(records) + i + 1 for i in range(len(records))]
+
+    async def run():
+        writer = MessageWriter(insert=insert, max_batch=50)
+        # Messages queued while the writer is busy are saved together
+        futures = [await writer.submit({"message": f"m{i}"}) for i in range(120)]
+        bad = await writer.submit({"message": "bad"})
+        good = await writer.submit({"message": "after"})
+        await writer.close()
+        assert [await future for future in futures] == list(range(1, 121))
+        try:
+            await bad
+            assert False, "the rejected message should fail"
+        except ValueError:
+            pass
+        assert await good == 121
+        return writer.stats()
+
+    stats = asyncio.run(run())
+    assert stats["written"] == 121 and stats["failed"] == 1 and stats["queued"] == 0
+    assert max(batches) == 50 and stats["batches"] < 121
+
+def test_chat_broker():
+    import asyncio
+    from chat_broker import ChatBroker, InMemoryChatBroker, RedisChatBroker
+
+    class Socket:
+        def __init__(self, fail=False):
+            self.received, self.fail = [], fail
+
+        async def send_json(self, payload):
+            if self.fail:
+                raise RuntimeError("closed")
+            self.received.append(payload)
+
+    class FakePubSub:
+        def __init__(self, hub):
+            self.hub, self.channels, self.queue = hub, set(), asyncio.Queue()
+
+        async def subscribe(self, channel):
+            self.channels.add(channel)
+
+        async def unsubscribe(self, channel):
+            self.channels.discard(channel)
+
+        async def get_message(self, timeout):
+            try:
+                return await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        async def aclose(self):
+            pass
+
+    class FakeRedis:
+        """Stand-in for one Redis server shared by several workers."""
+
+        def __init__(self):
+            self.subscribers = []
+
+        def pubsub(self, **kwargs):
+            self.subscribers.append(FakePubSub(self))
+            return self.subscribers[-1]
+
+        async def publish(self, channel, data):
+            receivers = [p for p in self.subscribers if channel in p.channels]
+            for p in receivers:
+                p.queue.put_nowait({"type": "message", "channel": channel.encode(), "data": data})
+            return len(receivers)
+
+        async def pubsub_numsub(self, channel):
+            return [(channel.encode(), sum(channel in p.channels for p in self.subscribers))]
+
+        async def aclose(self):
+            pass
+
+    async def run():
+        broker = InMemoryChatBroker()
+        alice = Socket()
+        await broker.connect(1, alice)
+        assert await broker.publish(1, {"message": "hi"}) == 1 and alice.received == [{"message": "hi"}]
+        assert await broker.publish(2, {"message": "hi"}) == 0
+        await broker.connect(2, Socket(fail=True))
+        assert await broker.publish(2, {"message": "hi"}) == 0 and not await broker.is_online(2)
+        try:
+            ChatBroker()
+            raise AssertionError("ChatBroker is abstract")
+        except TypeError:
+            pass
+
+        # Two workers sharing one Redis: a message reaches a user connected to the other worker
+        redis = FakeRedis()
+        worker_a, worker_b = RedisChatBroker("", client=redis), RedisChatBroker("", client=redis)
+        bob = Socket()
+        await worker_b.connect(7, bob)
+        assert await worker_a.is_online(7) and not await worker_a.is_online(8)
+        assert await worker_a.publish(7, {"sender_id": 1, "message": "hello"}) == 1
+        for _ in range(20):
+            if bob.received:
+                break
+            await asyncio.sleep(0.01)
+        assert bob.received == [{"sender_id": 1, "message": "hello"}]
+        await worker_b.disconnect(7, bob)
+        assert await worker_a.publish(7, {"message": "gone"}) == 0
+
+        # One slow socket does not hold up the others on its worker, and a failed send falls back to a push
+        class SlowSocket(Socket):
+            async def send_json(self, payload):
+                await asyncio.sleep(10)
+
+        undelivered = []
+        worker_b.on_undelivered = lambda user_id, payload: undelivered.append((user_id, payload["message"]))
+        carol = Socket()
+        await worker_b.connect(8, SlowSocket())
+        await worker_b.connect(9, carol)
+        await worker_b.connect(10, Socket(fail=True))
+        assert await worker_a.publish(8, {"sender_id": 1, "message": "slow"}) == 1
+        assert await worker_a.publish(9, {"sender_id": 1, "message": "quick"}) == 1
+        assert await worker_a.publish(10, {"sender_id": 1, "message": "lost"}) == 1
+        for _ in range(50):
+            if carol.received and undelivered:
+                break
+            await asyncio.sleep(0.01)
+        assert carol.received == [{"sender_id": 1, "message": "quick"}]
+        assert undelivered == [(10, "lost")]
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(run())
+
+def test_notification_outbox():
+    import asyncio
+    import time
+    from notification_outbox import NotificationOutbox
+
+    sent, failures = [], {"flaky": 1}
+
+    class Unregistered(Exception):
+        retryable = False
+
+    def send(receiver_id, sender_id, message, count):
+        time.sleep(0.05)  # a slow push service
+        if message in failures and failures[message] > 0:
+            failures[message] -= 1
+            raise ConnectionError("timeout")
+        if message == "dead token":
+            raise Unregistered()
+        sent.append((receiver_id, sender_id, message, count))
+
+    async def run():
+        outbox = NotificationOutbox(send, concurrency=2, coalesce_seconds=0.05, retry_seconds=0.01)
+        started = time.perf_counter()
+        for i in range(3):
+            outbox.notify(1, 2, f"m{i}")
+        outbox.notify(1, 3, "other sender")
+        outbox.notify(4, 2, "flaky")
+        outbox.notify(5, 2, "dead token")
+        # notify() only records the push; the sender is not held up by the slow send
+        assert time.perf_counter() - started < 0.01
+        for _ in range(100):
+            if len(sent) == 3 and outbox.stats()["failed"] == 1:
+                break
+            await asyncio.sleep(0.02)
+        await outbox.close()
+        return outbox.stats()
+
+    stats = asyncio.run(run())
+    assert sorted(sent) == [(1, 2, "m2", 3), (1, 3, "other sender", 1), (4, 2, "flaky", 1)]
+    assert stats["coalesced"] == 2 and stats["retried"] == 1 and stats["failed"] == 1
+
+def test_chat_history_cursor():
+    from datetime import datetime, timezone
+    from chat_history import conversation_key, decode_cursor, encode_cursor
+
+    assert conversation_key(12, 3) == conversation_key(3, 12) == "3:12"
+    timestamp = datetime(2026, 3, 1, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(timestamp, 42)
+    # URL-safe, so it can be passed as a query parameter as is
+    assert "+" not in cursor and "/" not in cursor and "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, 42)
+    for bad in ("", "not a cursor", encode_cursor(timestamp, 1)[:-3]):
+        try:
+            decode_cursor(bad)
+            assert False, f"{bad!r} should be rejected"
+        except ValueError:
+            pass
+
+def test_conversation_updates():
+    from datetime import datetime, timedelta
+    from chat_history import conversation_updates
+
+    start = datetime(2026, 3, 1)
+    records = [
+        {"sender_id": 2, "receiver_id": 1, "message": "hi", "timestamp": start},
+        {"sender_id": 2, "receiver_id": 1, "message": "are you there?", "timestamp": start + timedelta(seconds=5)},
+        {"sender_id": 1, "receiver_id": 3, "message": "x" * 500, "timestamp": start + timedelta(seconds=1)},
+        # Saved late, but older than the batch's last message from user 2
+        {"sender_id": 2, "receiver_id": 1, "message": "old", "timestamp": start - timedelta(seconds=1)},
+    ]
+    rows = {(row["user_id"], row["counterpart_id"]): row for row in conversation_updates(records, [10, 11, 12, 13])}
+    assert list(rows) == sorted(rows) == [(1, 2), (1, 3), (2, 1), (3, 1)]
+    assert rows[(1, 2)]["unread_count"] == 3 and rows[(2, 1)]["unread_count"] == 0
+    assert rows[(1, 2)]["last_message"] == rows[(2, 1)]["last_message"] == "are you there?"
+    assert rows[(1, 2)]["last_message_id"] == 11 and rows[(1, 2)]["last_sender_id"] == 2
+    assert rows[(3, 1)]["unread_count"] == 1 and len(rows[(3, 1)]["last_message"]) == 200
+
+def test_stream_reports_failures():
+    from simple_chatbot import AdvancedFinancialChatbot, SectionStream
+
+    def sections():
+        yield "Home buying analysis:"
+        raise KeyError("mortgage_balance")
+
+    import threading
+    # Only the streaming wrapper is under test, so skip building the models
+    bot = AdvancedFinancialChatbot.__new__(AdvancedFinancialChatbot)
+    bot.profiling = False
+    bot._pinned, bot._knowledge = threading.local(), None
+    bot._ensure_knowledge_watcher = lambda: None
+    bot._cached_response = lambda message, client_id, profile: SectionStream(sections())
+    chunks = bot.generate_response_stream("home buying", 1, {})
+    assert next(chunks) == "Home buying analysis:"
+    # The stream must not end as if the answer were complete
+    try:
+        next(chunks)
+        assert False, "the failed section should be raised"
+    except KeyError:
+        pass
+
+def test_chatbot_service_limits():
+    import asyncio
+    import functools
+    import threading
+    from chatbot_service import ChatbotBusy, ChatbotInputError, ChatbotService
+
+    release = threading.Event()
+
+    class StubChatbot:
+        def slow(self):
+            release.wait(5)
+            return "slow answer"
+
+        def answer(self, message):
+            if not message:
+                raise ChatbotInputError("message is empty")
+            return message.upper()
+
+        def sections(self, message):
+            yield from message.split()
+
+    async def run():
+        service = ChatbotService(StubChatbot, retry_after=7, workers=1, max_pending=2, timeout=0.2)
+        service.preload()
+        assert await service.call("answer", "sip") == "SIP"
+        assert [chunk async for chunk in service.stream("sections", "a b c")] == ["a", "b", "c"]
+
+        # Both slots taken: the next call is refused at once with the Retry-After hint
+        first = asyncio.ensure_future(service.call("slow"))
+        second = asyncio.ensure_future(service.call("slow"))
+        await asyncio.sleep(0.05)
+        try:
+            await service.call("answer", "sip")
+            assert False, "a full pool should refuse the call"
+        except ChatbotBusy as e:
+            assert e.retry_after == 7 and e.pending == 2
+
+        for task in (first, second):
+            try:
+                await task
+                assert False, "the slow call should time out"
+            except asyncio.TimeoutError:
+                pass
+        # The queued call was cancelled, but the running one keeps its slot until the pool has finished it
+        assert service.status()["pending"] == 1
+        release.set()
+        for _ in range(50):
+            if service.status()["pending"] == 0:
+                break
+            await asyncio.sleep(0.02)
+        assert service.status()["pending"] == 0
+
+        # Exceptions release the slot too, and input errors keep their own type (400, not 500)
+        try:
+            await service.call("answer", "")
+            assert False, "an empty message should be rejected"
+        except ChatbotInputError:
+            pass
+        try:
+            await service.call("missing_method")
+            assert False, "an unknown method should fail"
+        except AttributeError:
+            pass
+        assert service.status()["pending"] == 0
+
+        # Process mode: calls and streams are dispatched to the worker processes' own chatbots
+        processes = ChatbotService(functools.partial(dict, answer=42), execution="process", workers=1, timeout=30)
+        processes._warm()
+        try:
+            assert processes.state == ChatbotService.READY and processes.get() is None
+            assert await processes.call("get", "answer") == 42
+            assert [key async for key in processes.stream("keys")] == ["answer"]
+            assert processes.status()["pending"] == 0
+        finally:
+            processes._executor.shutdown()
+
+    asyncio.run(run())
+
+def test_chat_history_paging():
+    from datetime import datetime, timedelta
+    from sqlalchemy import Column, DateTime, Integer, String, create_engine
+    from sqlalchemy.orm import declarative_base, sessionmaker
+    from chat_history import SYNC_GRACE_SECONDS, decode_cursor, keyset_page, sync_cursor
+
+    # Same columns as models.Message, on SQLite
+    Base = declarative_base()
+
+    class Message(Base):
+        __tablename__ = "messages"
+        id = Column(Integer, primary_key=True)
+        conversation_key = Column(String(64))
+        message = Column(String)
+        timestamp = Column(DateTime)
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    start = datetime(2026, 3, 1)
+    # Two messages per second, so pages also have to order by id within a timestamp
+    db.add_all([Message(conversation_key="1:2", message=f"m{i}", timestamp=start + timedelta(seconds=i // 2))
+                for i in range(25)] + [Message(conversation_key="1:3", message="other", timestamp=start)])
+    db.commit()
+    query = db.query(Message).filter(Message.conversation_key == "1:2")
+
+    def page(**cursors):
+        rows, next_cursor = keyset_page(query, Message.timestamp, Message.id, 10, **cursors)
+        return [row.message for row in rows], next_cursor
+
+    # Latest page first, then back through older pages until there are no more
+    latest, older = page()
+    assert latest == [f"m{i}" for i in range(24, 14, -1)] and older
+    seen = latest
+    while older:
+        messages, older = page(before=older)
+        seen += messages
+    assert seen == [f"m{i}" for i in range(24, -1, -1)]
+
+    # after: oldest first, paging forward; the last page has no next cursor
+    messages, newer = page(after=sync_cursor((start, 0), start + timedelta(hours=1)))
+    assert messages == [f"m{i}" for i in range(10)] and newer
+    assert page(after=newer)[0] == [f"m{i}" for i in range(10, 20)]
+    last = db.query(Message).filter(Message.message == "m24").one()
+    assert page(after=sync_cursor((last.timestamp, last.id), start + timedelta(hours=1))) == ([], None)
+    for bad in ({"before": "x", "after": "y"}, {"after": "not a cursor"}):
+        try:
+            page(**bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+
+    # The sync cursor never passes the grace window, so a message that commits late is synced next time
+    now = last.timestamp + timedelta(seconds=1)
+    assert decode_cursor(sync_cursor((last.timestamp, last.id), now)) == (now - timedelta(seconds=SYNC_GRACE_SECONDS), 0)
+    late = Message(conversation_key="1:2", message="late", timestamp=last.timestamp - timedelta(seconds=2))
+    db.add(late)
+    db.commit()
+    assert "late" in page(after=sync_cursor((last.timestamp, last.id), now))[0]
+    # Settled messages move the cursor to themselves; an empty sync keeps its cursor
+    old = (start, 3)
+    assert decode_cursor(sync_cursor(old, now)) == old
+    assert decode_cursor(sync_cursor(None, now, after=sync_cursor(old, now))) == old
+
+def test_context_store():
+    import threading
+    import types
+    import context_store
+    from context_store import ContextStore, InMemoryContextStore
+
+    clock = [1000.0]
+    real_time = context_store.time
+    context_store.time = types.SimpleNamespace(monotonic=lambda: clock[0])
+    try:
+        # TTL: a value expires ttl_seconds after it was last set
+        store = InMemoryContextStore(ttl_seconds=60)
+        store.set("context", 1, {"risk_profile": "low"})
+        clock[0] += 59
+        assert store.get("context", 1) == {"risk_profile": "low"}
+        clock[0] += 1
+        assert store.get("context", 1) is None and store.stats()["expirations"] == 1
+
+        # LRU: reading a value makes it the most recently used
+        store = InMemoryContextStore(max_entries=2)
+        store.set("context", 1, "a")
+        store.set("context", 2, "b")
+        store.get("context", 1)
+        store.set("context", 3, "c")
+        assert store.get("context", 2) is None
+        assert store.get("context", 1) == "a" and store.get("context", 3) == "c"
+        assert store.stats()["evictions"] == 1
+
+        # Memory cap: the least recently used values go until the rest fits
+        store = InMemoryContextStore(max_bytes=250)
+        for key in range(3):
+            store.set("history", key, "x" * 100)
+        assert store.get("history", 0) is None and store.get("history", 2) is not None
+        assert store.stats()["entries"] == 2 and store.stats()["bytes"] == 204
+        store.set("history", 3, "x" * 300)
+        assert store.stats()["entries"] == 0 and store.stats()["bytes"] == 0
+    finally:
+        context_store.time = real_time
+
+    # Concurrent updates of one key all land, unlike get() then set()
+    store = InMemoryContextStore()
+    threads = [threading.Thread(target=lambda: [store.update("history", 1, lambda h: (h or []) + [0]) for _ in range(100)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.get("history", 1)) == 800
+
+    try:
+        ContextStore()
+        raise AssertionError("ContextStore is abstract")
+    except TypeError:
+        pass
+
+def test_chatbot_service_warmup():
+    import threading
+    import time
+    from chatbot_service import ChatbotNotReady, ChatbotService
+
+    gate, builds = threading.Event(), []
+
+    def factory():
+        builds.append(len(builds))
+        gate.wait(5)
+        if len(builds) == 1:
+            raise RuntimeError("model missing")
+        return "chatbot"
+
+    def wait_for_state(service, state):
+        deadline = time.monotonic() + 5
+        while service.state != state and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.state == state
+
+    def not_ready(service):
+        try:
+            service.get()
+        except ChatbotNotReady as e:
+            return e
+        raise AssertionError("chatbot should not be ready")
+
+    service = ChatbotService(factory, retry_after=30, workers=1)
+    assert service.state == ChatbotService.NOT_STARTED
+
+    # The first request starts the warm-up and is told when to retry (503 + Retry-After)
+    e = not_ready(service)
+    assert (e.state, e.retry_after) == (ChatbotService.WARMING, 30)
+    # Starting again while warming does not build a second chatbot
+    service.start_warmup()
+    service.start_warmup()
+    not_ready(service)
+    gate.set()
+    wait_for_state(service, ChatbotService.FAILED)
+    assert builds == [0] and service.error == "model missing"
+
+    # A failed warm-up is not retried before retry_after has passed...
+    assert not_ready(service).state == ChatbotService.FAILED
+    assert builds == [0]
+    # ...and is retried by the next request afterwards
+    gate.clear()
+    service._failed_at -= 30
+    assert not_ready(service).state == ChatbotService.WARMING
+    gate.set()
+    wait_for_state(service, ChatbotService.READY)
+    assert service.get() == "chatbot" and service.error is None
+    assert builds == [0, 1]
+
+    # Once ready, warm-up is a no-op
+    service.start_warmup()
+    assert service.state == ChatbotService.READY and builds == [0, 1]
+
+def test_chatbot_batch():
+    import asyncio
+    import threading
+    import types
+    from chatbot_service import MAX_BATCH_SIZE, ChatbotBatchTooLarge, ChatbotInputError, ChatbotService
+    from simple_chatbot import BATCH_ERROR_RESPONSE, AdvancedFinancialChatbot
+
+    # The real batch path with the NLP stages stubbed out
+    bot = AdvancedFinancialChatbot.__new__(AdvancedFinancialChatbot)
+    bot.profiling, bot.retrieval = False, "tfidf"
+    searched = []
+    index = types.SimpleNamespace(search_batch=lambda queries, k: searched.extend(queries) or [[] for _ in queries])
+    bot._pinned, bot._knowledge = threading.local(), types.SimpleNamespace(kb_index=index)
+    bot._ensure_knowledge_watcher = lambda: None
+    bot._cached_response = lambda message, client_id, profile: f"cached {message}" if message.startswith("faq") else None
+    bot._analyze_many = lambda messages: list(messages)
+    bot._prefetch_market_data = lambda analyses: None
+    bot._kb_query = lambda analysis: analysis
+
+    def respond(analysis, client_id, kb_match, profile):
+        if analysis == "boom":
+            raise KeyError("net_worth")
+        return f"{analysis} for {client_id}"
+
+    bot._respond = respond
+
+    service = ChatbotService(lambda: bot, workers=2, timeout=5, max_batch=5)
+    assert ChatbotService(lambda: bot).max_batch == MAX_BATCH_SIZE == 100
+    service.preload()
+
+    async def run():
+        # Cache hits and parsed messages are answered in request order, and a failing one does not sink the rest
+        responses = await service.generate_responses(["budget", "faq sip", "boom", "savings"], [1, 2, 3, 4])
+        assert responses == ["budget for 1", "cached faq sip", BATCH_ERROR_RESPONSE, "savings for 4"]
+        assert searched == ["budget", "boom", "savings"]
+
+        # Oversized (413) and mismatched (400) batches are refused before taking a pool slot
+        try:
+            await service.generate_responses(["budget"] * 6, [1] * 6)
+            raise AssertionError("batch should be too large")
+        except ChatbotBatchTooLarge as e:
+            assert (e.size, e.max_batch) == (6, 5)
+        try:
+            service.check_batch(["budget", "savings"], [1])
+            raise AssertionError("lengths should be checked")
+        except ChatbotInputError:
+            pass
+        assert service.status()["pending"] == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        service._executor.shutdown()
+
+def test_knowledge_hot_swap():
+    import json
+    import os
+    import tempfile
+    import threading
+    from response_cache import CachedResponse, ResponseCache
+    from simple_chatbot import AdvancedFinancialChatbot, builtin_knowledge
+
+    # Real snapshots, reloads and response cache; only the NLP stages are stubbed
+    bot = AdvancedFinancialChatbot.__new__(AdvancedFinancialChatbot)
+    bot.nlp, bot.embedding_encoder, bot.profiling = None, None, False
+    bot._tokenize = lambda text: text.lower().replace("?", "").split()
+    bot._tokenize_many = lambda texts: [bot._tokenize(text) for text in texts]
+    bot._apply_context = lambda *args: None
+    bot._record_intent = lambda *args: None
+    bot._pinned, bot._knowledge_lock, bot._reload_lock = threading.local(), threading.Lock(), threading.Lock()
+    bot._knowledge_versions, bot._knowledge_signature, bot._knowledge_error = 0, None, None
+    bot.response_cache = ResponseCache()
+    bot._knowledge = bot._build_knowledge(builtin_knowledge())
+
+    def answer():
+        return bot.kb_index.search("what is sip", k=1)[0][1]
+
+    with tempfile.TemporaryDirectory() as directory:
+        bot.knowledge_path = os.path.join(directory, "kb.json")
+
+        def publish(version, sip_answer):
+            with open(bot.knowledge_path, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "knowledge_base": {"what is sip": sip_answer}}, f)
+
+        publish("v1", "SIP, first edition.")
+        assert bot.reload_knowledge() and answer() == "SIP, first edition."
+        first = bot.knowledge.version
+
+        with bot._pin_knowledge():
+            assert bot.knowledge.version == first
+            bot.response_cache.put(bot._response_cache_key("what is sip", None), bot.knowledge.version,
+                                   CachedResponse("SIP, first edition.", False, None, None))
+            # The watcher installs the next snapshot while this request is in flight
+            publish("v2", "SIP, second edition with more detail.")
+            reloaded = []
+            watcher = threading.Thread(target=lambda: reloaded.append(bot.reload_knowledge()))
+            watcher.start()
+            watcher.join()
+            assert reloaded == [True] and bot._knowledge.version == first + 1
+            # ...and the request still finishes on the snapshot it started with
+            assert bot.knowledge.version == first and answer() == "SIP, first edition."
+            assert bot._cached_response("what is sip", None) == "SIP, first edition."
+
+        # The next request sees the new knowledge, and the old KB's cached answer is not served
+        assert bot.knowledge.version == first + 1
+        assert bot._cached_response("what is sip", None) is None
+        assert answer() == "SIP, second edition with more detail."
+        assert bot.knowledge_stats()["version"] == "v2"
+
+        # Unchanged or broken files keep the current snapshot
+        assert not bot.reload_knowledge()
+        with open(bot.knowledge_path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        assert not bot.reload_knowledge() and bot._knowledge_error
+        assert bot.knowledge.version == first + 1 and answer() == "SIP, second edition with more detail."
+
+def test_chatbot_artifact_round_trip():
+    import os
+    import tempfile
+    import types
+    from chatbot_artifact import kb_fingerprint, load_artifact, write_artifact
+    from kb_index import KnowledgeBaseIndex
+
+    def tokenizer(text):
+        return text.lower().replace("?", "").split()
+
+    kb = {
+        "What is a mutual fund?": "A pooled investment.",
+        "What is an index fund?": "A fund tracking an index.",
+        "How do I start a SIP?": "Pick a fund and an amount.",
+        "What is inflation?": "Rising prices.",
+    }
+    terms = {"sip": "Systematic Investment Plan"}
+    # Everything write_artifact reads from a chatbot, without spaCy
+    chatbot = types.SimpleNamespace(
+        kb_index=KnowledgeBaseIndex(kb, tokenizer=tokenizer),
+        nlp=None,
+        financial_terms=terms,
+        stop_words={"the", "a"},
+        matcher_patterns=lambda: [["sip"]],
+    )
+    fingerprint = kb_fingerprint(kb, terms, None)
+
+    with tempfile.TemporaryDirectory() as root:
+        path = write_artifact(root, chatbot, fingerprint)
+        with open(os.path.join(root, "CURRENT")) as f:
+            assert os.path.join(root, f.read()) == path
+
+        artifact = load_artifact(root, fingerprint)
+        assert artifact.path == path and artifact.fingerprint == fingerprint
+        assert artifact.manifest["kb_size"] == 4 and artifact.financial_terms == terms
+        assert artifact.stop_words == ["a", "the"] and artifact.matcher_patterns == [["sip"]]
+
+        # The restored index answers exactly like a freshly fitted one
+        restored = KnowledgeBaseIndex.from_arrays(tokenizer=tokenizer, **artifact.kb_export)
+        fresh = KnowledgeBaseIndex(kb, tokenizer=tokenizer)
+        queries = ["what is a fund", "index fund", "start sip", "inflation", "unrelated words"]
+        assert restored.search_batch(queries, k=3) == fresh.search_batch(queries, k=3)
+
+        # An artifact built from another KB is stale
+        assert load_artifact(root, kb_fingerprint({**kb, "What is a bond?": "A loan."}, terms, None)) is None
+        assert load_artifact(root, kb_fingerprint(kb, terms, "en_core_web_sm-3.8.0")) is None
+
+        # A new build moves CURRENT to its own version directory
+        other = kb_fingerprint(kb, {}, None)
+        assert write_artifact(root, chatbot, other) != path
+        assert load_artifact(root).fingerprint == other and load_artifact(root, fingerprint) is None
+
+    assert load_artifact(root) is None
+
+def test_calculator_endpoints():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from calculator_router import MAX_CALCULATOR_SCENARIOS, calculator_router
+
+    app = FastAPI()
+    app.include_router(calculator_router)
+    client = TestClient(app)
+
+    # Every rate is combined with every tenor, rates first
+    response = client.post("/calculator/future-value", json={"amount": 1000, "annual_rates": [5, 10], "years": [1, 2, 3]})
+    assert response.status_code == 200
+    scenarios = response.json()["scenarios"]
+    assert [(s["annual_rate"], s["years"]) for s in scenarios] == [(5, 1), (5, 2), (5, 3), (10, 1), (10, 2), (10, 3)]
+    assert scenarios[4]["future_value"] == 1210.0
+
+    # A single rate may be sent as a number
+    response = client.post("/calculator/present-value", json={"amount": 1210, "annual_rates": 10, "years": [2]})
+    assert response.json()["scenarios"] == [{"annual_rate": 10, "years": 2, "present_value": 1000.0}]
+
+    # More than MAX_CALCULATOR_SCENARIOS combinations are rejected
+    rates = list(range(1, 12))
+    assert len(rates) * 10 > MAX_CALCULATOR_SCENARIOS
+    for path, body in [
+        ("/calculator/future-value", {"amount": 1000, "annual_rates": rates, "years": list(range(1, 11))}),
+        ("/calculator/present-value", {"amount": 1000, "annual_rates": rates, "years": list(range(1, 11))}),
+        ("/calculator/emi", {"principal": 1000, "annual_rates": rates, "tenure_months": list(range(1, 11))}),
+        ("/calculator/sip", {"monthly_investment": 100, "annual_rates": rates, "years": list(range(1, 11))}),
+    ]:
+        response = client.post(path, json=body)
+        assert response.status_code == 400 and str(MAX_CALCULATOR_SCENARIOS) in response.json()["detail"]
+
+    # Each schedule is cut to its own tenure, though scenarios are computed together
+    response = client.post("/calculator/emi", json={"principal": 100000, "annual_rates": [12], "tenure_months": [12, 24]})
+    short, long = response.json()["scenarios"]
+    assert short["emi"] == 8884.88
+    assert [len(s["schedule"]["balance"]) for s in (short, long)] == [12, 24]
+    assert short["schedule"]["month"] == list(range(1, 13))
+    assert abs(short["schedule"]["balance"][-1]) < 0.01 and abs(long["schedule"]["balance"][-1]) < 0.01
+    assert abs(sum(long["schedule"]["principal"]) - 100000) < 0.1
+
+    response = client.post("/calculator/sip", json={"monthly_investment": 1000, "annual_rates": [0, 12], "years": [1, 2]})
+    scenarios = response.json()["scenarios"]
+    assert [len(s["schedule"]["value"]) for s in scenarios] == [12, 24, 12, 24]
+    assert scenarios[1]["total_invested"] == 24000 and scenarios[1]["final_value"] == 24000
+    assert scenarios[3]["schedule"]["invested"][-1] == 24000 and scenarios[3]["returns"] > 0
+
+    response = client.post("/calculator/emi", json={"principal": 1000, "annual_rates": [12], "tenure_months": [6],
+                                                    "include_schedule": False})
+    assert "schedule" not in response.json()["scenarios"][0]
+
 if __name__ == "__main__":
     test_mutual_fund_response()
+    test_knowledge_base_index()
+    test_market_data_cache()
+    test_market_data_coalescing()
+    test_intent_router()
+    test_term_index()
+    test_fuzzy_lookup()
+    test_response_cache()
+    test_profile_cache()
+    test_context_store()
+    test_section_stream()
+    test_stream_reports_failures()
+    test_benchmark_compare()
+    test_kb_loader()
+    test_stage_profiling()
+    test_embedding_index()
+    test_financial_calculator()
+    test_message_writer()
+    test_chat_broker()
+    test_notification_outbox()
+    test_chat_history_cursor()
+    test_chat_history_paging()
+    test_conversation_updates()
+    test_chatbot_service_limits()
+    test_chatbot_service_warmup()
+    test_chatbot_batch()
+    test_knowledge_hot_swap()
+    test_chatbot_artifact_round_trip()
+    test_calculator_endpoints()
\ No newline at end of file
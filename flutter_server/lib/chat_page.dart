@@ -66,6 +66,15 @@ class _ChatPageState extends State<ChatPage> {
         (event) {
           try {
             final data = jsonDecode(event);
+            if (data['type'] == 'ack') {
+              // Only failures are sent to us, for messages we could not save
+              if (data['status'] == 'failed' && mounted) {
+                ScaffoldMessenger.of(context).showSnackBar(
+                  SnackBar(content: Text('Message not sent: ${data['message'] ?? ''}')),
+                );
+              }
+              return;
+            }
             setState(() {
               _messages.add({
                 'sender_id': data['sender_id'],